@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+
+# Fleet-wide IP address audit (`addresses audit`): gathers /ip/address from every router in
+# a list, or from an inventory database, and reports IPs configured more than once,
+# subnets that overlap, and routers on one segment that disagree on its prefix length.
+# Addresses are turned into NumPy arrays of integer starts and ends and every check is a
+# sort followed by a sweep or binary search over them, rather than comparing every pair
+# with ipaddress, so tens of thousands of interfaces take milliseconds.
+#
+#   mikrotikautomation addresses audit --list routers.txt -u admin
+#   mikrotikautomation addresses audit --database inventory.db --json
+
+import argparse
+import getpass
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import collector
+import latencyhistory
+import routerlist
+import sshsession
+
+# Flags of addresses that take no part: disabled and invalid
+INACTIVE_FLAGS = ("X", "I")
+
+
+def gather_router(router_ip, username, password, transport="ssh", api_port=None, ssh_port=sshsession.DEFAULT_PORT):
+    # ([(router, interface, address, flags)], error) for one router
+    session = None
+    try:
+        session = collector.connect(transport, router_ip, username, password, api_port, ssh_port)
+        stream, records = collector.fetch(session, "addresses")
+        rows = [(router_ip, entry.interface, entry.address, entry.flags) for entry in records]
+        if stream.err:
+            raise RuntimeError(stream.err)
+        return rows, ""
+    except Exception as ex:
+        return [], str(ex) or type(ex).__name__
+    finally:
+        collector.close(session, router_ip)
+
+
+def gather(routers, username, password, transport="ssh", workers=16, api_port=None, ssh_port=sshsession.DEFAULT_PORT):
+    # Addresses from every router, read in parallel; routers that fail are listed and skipped
+    addresses = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(routers) or 1))) as executor:
+        results = executor.map(lambda router_ip: gather_router(router_ip, username, password, transport, api_port, ssh_port), routers)
+        for router_ip, (rows, error) in zip(routers, results):
+            if error:
+                print(f"  FAILED {router_ip}: {error}")
+            addresses += rows
+    return addresses
+
+
+def load_database(path):
+    # Addresses from the last inventory collection
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return connection.execute("SELECT router, interface, address, flags FROM addresses").fetchall()
+    finally:
+        connection.close()
+
+
+def parse_address(address):
+    # "10.0.0.1/24" -> (ip as int, prefix), None for anything that isn't IPv4 with a prefix
+    ip, _, prefix = address.partition("/")
+    try:
+        prefix = int(prefix) if prefix else 32
+        if not 0 <= prefix <= 32:
+            return None
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"), prefix
+    except (OSError, ValueError):
+        return None
+
+
+def format_ip(value):
+    return socket.inet_ntoa(int(value).to_bytes(4, "big"))
+
+
+def audit(addresses):
+    # Find duplicate IPs, mismatched prefixes on a shared segment and other overlapping
+    # subnets among (router, interface, address, flags) tuples
+    import numpy as np
+
+    active = []
+    parsed = []
+    for row in addresses:
+        flags = row[3]
+        if flags and any(flag in flags for flag in INACTIVE_FLAGS):
+            continue
+        value = parse_address(row[2])
+        if value is not None:
+            active.append(row)
+            parsed.append(value)
+    report = {"addresses": len(active), "routers": len({row[0] for row in active}),
+              "duplicates": [], "mismatched_prefixes": [], "overlaps": []}
+    if not active:
+        return report
+
+    def interfaces(rows):
+        return [{"router": active[row][0], "interface": active[row][1], "address": active[row][2]} for row in rows]
+
+    ips, prefixes = (np.array(column, dtype=np.int64) for column in zip(*parsed))
+    sizes = np.left_shift(1, 32 - prefixes)
+    starts = ips - ips % sizes
+
+    # Duplicates: equal neighbours once sorted by IP
+    order = np.argsort(ips, kind="stable")
+    sorted_ips = ips[order]
+    same = sorted_ips[1:] == sorted_ips[:-1]
+    duplicated = np.zeros(len(ips), dtype=bool)
+    duplicated[1:] |= same
+    duplicated[:-1] |= same
+    for ip, rows in itertools.groupby(order[duplicated], key=lambda row: ips[row]):
+        report["duplicates"].append({"ip": format_ip(ip), "interfaces": interfaces(rows)})
+
+    # Subnets: one block per distinct (start, prefix). The keys sort by start and, for the
+    # same start, by shorter prefix first, i.e. larger block first, which is the order the
+    # sweep needs. Addresses sharing a block are on one segment and are fine.
+    keys = (starts << 6) | prefixes
+    block_keys, block_of = np.unique(keys, return_inverse=True)
+    block_of = block_of.reshape(-1)
+    block_starts = block_keys >> 6
+    block_prefixes = block_keys & 63
+    block_ends = block_starts + np.left_shift(1, 32 - block_prefixes) - 1
+
+    # CIDR blocks either nest or are disjoint, so a block overlaps an earlier one exactly
+    # when it starts before the furthest end seen so far
+    furthest_end = np.maximum.accumulate(block_ends)
+    nested = np.zeros(len(block_keys), dtype=bool)
+    nested[1:] = block_starts[1:] <= furthest_end[:-1]
+
+    # Every block a nested block lies in: its start masked to each shorter prefix, looked
+    # up among the block keys
+    nested_blocks = np.flatnonzero(nested)
+    inner = []
+    outer = []
+    for prefix in range(32):
+        candidates = nested_blocks[block_prefixes[nested_blocks] > prefix]
+        if not len(candidates):
+            continue
+        size = 1 << (32 - prefix)
+        wanted = ((block_starts[candidates] // size * size) << 6) | prefix
+        positions = np.minimum(np.searchsorted(block_keys, wanted), len(block_keys) - 1)
+        found = block_keys[positions] == wanted
+        inner.append(candidates[found])
+        outer.append(positions[found])
+    if not inner:
+        return report
+    pair_order = np.lexsort((np.concatenate(outer), np.concatenate(inner)))
+    inner = np.concatenate(inner)[pair_order]
+    outer = np.concatenate(outer)[pair_order]
+
+    # Addresses sorted by (block, IP): a block's IPs in a range are one binary search away.
+    # If the outer block has an address inside the inner block, both sides think they are
+    # on the same link with different prefixes; otherwise the subnets just overlap.
+    address_keys = (block_of.astype(np.int64) << 32) | ips
+    address_order = np.argsort(address_keys, kind="stable")
+    address_keys = address_keys[address_order]
+    low = np.searchsorted(address_keys, (outer << 32) | block_starts[inner], "left")
+    high = np.searchsorted(address_keys, (outer << 32) | block_ends[inner], "right")
+    shared = high > low
+
+    block_rows = np.searchsorted(address_keys >> 32, np.arange(len(block_keys) + 1))
+
+    def block_interfaces(block):
+        return interfaces(address_order[block_rows[block]:block_rows[block + 1]])
+
+    def subnet(block):
+        return f"{format_ip(block_starts[block])}/{block_prefixes[block]}"
+
+    for inner_block, outer_block in zip(inner[shared], outer[shared]):
+        report["mismatched_prefixes"].append({
+            "subnet": subnet(inner_block),
+            "within": subnet(outer_block),
+            "interfaces": block_interfaces(inner_block) + block_interfaces(outer_block),
+        })
+    # Overlaps are grouped by the enclosing subnet, since one wrongly sized subnet can
+    # swallow thousands of others
+    overlapping = np.argsort(outer[~shared], kind="stable")
+    for outer_block, blocks in itertools.groupby(zip(outer[~shared][overlapping], inner[~shared][overlapping]), key=lambda pair: pair[0]):
+        report["overlaps"].append({
+            "subnet": subnet(outer_block),
+            "interfaces": block_interfaces(outer_block),
+            "contains": [{"subnet": subnet(block), "interfaces": block_interfaces(block)} for _, block in blocks],
+        })
+    return report
+
+
+def print_report(report, elapsed, shown=5):
+    def describe(interfaces):
+        return ", ".join(f"{entry['router']} {entry['interface']} ({entry['address']})" for entry in interfaces)
+
+    print(f"Duplicate IPs: {len(report['duplicates'])}")
+    for finding in report["duplicates"]:
+        print(f"  {finding['ip']}: {describe(finding['interfaces'])}")
+    print(f"Mismatched prefixes on a shared segment: {len(report['mismatched_prefixes'])}")
+    for finding in report["mismatched_prefixes"]:
+        print(f"  {finding['subnet']} in {finding['within']}: {describe(finding['interfaces'])}")
+    print(f"Subnets containing other subnets: {len(report['overlaps'])}")
+    for finding in report["overlaps"]:
+        print(f"  {finding['subnet']} on {describe(finding['interfaces'])} contains {len(finding['contains'])}:")
+        for inner in finding["contains"][:shown]:
+            print(f"    {inner['subnet']}: {describe(inner['interfaces'])}")
+        if len(finding["contains"]) > shown:
+            print(f"    ... and {len(finding['contains']) - shown} more (--json lists all)")
+    print("-" * 25)
+    print(f"Audited {report['addresses']} addresses on {report['routers']} routers in {elapsed * 1000:.1f} ms")
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Finds duplicate IPs, overlapping subnets and mismatched prefixes across the IP addresses of a fleet.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--list", type=str, help="Path to a file with one router per line to read addresses from.")
+    source.add_argument("--database", type=str, help="Audit the addresses in this inventory database instead of asking the routers.")
+    parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
+    parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
+    parser.add_argument("-P", "--port", type=int, default=sshsession.DEFAULT_PORT, help=f"SSH port. Default: {sshsession.DEFAULT_PORT}")
+    collector.add_transport_argument(parser)
+    parser.add_argument("-w", "--workers", type=int, default=16, help="Routers read in parallel. Default: 16")
+    parser.add_argument("--json", action="store_true", help="Print the findings as JSON.")
+    args = parser.parse_args(argv)
+
+    if args.database:
+        if not os.path.exists(args.database):
+            print(f"No inventory database at '{args.database}'. Run 'mikrotikautomation inventory' first.", file=sys.stderr)
+            return 1
+        try:
+            addresses = load_database(args.database)
+        except sqlite3.Error as ex:
+            print(f"Could not read '{args.database}': {ex}", file=sys.stderr)
+            return 1
+    else:
+        # Interactive prompts for missing args
+        list_path = args.list or input("Router list: ").strip()
+        username = args.username or input("Username: ").strip()
+        password = args.password or getpass.getpass("Password: ").strip()
+        routers = routerlist.read_routers(list_path)
+        addresses = gather(routers, username, password, args.transport, args.workers, args.api_port, args.port)
+        latencyhistory.record_run()
+
+    started = time.perf_counter()
+    report = audit(addresses)
+    elapsed = time.perf_counter() - started
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+# Content-addressed store for router backups.
+# Every unique export is stored once under objects/ keyed by its SHA-256, and each router
+# gets an index/<identity>_<host>-<port>.json listing its versions. Export hashes ignore the
+# "# <date> by RouterOS <version>" header, so unchanged configs hash the same every night.
+# Index names are made like the backup file names: the host and port keep routers that share
+# an identity (every router is "MikroTik" out of the box) apart, and anything but letters,
+# digits, '.' and '-' is replaced. Indexes that older versions named after the identity
+# alone hand this router's versions over on its next backup.
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+# First line of every export: "# 2024-01-15 10:00:00 by RouterOS 7.13.2" (or "# jan/15/2024 ...")
+HEADER_PATTERN = re.compile(rb"^#.* by RouterOS")
+UNSAFE_NAME_CHARACTERS = re.compile(r"[^\w.-]+")
+
+
+def safe_name(identity):
+    # Identities may contain spaces, '/' and other characters that don't belong in a file
+    # name or in the unquoted file= and name= arguments on the router
+    return UNSAFE_NAME_CHARACTERS.sub("_", identity)
+
+
+class ExportHasher:
+    # Incremental SHA-256 over an export, skipping the date header on the first line
+
+    def __init__(self):
+        self.checksum = hashlib.sha256()
+        self.first_line = b""
+        self.header_done = False
+
+    def update(self, chunk):
+        if self.header_done:
+            self.checksum.update(chunk)
+            return
+        # Hold data back until the whole first line has arrived
+        self.first_line += chunk
+        if b"\n" in self.first_line:
+            self.finish_header()
+
+    def finish_header(self):
+        line, newline, rest = self.first_line.partition(b"\n")
+        if not HEADER_PATTERN.match(line):
+            self.checksum.update(line + newline)
+        self.checksum.update(rest)
+        self.first_line = b""
+        self.header_done = True
+
+    def hexdigest(self):
+        if not self.header_done:
+            self.finish_header()
+        return self.checksum.hexdigest()
+
+
+class BackupStore:
+    # objects/<2 hex>/<hash><suffix> holds the data, index/<identity>_<host>-<port>.json the version history
+
+    def __init__(self, root):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.index = os.path.join(root, "index")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.index, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def object_path(self, digest, suffix):
+        return os.path.join(self.objects, digest[:2], f"{digest}{suffix}")
+
+    def temp_file(self):
+        # Temporary file on the same filesystem so it can be renamed into place
+        handle, path = tempfile.mkstemp(dir=self.objects, suffix=".tmp")
+        os.close(handle)
+        return path
+
+    def commit(self, temp_path, digest, suffix):
+        # Move a finished temp file into the store, or drop it if the object already exists
+        path = self.object_path(digest, suffix)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path, True
+
+    def put_export(self, chunks):
+        # Store an export from an iterable of byte chunks; returns (digest, path, stored).
+        # An empty export is not stored and gives (None, None, False).
+        hasher = ExportHasher()
+        size = 0
+        temp_path = self.temp_file()
+        try:
+            with gzip.open(temp_path, "wb") as file:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        if size == 0:
+            os.remove(temp_path)
+            return None, None, False
+        digest = hasher.hexdigest()
+        path, stored = self.commit(temp_path, digest, ".rsc.gz")
+        return digest, path, stored
+
+    def put_file(self, temp_path, suffix):
+        # Store a file that was written to temp_file(); returns (digest, path, stored)
+        checksum = hashlib.sha256()
+        with open(temp_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                checksum.update(chunk)
+        digest = checksum.hexdigest()
+        path, stored = self.commit(temp_path, digest, suffix)
+        return digest, path, stored
+
+    def index_path(self, identity, router_ip, port):
+        return os.path.join(self.index, f"{safe_name(f'{identity}_{router_ip}-{port}')}.json")
+
+    def legacy_index_path(self, identity):
+        # An index older versions named after the identity alone: sanitized, raw, or before
+        # identities were read whole, its first word. None if there is no such file.
+        words = identity.split()
+        for name in (safe_name(identity), identity, words[0] if words else ""):
+            if not name or "/" in name or os.sep in name:
+                continue
+            path = os.path.join(self.index, f"{name}.json")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def versions(self, identity, router_ip, port):
+        path = self.index_path(identity, router_ip, port)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                return json.load(file)
+        # A legacy index may mix routers that share the identity; only this router's
+        # versions are taken. The file is left for the others.
+        path = self.legacy_index_path(identity)
+        if path is None:
+            return []
+        with open(path, "r") as file:
+            return [version for version in json.load(file) if version.get("router_ip") == router_ip]
+
+    def latest(self, identity, router_ip, port):
+        versions = self.versions(identity, router_ip, port)
+        return versions[-1] if versions else None
+
+    def record(self, identity, router_ip, port, export_digest, backup_digest):
+        # Append a new version, or only bump "checked" when the export is unchanged.
+        # Returns True if a new version was added.
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.lock:
+            versions = self.versions(identity, router_ip, port)
+            latest = versions[-1] if versions else None
+            if latest is not None and latest["export"] == export_digest:
+                latest["checked"] = now
+                latest["router_ip"] = router_ip
+                changed = False
+            else:
+                versions.append({
+                    "created": now,
+                    "checked": now,
+                    "router_ip": router_ip,
+                    "export": export_digest,
+                    "backup": backup_digest,
+                })
+                changed = True
+            self.write_index(identity, router_ip, port, versions)
+        return changed
+
+    def write_index(self, identity, router_ip, port, versions):
+        # Write atomically so a crash can't leave a half-written index
+        path = self.index_path(identity, router_ip, port)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(versions, file, indent=2)
+        os.replace(temp_path, path)
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+# Throughput benchmark for tableparser against the regexes the collectors used before.
+# Builds synthetic tables in both formats (terse key=value for the parser, column output
+# for the old regexes) and reports rows parsed per second for each.
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tableparser
+
+# Regexes as they appeared in getarp.py, getdhcp.py, getaddresses.py and getmap.py
+LEGACY_PATTERNS = {
+    "arp": r"^\s*?\d+\s+(?:X|DC|D)\s+(\d+\.\d+\.\d+\.\d+)\s+(?:(\w+:\w+:\w+:\w+:\w+:\w+)|\s*?)\s+(\S+)\s+(\S*)\s*?$",
+    "dhcp": r"^\s*?\d+\s+(?:[XD]\s+|)(\d+\.\d+\.\d+\.\d+)\s+([0-9A-F:]{17})\s+(\S*)\s+(\S+)\s*?$",
+    "addresses": r"^\s*?\d+\s+(?:[XD]\s+|)(\d+\.\d+\.\d+\.\d+/\d+)\s+(\d+\.\d+\.\d+\.\d+)\s+(\S+)\s*?$",
+    "neighbors": r"^\d+\s+(?P<interface>\S+)\s+(?P<ip_address>\d+\.\d+\.\d+\.\d+)\s+(?P<mac_address>[0-9A-F:]{17})\s+(?P<identity>\S+)\s*?$",
+}
+
+
+def mac(n):
+    return ":".join(f"{(n >> shift) & 0xFF:02X}" for shift in (40, 32, 24, 16, 8, 0))
+
+
+def ip(n):
+    return f"10.{(n >> 16) & 0xFF}.{(n >> 8) & 0xFF}.{n & 0xFF}"
+
+
+def synthetic_rows(table, rows):
+    # Return (terse lines, legacy column lines) for a table with the given number of rows
+    terse = []
+    legacy = []
+    for n in range(rows):
+        if table == "arp":
+            terse.append(f"{n:>4} DC address={ip(n)} mac-address={mac(n)} interface=bridge published=no status=reachable")
+            legacy.append(f"{n:>4} DC {ip(n)}  {mac(n)}  bridge  reachable")
+        elif table == "dhcp":
+            terse.append(f"{n:>4} D address={ip(n)} mac-address={mac(n)} server=dhcp1 status=bound host-name=host{n} last-seen=1m")
+            legacy.append(f"{n:>4} D {ip(n)}  {mac(n)}  host{n}  dhcp1")
+        elif table == "addresses":
+            terse.append(f"{n:>4}   address={ip(n)}/24 network={ip(n & ~0xFF)} interface=vlan{n % 4000}")
+            legacy.append(f"{n:>4}   {ip(n)}/24  {ip(n & ~0xFF)}  vlan{n % 4000}")
+        elif table == "neighbors":
+            terse.append(f"{n} interface=ether{n % 24} address={ip(n)} mac-address={mac(n)} identity=router{n} platform=MikroTik version=\"7.14 (stable)\"")
+            legacy.append(f"{n} ether{n % 24}  {ip(n)}  {mac(n)}  router{n}")
+    return terse, legacy
+
+
+def bench(function, repeat):
+    # Best wall time over several runs, plus the result of the last one
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RouterOS table parser against the legacy regexes.")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows per synthetic table. Default: 100000")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported. Default: 3")
+    parser.add_argument("--json", type=str, help="Also write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    results = []
+    for table, (command, record_type) in tableparser.TABLES.items():
+        terse, legacy = synthetic_rows(table, args.rows)
+        legacy_text = "\n".join(legacy)
+        pattern = re.compile(LEGACY_PATTERNS[table], flags=re.MULTILINE)
+
+        parser_time, records = bench(lambda: sum(1 for _ in tableparser.parse(terse, record_type)), args.repeat)
+        regex_time, matches = bench(lambda: len(pattern.findall(legacy_text)), args.repeat)
+
+        results.append({
+            "table": table,
+            "rows": args.rows,
+            "parser_seconds": parser_time,
+            "parser_rows": records,
+            "parser_rows_per_second": records / parser_time,
+            "regex_seconds": regex_time,
+            "regex_rows": matches,
+            "regex_rows_per_second": matches / regex_time if matches else 0.0,
+        })
+        print(f"{table:<10} parser {records:>8} rows {parser_time:8.3f}s {records / parser_time:>12,.0f} rows/s | "
+              f"regex {matches:>8} rows {regex_time:8.3f}s")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+# Startup-time benchmark for the mikrotikautomation entry point.
+# Runs "--help" for the top-level command and every subcommand in fresh interpreters and
+# reports the median wall time, plus which heavy modules each one ended up importing.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("paramiko", "networkx", "matplotlib")
+
+# Imports main, runs it with the given argv and reports the heavy modules that got loaded
+PROBE = """
+import json, sys
+sys.argv[0] = "mikrotikautomation"
+import main
+try:
+    main.main(sys.argv[1:])
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+
+def time_command(argv, runs):
+    # Median wall time of running main with argv in a fresh interpreter
+    code = PROBE.format(heavy=HEAVY_MODULES)
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code] + argv, cwd=ROOT, capture_output=True, text=True)
+        timings.append(time.perf_counter() - started)
+        loaded = json.loads(completed.stderr.strip().splitlines()[-1]) if completed.stderr.strip() else []
+    return statistics.median(timings), loaded
+
+
+def time_command_baseline(runs):
+    # Bare interpreter start, to separate our import cost from Python's own
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"])
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup time of the mikrotikautomation command.")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per command; the median is reported. Default: 10")
+    parser.add_argument("--json", type=str, help="Also write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import main as entry_point
+
+    baseline = time_command_baseline(args.runs)
+    print(f"{'python -c pass':<40}{baseline * 1000:8.1f} ms")
+    results = [{"command": "python -c pass", "seconds": baseline, "heavy_imports": []}]
+    for argv in [["--help"]] + [[name, "--help"] for name in entry_point.COMMANDS]:
+        median, loaded = time_command(argv, args.runs)
+        label = "mikrotikautomation " + " ".join(argv)
+        print(f"{label:<40}{median * 1000:8.1f} ms  {'loads ' + ', '.join(loaded) if loaded else ''}")
+        results.append({"command": label, "seconds": median, "heavy_imports": loaded})
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
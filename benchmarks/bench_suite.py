@@ -0,0 +1,367 @@
+#!/usr/bin/python3
+
+# End-to-end benchmarks against fake RouterOS routers on loopback (see fakerouter.py).
+# Measures SSH handshake cost, collector throughput (over SSH and the RouterOS API, see
+# fakeapi.py), backup wall time across a fleet and parser speed, and writes everything as JSON so runs from different releases can be
+# compared with --compare.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import paramiko
+
+import addressaudit
+import bench_parser
+import collector
+import fakeapi
+import fakerouter
+import latencyhistory
+import metacache
+import metrics
+import output
+import mikrotikconfigbackup
+import parsedumps
+import routerosapi
+import sessiond
+import sshsession
+import tableparser
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def timing_summary(samples):
+    # Milliseconds summary of a list of durations in seconds
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": percentile(samples, 0.5) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+    }
+
+
+def phase_means(phases, router):
+    # Mean milliseconds per phase from what the session layer recorded for this router
+    means = {}
+    for (phase, command, name), histogram in metrics.registry.histograms.items():
+        if phase in phases and name == router and histogram.count:
+            means[f"{phase}_mean_ms"] = histogram.sum / histogram.count * 1000
+    return means
+
+
+def bench_handshake(router, count):
+    # Cost of a fresh session (TCP + key exchange + auth) against a command on a reused one
+    connects = []
+    commands = []
+    for _ in range(count):
+        started = time.perf_counter()
+        session = sshsession.RouterSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port).connect()
+        connects.append(time.perf_counter() - started)
+        session.close()
+    with sshsession.RouterSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port).connect() as session:
+        for _ in range(count):
+            started = time.perf_counter()
+            session.run("/system/identity/print")
+            commands.append(time.perf_counter() - started)
+    return {
+        "connect": timing_summary(connects),
+        "connect_phases": phase_means(("tcp", "kex", "auth"), router.address),
+        "command_on_open_session": timing_summary(commands),
+    }
+
+
+def bench_daemon(router, count):
+    # What one script invocation running one command costs: its own SSH connection each
+    # time, against going through a session daemon that already holds one
+    fresh = []
+    for _ in range(count):
+        started = time.perf_counter()
+        with sshsession.RouterSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port).connect() as session:
+            session.run("/system/identity/print")
+        fresh.append(time.perf_counter() - started)
+    through_daemon = []
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-sessiond-"), "sessiond.sock")
+    try:
+        with sessiond.SessionDaemon(path):
+            # The first request pays for the daemon's own connection
+            sessiond.DaemonSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port, path).connect()
+            for _ in range(count):
+                started = time.perf_counter()
+                session = sessiond.DaemonSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port, path).connect()
+                session.run("/system/identity/print")
+                through_daemon.append(time.perf_counter() - started)
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return {"fresh_connection": timing_summary(fresh), "through_daemon": timing_summary(through_daemon)}
+
+
+def bench_collectors(router, repeat):
+    # Rows per second through collector.fetch for every table, over one session
+    results = {}
+    with sshsession.RouterSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port).connect() as session:
+        for table in tableparser.TABLES:
+            best, rows = bench_parser.bench(lambda: sum(1 for _ in collector.fetch(session, table)[1]), repeat)
+            results[table] = {"rows": rows, "seconds": best, "rows_per_second": rows / best}
+    return results
+
+
+def bench_api(router, repeat):
+    # Rows per second through collector.fetch over the API, then all tables requested at
+    # once on the one connection against one after another
+    results = {}
+    with routerosapi.ApiSession(router.address, fakerouter.USERNAME, fakerouter.PASSWORD, router.port).connect() as session:
+        for table in tableparser.TABLES:
+            best, rows = bench_parser.bench(lambda: sum(1 for _ in collector.fetch(session, table)[1]), repeat)
+            results[table] = {"rows": rows, "seconds": best, "rows_per_second": rows / best}
+
+        def sequential():
+            return sum(len(session.talk(path)) for path in routerosapi.TABLE_PATHS.values())
+
+        def concurrent():
+            replies = [session.request(path) for path in routerosapi.TABLE_PATHS.values()]
+            return sum(len(list(reply)) for reply in replies)
+
+        sequential_time, rows = bench_parser.bench(sequential, repeat)
+        concurrent_time, rows = bench_parser.bench(concurrent, repeat)
+        results["all_tables"] = {"rows": rows, "sequential_seconds": sequential_time, "concurrent_seconds": concurrent_time}
+    return results
+
+
+def bench_backup(fleet, workers, modes):
+    # Wall time of backing up the whole fleet with the backup script, once per mode
+    results = {}
+    work = tempfile.mkdtemp(prefix="bench-backup-")
+    # Keep the fake routers out of the user's metadata cache and latency history; the
+    # first mode fills these
+    metacache.cache = metacache.MetadataCache(os.path.join(work, "metadata.json"))
+    latencyhistory.history = latencyhistory.LatencyHistory(os.path.join(work, "latency.json"))
+    try:
+        router_list = fleet.write_list(os.path.join(work, "routers.txt"))
+        for name, extra in modes.items():
+            directory = os.path.join(work, name)
+            os.makedirs(directory)
+            argv = ["--list", router_list, "-P", str(fleet.port), "-u", fakerouter.USERNAME, "-p", fakerouter.PASSWORD,
+                    "-d", directory, "-e", "", "--delete", "-w", str(workers)] + extra
+            started = time.perf_counter()
+            # The script reports per router; only the timing matters here
+            with contextlib.redirect_stdout(io.StringIO()):
+                mikrotikconfigbackup.main(argv)
+            elapsed = time.perf_counter() - started
+            stored = sum(os.path.getsize(os.path.join(path, file)) for path, dirs, files in os.walk(directory) for file in files)
+            results[name] = {"routers": len(fleet.routers), "workers": workers, "seconds": elapsed,
+                             "routers_per_second": len(fleet.routers) / elapsed, "bytes_stored": stored}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def bench_parsing(rows, repeat):
+    results = {}
+    for table, (command, record_type) in tableparser.TABLES.items():
+        terse, legacy = bench_parser.synthetic_rows(table, rows)
+        best, parsed = bench_parser.bench(lambda: sum(1 for _ in tableparser.parse(terse, record_type)), repeat)
+        results[table] = {"rows": parsed, "seconds": best, "rows_per_second": parsed / best}
+    return results
+
+
+def bench_output(rows, repeat):
+    # Records per second written by each --format writer, against the print() per field the
+    # collectors used before (the DHCP table, written to /dev/null)
+    import getdhcp
+
+    command, record_type = tableparser.TABLES["dhcp"]
+    records = list(tableparser.parse(bench_parser.synthetic_rows("dhcp", rows)[0], record_type))
+
+    def print_fields():
+        with open(os.devnull, "w") as file:
+            for entry in records:
+                print(f"Server: {entry.server}", file=file)
+                print(f"  IP: {entry.address}", file=file)
+                print(f"  MAC: {entry.mac_address}", file=file)
+                print(f"  Hostname: {entry.host_name or 'none'}", file=file)
+                print("-" * 25, file=file)
+        return len(records)
+
+    def writer(format):
+        def write():
+            with output.open_writer(format, record_type, os.devnull, {"router": "10.0.0.1"}, getdhcp.format_entry) as writer:
+                return writer.write_all(records)
+        return write
+
+    results = {}
+    for name, run in [("print", print_fields)] + [(format, writer(format)) for format in output.FORMATS]:
+        best, written = bench_parser.bench(run, repeat)
+        results[name] = {"rows": written, "seconds": best, "rows_per_second": written / best}
+    return results
+
+
+def bench_dumps(rows, repeat, files=4):
+    # Offline dump parsing (DHCP leases, JSON Lines to /dev/null) with one process and
+    # with one per CPU; files are split into chunks so even one file uses every worker
+    directory = tempfile.mkdtemp(prefix="bench-dumps-")
+    try:
+        text = "\n".join(bench_parser.synthetic_rows("dhcp", rows)[0]) + "\n"
+        for number in range(files):
+            with open(os.path.join(directory, f"router{number}.txt"), "w") as file:
+                file.write(text)
+        chunk_size = max(1, len(text) // 4)
+        results = {}
+        for workers in sorted({1, os.cpu_count() or 1}):
+            best, (parsed_files, records, failed) = bench_parser.bench(
+                lambda: parsedumps.parse_dumps([directory], "dhcp", "jsonl", os.devnull, workers, chunk_size), repeat)
+            results[f"workers_{workers}"] = {"rows": records, "seconds": best, "rows_per_second": records / best}
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_audit(rows, repeat):
+    # addresses audit over a fleet of point-to-point links (two addresses per /30, across
+    # 1000 routers), clean and with one /16 that swallows a few thousand of them
+    addresses = []
+    for n in range(rows):
+        for end in (1, 2):
+            addresses.append((f"router{(n + end * 7) % 1000}", f"ether{end}", f"{bench_parser.ip(n * 4 + end)}/30", ""))
+    results = {}
+    for name, fleet in (("clean", addresses), ("overlap", addresses + [("core", "bridge", "10.0.0.1/16", "")])):
+        best, report = bench_parser.bench(lambda: addressaudit.audit(fleet), repeat)
+        results[name] = {"rows": len(fleet), "seconds": best, "rows_per_second": len(fleet) / best,
+                         "findings": sum(len(report[kind]) for kind in ("duplicates", "mismatched_prefixes", "overlaps"))}
+    return results
+
+
+def metadata(args):
+    try:
+        revision = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "revision": revision,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "paramiko": paramiko.__version__,
+        "platform": platform.platform(),
+        "options": vars(args),
+    }
+
+
+def flatten(results, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}, numbers only
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(previous, current):
+    # Print every metric that appears in both runs with its ratio to the previous run
+    before = flatten(previous["results"])
+    after = flatten(current["results"])
+    print(f"Compared with {previous['meta'].get('revision') or 'previous run'} ({previous['meta'].get('date', '')}):")
+    for key in sorted(before.keys() & after.keys()):
+        if before[key] and (key.endswith("_ms") or key.endswith("seconds") or key.endswith("per_second")):
+            print(f"  {key:<55}{before[key]:>14.3f} -> {after[key]:>14.3f}  ({after[key] / before[key]:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scripts against fake RouterOS routers on loopback.")
+    parser.add_argument("--routers", type=int, default=8, help="Fake routers in the backup fleet. Default: 8")
+    parser.add_argument("--workers", type=int, default=8, help="Backup workers. Default: 8")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows per table for the collector and parser runs. Default: 10000")
+    parser.add_argument("--export-size", type=int, default=64 * 1024, help="Bytes of /export output per router. Default: 65536")
+    parser.add_argument("--backup-size", type=int, default=1024 * 1024, help="Bytes per system backup file. Default: 1048576")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of router delay before the handshake and each command. Default: 0")
+    parser.add_argument("--handshakes", type=int, default=20, help="Connections opened for the handshake benchmark. Default: 20")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per collector/parser measurement; the best is reported. Default: 3")
+    parser.add_argument("--only", choices=["handshake", "collector", "daemon", "api", "backup", "parser", "output", "dumps", "audit"], action="append", help="Run only these benchmarks. Repeatable.")
+    parser.add_argument("--json", type=str, default="bench_results.json", help="Where to write the results. Default: bench_results.json")
+    parser.add_argument("--compare", type=str, help="Results file from an earlier run to compare against.")
+    args = parser.parse_args()
+
+    selected = args.only or ["handshake", "collector", "daemon", "api", "backup", "parser", "output", "dumps", "audit"]
+    router_options = {"rows": args.rows, "export_size": args.export_size, "backup_size": args.backup_size, "latency": args.latency}
+    results = {}
+
+    if "handshake" in selected or "collector" in selected or "daemon" in selected:
+        with fakerouter.FakeRouter(**router_options) as router:
+            if "handshake" in selected:
+                results["handshake"] = bench_handshake(router, args.handshakes)
+                phases = ", ".join(f"{name[:-8]} {value:.1f}" for name, value in results["handshake"]["connect_phases"].items())
+                print(f"handshake  connect p50 {results['handshake']['connect']['p50_ms']:.1f} ms ({phases} ms mean), "
+                      f"command on open session p50 {results['handshake']['command_on_open_session']['p50_ms']:.1f} ms")
+            if "collector" in selected:
+                results["collector"] = bench_collectors(router, args.repeat)
+                for table, result in results["collector"].items():
+                    print(f"collector  {table:<10}{result['rows']:>8} rows {result['seconds']:8.3f}s {result['rows_per_second']:>12,.0f} rows/s")
+            if "daemon" in selected:
+                results["daemon"] = bench_daemon(router, args.handshakes)
+                print(f"daemon     one command per invocation p50 {results['daemon']['fresh_connection']['p50_ms']:.1f} ms fresh, "
+                      f"{results['daemon']['through_daemon']['p50_ms']:.1f} ms through the session daemon")
+
+    if "api" in selected:
+        with fakeapi.FakeApiRouter(**router_options) as router:
+            results["api"] = bench_api(router, args.repeat)
+        for table, result in results["api"].items():
+            if table == "all_tables":
+                print(f"api        all tables{result['rows']:>8} rows {result['sequential_seconds']:8.3f}s sequential, "
+                      f"{result['concurrent_seconds']:.3f}s concurrent")
+            else:
+                print(f"api        {table:<10}{result['rows']:>8} rows {result['seconds']:8.3f}s {result['rows_per_second']:>12,.0f} rows/s")
+
+    if "backup" in selected:
+        modes = {"file": [], "stream": ["--export-mode", "stream"], "store": ["--store"]}
+        with fakerouter.FakeFleet(args.routers, **router_options) as fleet:
+            results["backup"] = bench_backup(fleet, args.workers, modes)
+        for mode, result in results["backup"].items():
+            print(f"backup     {mode:<10}{result['routers']:>4} routers {result['seconds']:8.2f}s {result['routers_per_second']:>8.2f} routers/s")
+
+    if "parser" in selected:
+        results["parser"] = bench_parsing(args.rows, args.repeat)
+        for table, result in results["parser"].items():
+            print(f"parser     {table:<10}{result['rows']:>8} rows {result['seconds']:8.3f}s {result['rows_per_second']:>12,.0f} rows/s")
+
+    if "output" in selected:
+        results["output"] = bench_output(args.rows, args.repeat)
+        for name, result in results["output"].items():
+            print(f"output     {name:<10}{result['rows']:>8} rows {result['seconds']:8.3f}s {result['rows_per_second']:>12,.0f} rows/s")
+
+    if "dumps" in selected:
+        results["dumps"] = bench_dumps(args.rows, args.repeat)
+        for name, result in results["dumps"].items():
+            print(f"dumps      {name:<10}{result['rows']:>8} rows {result['seconds']:8.3f}s {result['rows_per_second']:>12,.0f} rows/s")
+
+    if "audit" in selected:
+        results["audit"] = bench_audit(args.rows, args.repeat)
+        for name, result in results["audit"].items():
+            print(f"audit      {name:<10}{result['rows']:>8} rows {result['seconds']:8.3f}s {result['rows_per_second']:>12,.0f} rows/s")
+
+    report = {"meta": metadata(args), "results": results}
+    with open(args.json, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to '{args.json}'")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
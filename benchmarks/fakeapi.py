@@ -0,0 +1,308 @@
+#!/usr/bin/python3
+
+# Local stand-in for the RouterOS API service, used by the benchmarks and for trying the
+# --transport api code paths without a router. Speaks the length-prefixed sentence
+# protocol (plain, or TLS with a throwaway self-signed certificate), logs in with
+# /login, answers the identity and table print commands with the same synthetic rows
+# as fakerouter.py, and handles every tagged request on its own thread so concurrent
+# queries overlap the way they do on a router.
+#
+#   python benchmarks/fakeapi.py --port 8728 --rows 5000
+
+import argparse
+import datetime
+import functools
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routerosapi
+import tableparser
+from bench_parser import synthetic_rows
+from fakerouter import BOARD, PASSWORD, USERNAME, VERSION
+
+SEND_SIZE = 32768
+# Flag letter in printed output -> API boolean attribute, for the tables bench_parser builds
+FLAG_LETTERS = {letter: name for name, letter in tableparser.FLAG_ATTRIBUTES}
+
+
+@functools.cache
+def tls_context():
+    # Server context with a self-signed certificate made for this process
+    import ssl
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fakeapi")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    directory = tempfile.mkdtemp(prefix="fakeapi-")
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as file:
+        file.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as file:
+        file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def api_rows(table, rows):
+    # The synthetic terse table as API attribute dicts
+    records = []
+    for row in tableparser.iter_rows(synthetic_rows(table, rows)[0]):
+        attributes = {".id": f"*{row.index + 1:X}"}
+        attributes.update(row.attrs)
+        for letter in row.flags:
+            if letter in FLAG_LETTERS:
+                attributes[FLAG_LETTERS[letter]] = "true"
+        records.append(attributes)
+    return records
+
+
+def encode_reply(reply, attributes=None, tag=None):
+    words = [reply] + [f"={key}={value}" for key, value in (attributes or {}).items()]
+    if tag is not None:
+        words.append(f".tag={tag}")
+    return routerosapi.encode_sentence(words)
+
+
+class ApiConnection:
+    # One client connection: reads sentences and answers each tagged request on a thread
+
+    def __init__(self, router, sock):
+        self.router = router
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        # tag -> Event set when the request is cancelled
+        self.cancelled = {}
+        self.logged_in = False
+
+    def send(self, reply, attributes=None, tag=None):
+        self.send_encoded(encode_reply(reply, attributes, tag))
+
+    def send_encoded(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def serve(self):
+        reader = routerosapi.SentenceReader(self.sock)
+        try:
+            while True:
+                words = reader.read_sentence()
+                if not words:
+                    continue
+                reply, tag, attributes = routerosapi.parse_sentence(words)
+                command = words[0]
+                if command == "/login":
+                    self.login(attributes, tag)
+                elif not self.logged_in:
+                    self.send("!fatal", {"message": "not logged in"})
+                    return
+                elif command == "/cancel":
+                    event = self.cancelled.get(attributes.get("tag"))
+                    if event is not None:
+                        event.set()
+                    self.send("!done", tag=tag)
+                else:
+                    self.cancelled[tag] = threading.Event()
+                    queries = [word[1:].partition("=") for word in words[1:] if word.startswith("?")]
+                    threading.Thread(target=self.answer, args=(command, attributes, queries, tag), daemon=True).start()
+        except (routerosapi.ApiError, OSError):
+            pass
+        finally:
+            self.sock.close()
+
+    def login(self, attributes, tag):
+        if attributes.get("name") == self.router.username and attributes.get("password") == self.router.password:
+            self.logged_in = True
+            self.send("!done", tag=tag)
+        else:
+            self.send("!trap", {"message": "invalid user name or password (6)"}, tag)
+            self.send("!done", tag=tag)
+
+    def answer(self, command, attributes, queries, tag):
+        time.sleep(self.router.latency)
+        try:
+            if command == "/system/identity/print":
+                self.send("!re", {"name": self.router.identity}, tag)
+            elif command == "/system/resource/print":
+                self.send("!re", {"version": VERSION, "board-name": BOARD}, tag)
+            elif command in self.router.tables:
+                # Sent in batches so the fake spends its time on the wire, not in sendall
+                batch = bytearray()
+                for record in self.router.table(command):
+                    if all(record.get(key) == value for key, _, value in queries):
+                        batch += encode_reply("!re", record, tag)
+                    if len(batch) >= SEND_SIZE:
+                        if self.cancelled[tag].is_set():
+                            self.send("!trap", {"category": "2", "message": "interrupted"}, tag)
+                            batch.clear()
+                            break
+                        self.send_encoded(batch)
+                        batch = bytearray()
+                if batch:
+                    self.send_encoded(batch)
+            elif command.endswith("/listen"):
+                # Pushes what change() and remove() do to the table until /cancel
+                listener = (self, tag, command[:-len("listen")] + "print")
+                with self.router.lock:
+                    self.router.listeners.append(listener)
+                try:
+                    self.cancelled[tag].wait()
+                finally:
+                    with self.router.lock:
+                        self.router.listeners.remove(listener)
+                self.send("!trap", {"category": "2", "message": "interrupted"}, tag)
+            else:
+                self.send("!trap", {"message": "no such command prefix"}, tag)
+            self.send("!done", tag=tag)
+        except OSError:
+            # Client went away
+            pass
+        finally:
+            self.cancelled.pop(tag, None)
+
+
+class FakeApiRouter:
+    # One fake RouterOS API service listening on address:port
+
+    def __init__(self, address="127.0.0.1", port=0, identity=None, rows=1000, latency=0.0, tls=False,
+                 username=USERNAME, password=PASSWORD, **unused):
+        self.address = address
+        self.port = port
+        self.identity = identity or f"fake-{address.replace('.', '-')}"
+        self.rows = rows
+        # Seconds added before answering each request
+        self.latency = latency
+        self.tls = tls
+        self.username = username
+        self.password = password
+        self.listener = None
+        self.connections = []
+        self.lock = threading.Lock()
+        self.tables = {path: table for table, path in routerosapi.TABLE_PATHS.items()}
+        self.records = {}
+        # (connection, tag, print path) of every running listen
+        self.listeners = []
+
+    def table(self, path):
+        # Synthetic records, built once per router
+        with self.lock:
+            if path not in self.records:
+                self.records[path] = api_rows(self.tables[path], self.rows)
+            return self.records[path]
+
+    def notify(self, path, attributes):
+        with self.lock:
+            listeners = [(connection, tag) for connection, tag, listened in self.listeners if listened == path]
+        for connection, tag in listeners:
+            try:
+                connection.send("!re", attributes, tag)
+            except OSError:
+                pass
+
+    def change(self, path, record):
+        # Add a record, or replace the one with the same .id, and tell listeners
+        records = self.table(path)
+        with self.lock:
+            for i, existing in enumerate(records):
+                if existing[".id"] == record[".id"]:
+                    records[i] = record
+                    break
+            else:
+                records.append(record)
+        self.notify(path, record)
+
+    def remove(self, path, item_id):
+        records = self.table(path)
+        with self.lock:
+            records[:] = [record for record in records if record[".id"] != item_id]
+        self.notify(path, {".id": item_id, ".dead": "true"})
+
+    def start(self):
+        if self.tls:
+            tls_context()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.address, self.port))
+        self.listener.listen(128)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        return self
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, peer = self.listener.accept()
+            except OSError:
+                # Listener closed by stop()
+                return
+            threading.Thread(target=self.serve_connection, args=(sock,), daemon=True).start()
+
+    def serve_connection(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.tls:
+            try:
+                sock = tls_context().wrap_socket(sock, server_side=True)
+            except OSError:
+                sock.close()
+                return
+        with self.lock:
+            self.connections.append(sock)
+        ApiConnection(self, sock).serve()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake RouterOS API service on loopback until interrupted.")
+    parser.add_argument("--address", type=str, default="127.0.0.1", help="Address to listen on. Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=routerosapi.API_PORT, help=f"Port to listen on. Default: {routerosapi.API_PORT}")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows in each table. Default: 1000")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay before answering each request. Default: 0")
+    parser.add_argument("--tls", action="store_true", help="Serve the API over TLS like api-ssl.")
+    args = parser.parse_args()
+
+    with FakeApiRouter(args.address, args.port, rows=args.rows, latency=args.latency, tls=args.tls) as router:
+        print(f"Fake API on {router.address}:{router.port}{' (TLS)' if args.tls else ''} (user {USERNAME}, password {PASSWORD})")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
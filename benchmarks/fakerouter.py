@@ -0,0 +1,362 @@
+#!/usr/bin/python3
+
+# Local stand-in for a RouterOS SSH server, used by the benchmarks.
+# Answers the commands the scripts send (identity, the printed tables, /export,
+# /system backup save) with synthetic data of a configurable size, and serves the files
+# those commands create over SFTP. A fleet puts one fake router on each of
+# 127.0.1.1, 127.0.1.2, ... on the same port, so scripts that take a router list and a
+# single port run against it unchanged (Linux routes all of 127.0.0.0/8 to loopback).
+#
+# Run it on its own to poke at it by hand:
+#   python benchmarks/fakerouter.py --routers 4 --port 2222 --list routers.txt
+
+import argparse
+import functools
+import logging
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import paramiko
+
+from bench_parser import synthetic_rows
+
+USERNAME = "admin"
+PASSWORD = "admin"
+SEND_SIZE = 32768
+# Banner RouterOS sends; the fleet scanner and the pre-checks look at it
+BANNER = "SSH-2.0-ROSSSH"
+# What /system/resource/print reports
+VERSION = "7.16.2 (stable)"
+BOARD = "CCR2004-16G-2S+"
+
+# Clients hanging up make the server side log "Socket exception"; keep that off the console
+logging.getLogger("paramiko").addHandler(logging.NullHandler())
+
+# Printed command -> table name in bench_parser.synthetic_rows
+TERSE_TABLES = {
+    "/ip/arp/print terse": "arp",
+    "/ip/dhcp/lease/print terse": "dhcp",
+    "/ip/address/print terse": "addresses",
+    "/ip/neighbor/print terse": "neighbors",
+}
+# The column-formatted output the scripts parsed before they switched to terse
+COLUMN_TABLES = {
+    "/ip/arp/print": "arp",
+    "/ip/dhcp/lease/print": "dhcp",
+    "/ip/address/print": "addresses",
+    "/ip/neighbor/print": "neighbors",
+}
+
+
+@functools.cache
+def host_key():
+    # Generating an RSA key takes a moment, so every fake router shares one
+    return paramiko.RSAKey.generate(2048)
+
+
+def synthetic_export(size, identity):
+    # A config export of roughly `size` bytes that is identical on every call, like a
+    # router whose configuration hasn't changed
+    lines = [
+        f"# {time.strftime('%Y-%m-%d %H:%M:%S')} by RouterOS 7.14.3",
+        "# software id = FAKE-0000",
+        "#",
+        "/system identity",
+        f"set name={identity}",
+        "/ip address",
+    ]
+    length = sum(len(line) + 1 for line in lines)
+    n = 0
+    while length < size:
+        line = f"add address=10.{(n >> 8) & 0xFF}.{n & 0xFF}.1/24 comment=\"site {n}\" interface=vlan{n % 4000} network=10.{(n >> 8) & 0xFF}.{n & 0xFF}.0"
+        lines.append(line)
+        length += len(line) + 1
+        n += 1
+    return ("\n".join(lines) + "\n").encode()
+
+
+class FakeSFTPServer(paramiko.SFTPServerInterface):
+    # Flat file system like a router's flash: every path maps to a file in one directory
+
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def local_path(self, path):
+        return os.path.join(self.root, os.path.basename(path.rstrip("/")))
+
+    def list_folder(self, path):
+        try:
+            return [
+                paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(self.root, name)), name)
+                for name in os.listdir(self.root)
+            ]
+        except OSError as ex:
+            return paramiko.SFTPServer.convert_errno(ex.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.local_path(path)))
+        except OSError as ex:
+            return paramiko.SFTPServer.convert_errno(ex.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        # Only the modes the scripts use: read, and write/truncate for completeness
+        try:
+            if flags & os.O_WRONLY or flags & os.O_RDWR:
+                file = open(self.local_path(path), "wb" if flags & os.O_TRUNC or flags & os.O_CREAT else "r+b")
+            else:
+                file = open(self.local_path(path), "rb")
+        except OSError as ex:
+            return paramiko.SFTPServer.convert_errno(ex.errno)
+        handle = paramiko.SFTPHandle(flags)
+        handle.readfile = file
+        handle.writefile = file
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self.local_path(path))
+        except OSError as ex:
+            return paramiko.SFTPServer.convert_errno(ex.errno)
+        return paramiko.SFTP_OK
+
+
+class RouterServer(paramiko.ServerInterface):
+    # Authentication and channel policy for one connection to a FakeRouter
+
+    def __init__(self, router):
+        self.router = router
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.router.username and password == self.router.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        # Answer on another thread; this one is the transport's and must keep reading
+        threading.Thread(target=self.router.execute, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+class FakeRouter:
+    # One fake RouterOS SSH/SFTP server listening on address:port
+
+    def __init__(self, address="127.0.0.1", port=0, identity=None, rows=1000, export_size=64 * 1024,
+                 backup_size=1024 * 1024, latency=0.0, username=USERNAME, password=PASSWORD):
+        self.address = address
+        self.port = port
+        self.identity = identity or f"fake-{address.replace('.', '-')}"
+        self.rows = rows
+        self.export_size = export_size
+        self.backup_size = backup_size
+        # Seconds added before the handshake and before every command's output
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.root = None
+        self.listener = None
+        self.transports = []
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.tables = {}
+
+    def start(self):
+        # Generate the key now rather than during the first client's handshake
+        host_key()
+        self.root = tempfile.mkdtemp(prefix="fakerouter-")
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.address, self.port))
+        self.listener.listen(128)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        return self
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, peer = self.listener.accept()
+            except OSError:
+                # Listener closed by stop()
+                return
+            threading.Thread(target=self.serve_connection, args=(sock,), daemon=True).start()
+
+    def serve_connection(self, sock):
+        time.sleep(self.latency)
+        # Send small replies straight away instead of waiting on the client's delayed ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(sock)
+        transport.local_version = BANNER
+        transport.add_server_key(host_key())
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, FakeSFTPServer, self.root)
+        with self.lock:
+            self.transports.append(transport)
+        try:
+            transport.start_server(server=RouterServer(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            # Port probes connect and hang up without a handshake
+            transport.close()
+
+    def table(self, table, terse):
+        # Synthetic table output, built once per router
+        key = (table, terse)
+        if key not in self.tables:
+            terse_rows, column_rows = synthetic_rows(table, self.rows)
+            lines = terse_rows if terse else ["Flags: X - DISABLED, D - DYNAMIC"] + column_rows
+            self.tables[key] = ("\n".join(lines) + "\n").encode()
+        return self.tables[key]
+
+    def respond(self, command):
+        # Return (stdout, stderr, exit status) for a RouterOS command
+        command = command.strip()
+        if command == "/system/identity/print":
+            return f"  name: {self.identity}\n".encode(), b"", 0
+        if command == "/system/resource/print":
+            return f"  version: {VERSION}\n  board-name: {BOARD}\n".encode(), b"", 0
+        if command in TERSE_TABLES:
+            return self.table(TERSE_TABLES[command], True), b"", 0
+        if command in COLUMN_TABLES:
+            return self.table(COLUMN_TABLES[command], False), b"", 0
+        if command == "/export":
+            return synthetic_export(self.export_size, self.identity), b"", 0
+        match = re.match(r"^/export file=(\S+)$", command)
+        if match:
+            name = match.group(1) if match.group(1).endswith(".rsc") else f"{match.group(1)}.rsc"
+            with open(os.path.join(self.root, name), "wb") as file:
+                file.write(synthetic_export(self.export_size, self.identity))
+            return b"", b"", 0
+        match = re.match(r"^/system backup save name=(\S+)", command)
+        if match:
+            name = match.group(1) if match.group(1).endswith(".backup") else f"{match.group(1)}.backup"
+            with open(os.path.join(self.root, name), "wb") as file:
+                file.write(os.urandom(self.backup_size))
+            return b"Configuration backup saved\n", b"", 0
+        return b"", f"bad command name {command.split()[0] if command else ''}\n".encode(), 1
+
+    def execute(self, channel, command):
+        with self.lock:
+            self.commands += 1
+        time.sleep(self.latency)
+        output, err, exit_status = self.respond(command)
+        try:
+            for start in range(0, len(output), SEND_SIZE):
+                channel.sendall(output[start:start + SEND_SIZE])
+            if err:
+                channel.sendall_stderr(err)
+            channel.send_exit_status(exit_status)
+            # EOF rather than close: the exec request's reply may still be queued behind
+            # this thread, and a client that sees the channel closed first reports the
+            # command as failed. The client closes the channel once it has read the output.
+            channel.shutdown_write()
+        except (OSError, EOFError, paramiko.SSHException):
+            # The client closed the channel before reading everything
+            channel.close()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        with self.lock:
+            transports, self.transports = self.transports, []
+        for transport in transports:
+            transport.close()
+        if self.root is not None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def fleet_address(n):
+    # 127.0.1.1, 127.0.1.2, ..., 127.0.1.254, 127.0.2.1, ...
+    return f"127.0.{1 + n // 254}.{1 + n % 254}"
+
+
+class FakeFleet:
+    # `count` fake routers on consecutive loopback addresses sharing one port
+
+    def __init__(self, count, port=0, **router_options):
+        self.count = count
+        self.port = port
+        self.router_options = router_options
+        self.routers = []
+
+    def start(self):
+        for n in range(self.count):
+            router = FakeRouter(fleet_address(n), self.port, **self.router_options).start()
+            # The first router picks a free port when none was given; the rest reuse it
+            self.port = router.port
+            self.routers.append(router)
+        return self
+
+    @property
+    def addresses(self):
+        return [router.address for router in self.routers]
+
+    def write_list(self, path):
+        # Router list in the format --list expects
+        with open(path, "w") as file:
+            file.write("\n".join(self.addresses) + "\n")
+        return path
+
+    def stop(self):
+        for router in self.routers:
+            router.stop()
+        self.routers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake RouterOS SSH servers on loopback until interrupted.")
+    parser.add_argument("--routers", type=int, default=1, help="Number of fake routers. Default: 1")
+    parser.add_argument("--port", type=int, default=2222, help="Port every fake router listens on. Default: 2222")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows in each printed table. Default: 1000")
+    parser.add_argument("--export-size", type=int, default=64 * 1024, help="Bytes of /export output. Default: 65536")
+    parser.add_argument("--backup-size", type=int, default=1024 * 1024, help="Bytes per system backup file. Default: 1048576")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay before the handshake and each command. Default: 0")
+    parser.add_argument("--list", type=str, help="Write the router addresses to this file.")
+    args = parser.parse_args()
+
+    fleet = FakeFleet(args.routers, args.port, rows=args.rows, export_size=args.export_size,
+                      backup_size=args.backup_size, latency=args.latency)
+    with fleet:
+        if args.list:
+            fleet.write_list(args.list)
+        print(f"{args.routers} fake routers on port {fleet.port} (user {USERNAME}, password {PASSWORD}):")
+        for address in fleet.addresses:
+            print(f"  {address}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
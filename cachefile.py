@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+# The per-user cache directory and the JSON files kept in it: scan results, router
+# metadata and latency history. Each file is read once per process. An update is merged
+# into what is on disk at that moment, so entries written by runs in other processes
+# survive, and written atomically, so readers never see half a file.
+
+import json
+import os
+import threading
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mikrotikautomation")
+
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, name)
+
+
+class JsonCache:
+    # One JSON object on disk, loaded once per process and merged into on every write
+
+    def __init__(self, path, indent=None):
+        self.path = path
+        self.indent = indent
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def read(self):
+        # What is on disk now; a missing or unreadable file is an empty cache
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self):
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.read()
+            return self.entries
+
+    def write(self, update):
+        # Apply update(entries) to the file's current contents and write them back
+        with self.lock:
+            entries = self.read()
+            update(entries)
+            self.entries = entries
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(entries, file, indent=self.indent)
+            os.replace(temp_path, self.path)
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+# Shared driver for the single-router table collectors (getarp, getdhcp, getaddresses).
+# fetch() is the library entry point; main() is the command line around it. Tables are
+# read over SSH (printed terse and parsed) or over the RouterOS API (structured replies),
+# chosen with --transport. The ARP and DHCP collectors can also --watch a table and
+# write only its changes (see watch.py).
+
+import argparse
+import functools
+import getpass
+import socket
+import sys
+
+import latencyhistory
+import output
+import routerlist
+import routerosapi
+import sshsession
+import tableparser
+
+TRANSPORTS = ("ssh", "api", "api-ssl")
+
+
+def fetch(session, table):
+    # Start reading one of tableparser.TABLES and return (stream, records).
+    # Records are produced while the router is still sending; stream.err is set once they
+    # have all been consumed.
+    command, record_type = tableparser.TABLES[table]
+    if isinstance(session, routerosapi.ApiSession):
+        reply = session.request(routerosapi.TABLE_PATHS[table])
+        return reply, (record_type.from_attributes(attributes) for attributes in reply)
+    stream = session.stream(command)
+    return stream, tableparser.parse(stream, record_type)
+
+
+def add_transport_argument(parser):
+    parser.add_argument("--transport", choices=TRANSPORTS, default="ssh", help="'ssh' prints tables over SSH. 'api' uses the RouterOS API on 8728, 'api-ssl' the API over TLS on 8729. Default: ssh")
+    parser.add_argument("--api-port", type=int, help="API port, if not the default for the transport.")
+
+
+def connect(transport, router_ip, username, password, api_port=None, ssh_port=sshsession.DEFAULT_PORT):
+    # Open a session over the chosen transport. SSH sessions come from the shared pool and
+    # are released with sshsession.pool.close(); API sessions are closed by the caller.
+    if transport == "ssh":
+        return sshsession.get_session(router_ip, username, password, ssh_port)
+    return routerosapi.ApiSession(router_ip, username, password, api_port, tls=transport == "api-ssl").connect()
+
+
+def close(session, router_ip=None):
+    # Release a session from connect(); SSH sessions for router_ip (or all) leave the pool
+    if isinstance(session, routerosapi.ApiSession):
+        session.close()
+    sshsession.pool.close(router_ip)
+
+
+def build_parser(description, prog=None, watchable=False):
+    # Argument parser setup
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument("-r", "--router-ip", type=str, help="Router IP or hostname (e.g. 192.168.10.1)")
+    parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
+    parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
+    add_transport_argument(parser)
+    output.add_output_arguments(parser)
+    if watchable:
+        parser.add_argument("--watch", action="store_true", help="Keep a session open and write added/changed/removed entries as JSON lines until interrupted.")
+        parser.add_argument("--interval", type=float, default=10, help="Seconds between prints when watching over SSH. Default: 10")
+        parser.add_argument("--list", type=str, help="With --watch, path to a file with one router per line to watch together.")
+    return parser
+
+
+def main(table, format_entry, description, argv=None, prog=None):
+    import watch
+
+    args = build_parser(description, prog, table in watch.KEYS).parse_args(argv)
+    import paramiko
+
+    if getattr(args, "watch", False):
+        # Changes are written as JSON lines; connection problems become "error" events
+        if args.list:
+            routers = routerlist.read_routers(args.list)
+        else:
+            routers = [args.router_ip or input("Enter router IP: ").strip()]
+        username = args.username or input("Username: ").strip()
+        password = args.password or getpass.getpass("Password: ").strip()
+        watch.watch(routers, username, password, table, args.transport, args.interval, args.api_port)
+        return
+
+    # Interactive prompts for missing args
+    router_ip = args.router_ip or input("Enter router IP: ").strip()
+    username = args.username or input("Username: ").strip()
+    password = args.password or getpass.getpass("Password: ").strip()
+
+    # Pre-check: test TCP connectivity (the API doesn't send a banner to probe for)
+    if args.transport == "ssh":
+        sshsession.require_ssh(router_ip)
+
+    # Status messages stay out of structured output, so it can be piped as it is
+    show = print if args.format == "text" else functools.partial(print, file=sys.stderr)
+
+    session = None
+    try:
+        # Connect, reusing an open SSH session to this router if there is one
+        session = connect(args.transport, router_ip, username, password, args.api_port)
+        show("Connected to MikroTik router.")
+
+        # Parse and write entries while the router is still sending the table
+        stream, records = fetch(session, table)
+        if args.format == "text":
+            show("-" * 25)
+        with output.open_writer(args.format, tableparser.TABLES[table][1], args.output, {"router": router_ip}, format_entry) as writer:
+            writer.write_all(records)
+
+        if stream.err:
+            show("\n--- Command Error ---")
+            show(stream.err)
+
+    except (paramiko.AuthenticationException, routerosapi.AuthenticationError):
+        show("Authentication failed. Check your username or password.")
+    except paramiko.SSHException as ssh_ex:
+        show(f"SSH error: {ssh_ex}")
+    except routerosapi.ApiError as api_ex:
+        show(f"API error: {api_ex}")
+    except socket.timeout:
+        show("Connection timed out. The router may be unreachable or slow to respond.")
+    except Exception as e:
+        show(f"Unexpected error: {e}")
+    finally:
+        close(session)
+        latencyhistory.record_run()
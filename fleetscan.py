@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+# Concurrent SSH reachability scanner for a list of routers.
+# Every router is probed with asyncio, so thousands of hosts are checked in roughly one
+# timeout instead of one timeout each. Results (banner, software, round trip time) are
+# cached on disk with a TTL so the collectors and backups can skip dead hosts, and skip
+# the probe entirely for hosts that were seen up a moment ago. Dead hosts are only
+# remembered for a few seconds, so one that comes back up isn't skipped for long.
+
+import argparse
+import asyncio
+import json
+import time
+
+import cachefile
+import latencyhistory
+import metrics
+import routerlist
+
+CACHE_PATH = cachefile.cache_path("scan.json")
+CACHE_TTL = 300
+# Unreachable results are kept much shorter, so a router that comes back up isn't skipped
+# for the whole TTL
+NEGATIVE_TTL = 15
+PROBE_TIMEOUT = 5
+CONCURRENCY = 500
+
+
+def parse_banner(banner):
+    # "SSH-2.0-ROSSSH" -> ("ROSSSH", ""). RouterOS doesn't put its version in the banner;
+    # anything after the software name (comments) is returned as the second value.
+    if not banner.startswith("SSH-"):
+        return "", ""
+    parts = banner.split("-", 2)
+    software, _, comment = (parts[2] if len(parts) > 2 else "").partition(" ")
+    return software, comment
+
+
+async def probe(host, port=22, timeout=PROBE_TIMEOUT):
+    # Connect, read the SSH banner and return a result dict
+    result = {"host": host, "port": port, "reachable": False, "banner": "", "software": "",
+              "comment": "", "rtt_ms": None, "error": "", "checked": time.time()}
+    started = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        result["rtt_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        banner = (await asyncio.wait_for(reader.readline(), timeout)).decode(errors="ignore").strip()
+        result["banner"] = banner
+        result["software"], result["comment"] = parse_banner(banner)
+        result["reachable"] = banner.startswith("SSH-")
+        if not result["reachable"]:
+            result["error"] = f"Unexpected response: {banner or 'No banner received'}"
+    except asyncio.TimeoutError:
+        result["error"] = "Timed out"
+    except ConnectionRefusedError:
+        result["error"] = "Connection refused"
+    except OSError as ex:
+        result["error"] = str(ex) or type(ex).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+    return result
+
+
+async def probe_all(hosts, port=22, timeout=PROBE_TIMEOUT, concurrency=CONCURRENCY, timeouts=None):
+    # Probe every host with at most `concurrency` connections in flight. timeouts can give
+    # some hosts their own timeout.
+    semaphore = asyncio.Semaphore(concurrency)
+    timeouts = timeouts or {}
+
+    async def bounded(host):
+        async with semaphore:
+            return await probe(host, port, timeouts.get(host, timeout))
+
+    return await asyncio.gather(*(bounded(host) for host in hosts))
+
+
+def cache_key(host, port):
+    return f"{host}:{port}"
+
+
+def load_cache(path=CACHE_PATH):
+    return cachefile.JsonCache(path).read()
+
+
+def save_cache(results, path=CACHE_PATH):
+    def add(cache):
+        for result in results:
+            cache[cache_key(result["host"], result["port"])] = result
+
+    cachefile.JsonCache(path).write(add)
+
+
+def is_fresh(entry, ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL):
+    if entry is None:
+        return False
+    return time.time() - entry.get("checked", 0) < (ttl if entry.get("reachable") else min(ttl, negative_ttl))
+
+
+def scan(hosts, port=22, timeout=PROBE_TIMEOUT, concurrency=CONCURRENCY, ttl=CACHE_TTL, cache_path=CACHE_PATH, refresh=False,
+         negative_ttl=NEGATIVE_TTL):
+    # Return a result for every host, probing only those without a fresh cache entry
+    cache = {} if refresh else load_cache(cache_path)
+    cached = {}
+    stale = []
+    for host in hosts:
+        entry = cache.get(cache_key(host, port))
+        if is_fresh(entry, ttl, negative_ttl):
+            cached[host] = entry
+        elif host not in stale:
+            stale.append(host)
+
+    # Hosts with a latency history are given up on sooner (or later) than `timeout`
+    timeouts = {host: latencyhistory.timeout(host, "probe", default=timeout) for host in stale}
+    probed = asyncio.run(probe_all(stale, port, timeout, concurrency, timeouts)) if stale else []
+    for result in probed:
+        if result["rtt_ms"] is not None:
+            metrics.observe("probe", result["host"], result["rtt_ms"] / 1000)
+    if probed and cache_path:
+        save_cache(probed, cache_path)
+    results = dict(cached)
+    results.update((result["host"], result) for result in probed)
+    return [results[host] for host in hosts]
+
+
+def check_host(host, port=22, timeout=PROBE_TIMEOUT, ttl=CACHE_TTL, cache_path=CACHE_PATH):
+    # Single-host variant used by the scripts' pre-check. Only a cached "reachable" is
+    # trusted; a host that was down is probed again, since the user is about to find out anyway.
+    return scan([host], port, timeout, 1, ttl, cache_path, negative_ttl=0)[0]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Checks SSH reachability of every router in a list concurrently.")
+    parser.add_argument("--list", type=str, required=True, help="Path to a file with one router per line.")
+    parser.add_argument("-P", "--port", type=int, default=22, help="SSH port to probe. Default: 22")
+    parser.add_argument("--timeout", type=float, default=PROBE_TIMEOUT, help=f"Seconds to wait per router without latency history. Default: {PROBE_TIMEOUT}")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help=f"Probes in flight at once. Default: {CONCURRENCY}")
+    parser.add_argument("--ttl", type=float, default=CACHE_TTL, help=f"Seconds a cached result stays valid. Unreachable results are re-probed after at most {NEGATIVE_TTL}s. Default: {CACHE_TTL}")
+    parser.add_argument("--cache", type=str, default=CACHE_PATH, help=f"Cache file. Default: {CACHE_PATH}")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached results and probe every router.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table.")
+    args = parser.parse_args(argv)
+
+    hosts = routerlist.read_routers(args.list)
+
+    started = time.perf_counter()
+    results = scan(hosts, args.port, args.timeout, args.concurrency, args.ttl, args.cache, args.refresh)
+    elapsed = time.perf_counter() - started
+    latencyhistory.record_run()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    up = [result for result in results if result["reachable"]]
+    for result in results:
+        if result["reachable"]:
+            print(f"  UP    {result['host']:<40}{result['rtt_ms']:>9.2f} ms  {result['banner']}")
+        else:
+            print(f"  DOWN  {result['host']:<40}{'':>12}  {result['error']}")
+    print("-" * 25)
+    print(f"{len(up)} of {len(results)} routers reachable on port {args.port} ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,93 +1,26 @@
 #!/usr/bin/python3
 
-import paramiko
-import getpass
-import argparse
-import socket
-import sys
-import re
+import collector
 
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Logs into MikroTik router and runs a single command.")
-parser.add_argument("-r", "--router-ip", type=str, help="Router IP or hostname (e.g. 192.168.10.1)")
-parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
-parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
-args = parser.parse_args()
 
-# Interactive prompts for missing args
-router_ip = args.router_ip or input("Enter router IP: ").strip()
-username = args.username or input("Username: ").strip()
-password = args.password or getpass.getpass("Password: ").strip()
-command = "/ip/arp/print"
+def format_entry(entry):
+    # One text-mode block per entry, written in one call
+    return (f"Interface: {entry.interface}\n"
+            f"  IP: {entry.address}\n"
+            f"  MAC: {entry.mac_address}\n"
+            f"  Status: {entry.status}\n"
+            f"{'-' * 25}\n")
 
-# Pre-check: test TCP connectivity
-try:
-    sock = socket.create_connection((router_ip, 22), timeout=5)
-    banner = sock.recv(1024).decode(errors="ignore")
-    sock.close()
-    if not banner.startswith("SSH-"):
-        print(f"Unexpected response on port 22: {banner.strip() or 'No banner received'}")
-        print("Check if SSH is enabled and accessible on the router.")
-        sys.exit(1)
-except (socket.timeout, ConnectionRefusedError):
-    print("Could not reach the router on port 22 (connection refused or timed out).")
-    print("Verify SSH is enabled and not blocked by a firewall.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Unexpected socket error: {e}")
-    sys.exit(1)
 
-# Create SSH client
-ssh_client = paramiko.SSHClient()
-ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+def get_arp(session):
+    # Yield the router's ARP entries as they are parsed
+    stream, records = collector.fetch(session, "arp")
+    return records
 
-try:
-    # Connect
-    ssh_client.connect(
-        hostname=router_ip,
-        username=username,
-        password=password,
-        port=22,
-        timeout=10,
-        banner_timeout=30,
-        auth_timeout=10,
-        look_for_keys=False,
-        allow_agent=False,
-    )
-    print("Connected to MikroTik router.")
 
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    output = stdout.read().decode("utf-8", errors="ignore").strip()
-    err = stderr.read().decode("utf-8", errors="ignore").strip()
+def main(argv=None, prog=None):
+    collector.main("arp", format_entry, "Logs into MikroTik router and prints its ARP table.", argv, prog)
 
-    if output:
-        print("\n--- Command Output ---")
-        print(output)
-    if err:
-        print("\n--- Command Error ---")
-        print(err)
 
-except paramiko.AuthenticationException:
-    print("Authentication failed. Check your username or password.")
-except paramiko.SSHException as ssh_ex:
-    print(f"SSH error: {ssh_ex}")
-except socket.timeout:
-    print("Connection timed out. The router may be unreachable or slow to respond.")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-finally:
-    ssh_client.close()
-
-pattern = r"^\s*?\d+\s+(?:X|DC|D)\s+(\d+\.\d+\.\d+\.\d+)\s+(?:(\w+:\w+:\w+:\w+:\w+:\w+)|\s*?)\s+(\S+)\s+(\S*)\s*?$"
-
-m = re.findall(rf"{pattern}", output, flags=re.MULTILINE)
-
-if m:
-    arp_table = m
-    print("-" * 25)
-    for entry in arp_table:
-        print(f"Interface: {entry[2]}")
-        print(f"  IP: {entry[0]}")
-        print(f"  MAC: {entry[1]}")
-        print(f"  Status: {entry[3]}")
-        print("-" * 25)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
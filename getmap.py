@@ -1,93 +1,198 @@
-import networkx as nx
-import matplotlib.pyplot as plt
-import paramiko
+#!/usr/bin/python3
+
+# Crawls the network from one or more seed routers by following /ip/neighbor entries and
+# builds a topology graph with networkx. The graph and each router's neighbor table are
+# kept in a state file, so later crawls only rewrite the edges of routers whose neighbor
+# tables changed. networkx is imported when a graph is first needed and matplotlib only
+# when --render is used.
+
+import collector
+import latencyhistory
+import metacache
+import routerosapi
+import sshsession
 import getpass
 import argparse
-import socket
-import sys
-import re
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Logs into MikroTik router and runs a single command.")
-parser.add_argument("-r", "--router-ip", type=str, help="Router IP or hostname (e.g. 192.168.10.1)")
-parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
-parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
-args = parser.parse_args()
-
-# Interactive prompts for missing args
-router_ip = args.router_ip or input("Enter router IP: ").strip()
-username = args.username or input("Username: ").strip()
-password = args.password or getpass.getpass("Password: ").strip()
-command = "/ip/neighbor/print"
-
-# Pre-check: test TCP connectivity
-try:
-    sock = socket.create_connection((router_ip, 22), timeout=5)
-    banner = sock.recv(1024).decode(errors="ignore")
-    sock.close()
-    if not banner.startswith("SSH-"):
-        print(f"Unexpected response on port 22: {banner.strip() or 'No banner received'}")
-        print("Check if SSH is enabled and accessible on the router.")
-        sys.exit(1)
-except (socket.timeout, ConnectionRefusedError):
-    print("Could not reach the router on port 22 (connection refused or timed out).")
-    print("Verify SSH is enabled and not blocked by a firewall.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Unexpected socket error: {e}")
-    sys.exit(1)
-
-# Create SSH client
-ssh_client = paramiko.SSHClient()
-ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-try:
-    # Connect
-    ssh_client.connect(
-        hostname=router_ip,
-        username=username,
-        password=password,
-        port=22,
-        timeout=10,
-        banner_timeout=30,
-        auth_timeout=10,
-        look_for_keys=False,
-        allow_agent=False,
-    )
-    print("Connected to MikroTik router.")
-
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    output = stdout.read().decode("utf-8", errors="ignore").strip()
-    err = stderr.read().decode("utf-8", errors="ignore").strip()
-
-    if output:
-        print("\n--- Command Output ---")
-        print(output)
-    if err:
-        print("\n--- Command Error ---")
-        print(err)
-
-except paramiko.AuthenticationException:
-    print("Authentication failed. Check your username or password.")
-except paramiko.SSHException as ssh_ex:
-    print(f"SSH error: {ssh_ex}")
-except socket.timeout:
-    print("Connection timed out. The router may be unreachable or slow to respond.")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-finally:
-    ssh_client.close()
-
-pattern = r"^\d+\s+(?P<interface>\S+)\s+(?P<ip_address>\d+\.\d+\.\d+\.\d+)\s+(?P<mac_address>[0-9A-F:]{17})\s+(?P<identity>\S+)\s*?$"
-
-m = re.findall(rf"{pattern}", output, flags=re.MULTILINE)
-
-if m:
-    print(m)
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STATE_PATH = "topology.json"
+
+
+def poll_router(router_ip, username, password, transport="ssh", api_port=None, ssh_port=sshsession.DEFAULT_PORT):
+    # Fetch a router's identity and neighbor table over one session
+    session = collector.connect(transport, router_ip, username, password, api_port, ssh_port)
+    try:
+        identity = metacache.router_identity(session)
+        stream, records = collector.fetch(session, "neighbors")
+        neighbors = list(records)
+    finally:
+        collector.close(session, router_ip)
+    return identity, neighbors
+
+
+def neighbors_hash(neighbors):
+    # Order-independent hash of the fields that define the topology
+    rows = sorted((entry.interface, entry.identity, entry.address, entry.mac_address) for entry in neighbors)
+    return hashlib.sha256(json.dumps(rows).encode()).hexdigest()
+
+
+def load_state(path):
+    import networkx as nx
+
+    if not os.path.exists(path):
+        return {"routers": {}}, nx.MultiGraph()
+    with open(path, "r") as file:
+        state = json.load(file)
+    graph = nx.node_link_graph(state.pop("graph"), multigraph=True, edges="edges")
+    return state, graph
+
+
+def save_state(path, state, graph):
+    import networkx as nx
+
+    data = dict(state, graph=nx.node_link_data(graph, edges="edges"))
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temp_path, path)
+
+
+def update_graph(graph, identity, router_ip, neighbors):
+    # Replace the edges this router reported with its current neighbor table
+    graph.add_node(identity, address=router_ip)
+    stale = [(u, v, key) for u, v, key, reporter in graph.edges(keys=True, data="reported_by") if reporter == identity]
+    graph.remove_edges_from(stale)
+    for entry in neighbors:
+        neighbor = entry.identity or entry.mac_address
+        if not graph.has_node(neighbor):
+            graph.add_node(neighbor)
+        attributes = graph.nodes[neighbor]
+        for field in ("address", "mac_address", "platform", "version", "board"):
+            value = getattr(entry, field)
+            if value and not attributes.get(field):
+                attributes[field] = value
+        graph.add_edge(identity, neighbor, key=f"{identity}:{entry.interface}", interface=entry.interface, reported_by=identity)
+
+
+def crawl(seeds, username, password, state, graph, max_depth=None, max_age=0, workers=8, transport="ssh",
+          api_port=None, ssh_port=sshsession.DEFAULT_PORT):
+    # Breadth-first crawl. Routers polled within max_age seconds are not polled again and
+    # their stored neighbor table is used to continue the crawl. Every router is reached on
+    # the same ports as the seeds.
+    routers = state["routers"]
+    seen = set(seeds)
+    level = list(seeds)
+    depth = 0
+    while level and (max_depth is None or depth <= max_depth):
+        to_poll = [ip for ip in level if time.time() - routers.get(ip, {}).get("polled", 0) >= max_age]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            polled = dict(zip(to_poll, executor.map(lambda ip: try_poll(ip, username, password, transport, api_port, ssh_port), to_poll)))
+
+        next_level = []
+        for router_ip in level:
+            if router_ip in polled:
+                identity, neighbors, error = polled[router_ip]
+                if error:
+                    print(f"  FAILED  {router_ip}: {error}")
+                    continue
+                digest = neighbors_hash(neighbors)
+                previous = routers.get(router_ip, {})
+                changed = previous.get("hash") != digest or not graph.has_node(identity)
+                if changed:
+                    update_graph(graph, identity, router_ip, neighbors)
+                routers[router_ip] = {
+                    "identity": identity,
+                    "hash": digest,
+                    "polled": time.time(),
+                    "neighbors": [entry.as_dict() for entry in neighbors],
+                }
+                print(f"  {'CHANGED' if changed else 'SAME':<8}{identity} ({router_ip}): {len(neighbors)} neighbors")
+            elif router_ip in routers:
+                print(f"  CACHED  {routers[router_ip]['identity']} ({router_ip})")
+            else:
+                continue
+
+            for entry in routers[router_ip]["neighbors"]:
+                if entry["address"] and entry["platform"] in ("", "MikroTik") and entry["address"] not in seen:
+                    seen.add(entry["address"])
+                    next_level.append(entry["address"])
+        level = next_level
+        depth += 1
+    return graph
+
+
+def try_poll(router_ip, username, password, transport="ssh", api_port=None, ssh_port=sshsession.DEFAULT_PORT):
+    # Returns (identity, neighbors, error) so one bad router doesn't stop the crawl
+    import paramiko
+
+    try:
+        identity, neighbors = poll_router(router_ip, username, password, transport, api_port, ssh_port)
+        return identity, neighbors, ""
+    except (paramiko.AuthenticationException, routerosapi.AuthenticationError):
+        return None, [], "Authentication failed"
+    except Exception as ex:
+        return None, [], str(ex) or type(ex).__name__
+
+
+def render(graph, path):
+    # matplotlib is heavy to import, so only load it when a picture is asked for
+    import matplotlib
+    import networkx as nx
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(16, 12))
+    layout = nx.spring_layout(graph, seed=1)
+    nx.draw_networkx(nx.Graph(graph), layout, node_size=300, font_size=8)
+    plt.axis("off")
+    figure.savefig(path, bbox_inches="tight")
+    plt.close(figure)
+
+
+def main(argv=None, prog=None):
+    # Argument parser setup
+    parser = argparse.ArgumentParser(prog=prog, description="Crawls MikroTik neighbor tables from seed routers and builds a topology graph.")
+    parser.add_argument("-r", "--router-ip", type=str, action="append", help="Seed router IP or hostname (e.g. 192.168.10.1). Repeat for several seeds.")
+    parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
+    parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
+    parser.add_argument("-P", "--port", type=int, default=sshsession.DEFAULT_PORT, help=f"SSH port. Default: {sshsession.DEFAULT_PORT}")
+    parser.add_argument("--max-depth", type=int, help="Stop following neighbors after this many hops from the seeds.")
+    parser.add_argument("--max-age", type=float, default=0, help="Don't re-poll routers polled within this many seconds. Default: 0")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Routers polled in parallel. Default: 8")
+    parser.add_argument("--state", type=str, default=STATE_PATH, help=f"State file holding the graph between crawls. Default: {STATE_PATH}")
+    parser.add_argument("--graphml", type=str, help="Write the graph as GraphML to this path.")
+    parser.add_argument("--json", type=str, help="Write the graph as node-link JSON to this path.")
+    parser.add_argument("--render", type=str, help="Draw the graph to this image file (loads matplotlib).")
+    collector.add_transport_argument(parser)
+    args = parser.parse_args(argv)
+    import networkx as nx
+
+    # Interactive prompts for missing args
+    seeds = args.router_ip or [input("Enter router IP: ").strip()]
+    username = args.username or input("Username: ").strip()
+    password = args.password or getpass.getpass("Password: ").strip()
+
+    state, graph = load_state(args.state)
+    started = time.perf_counter()
+    crawl(seeds, username, password, state, graph, args.max_depth, args.max_age, args.workers, args.transport,
+          args.api_port, args.port)
+    save_state(args.state, state, graph)
+    latencyhistory.record_run()
     print("-" * 25)
-    for entry in m:
-        print(f"Interface: {entry[0]}")
-        print(f"  IP: {entry[1]}")
-        print(f"  MAC: {entry[2]}")
-        print(f"  Identity: {entry[3]}")
-        print("-" * 25)
\ No newline at end of file
+    print(f"{graph.number_of_nodes()} devices, {graph.number_of_edges()} links ({time.perf_counter() - started:.2f}s)")
+
+    if args.graphml:
+        nx.write_graphml(graph, args.graphml)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(nx.node_link_data(graph, edges="edges"), file, indent=2)
+    if args.render:
+        render(graph, args.render)
+
+
+if __name__ == "__main__":
+    main()
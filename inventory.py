@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+
+# Collects the ARP, DHCP lease, address and neighbor tables from every router in a list
+# into a local SQLite database. Routers are polled concurrently over one SSH session each,
+# rows are inserted in batches by a single writer, and the tables are indexed on MAC, IP,
+# router and interface so lookups like "which port is this MAC on" come from the database
+# instead of another round of SSH sessions.
+
+import argparse
+import getpass
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fleetscan
+import latencyhistory
+import metrics
+import routerlist
+import sshsession
+import tableparser
+
+DATABASE = "inventory.db"
+BATCH_SIZE = 5000
+# Columns that get an index when a table has them
+INDEXED_COLUMNS = ("mac_address", "address", "router", "interface")
+
+
+def columns(record_type):
+    return ("router", "collected_at") + record_type.fields()
+
+
+def create_schema(connection):
+    for table, (command, record_type) in tableparser.TABLES.items():
+        column_list = ", ".join(f'"{column}"' for column in columns(record_type))
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_list})")
+        for column in INDEXED_COLUMNS:
+            if column in columns(record_type):
+                connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ("{column}")')
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS collections "
+        "(router TEXT PRIMARY KEY, collected_at REAL, rows INTEGER, error TEXT)"
+    )
+    connection.commit()
+
+
+def open_database(path=DATABASE):
+    connection = sqlite3.connect(path)
+    # WAL keeps readers working while a collection is being written
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    create_schema(connection)
+    return connection
+
+
+def put(batches, item, cancelled):
+    # Queue an item for the writer, giving up once the writer has stopped, so workers
+    # aren't left blocked on a full queue nobody drains
+    while not cancelled.is_set():
+        try:
+            batches.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+    raise RuntimeError("Collection cancelled")
+
+
+def collect_router(router_ip, username, password, port, batches, cancelled):
+    # Pull every table from one router over a single session and queue rows in batches
+    import paramiko
+
+    collected_at = time.time()
+    rows = 0
+    session = sshsession.RouterSession(router_ip, username, password, port)
+    try:
+        session.connect()
+        for table, (command, record_type) in tableparser.TABLES.items():
+            fields = record_type.fields()
+            batch = []
+            stream = session.stream(command)
+            for record in tableparser.parse(stream, record_type):
+                batch.append((router_ip, collected_at) + tuple(getattr(record, field) for field in fields))
+                if len(batch) >= BATCH_SIZE:
+                    put(batches, ("rows", table, batch), cancelled)
+                    rows += len(batch)
+                    batch = []
+            if batch:
+                put(batches, ("rows", table, batch), cancelled)
+                rows += len(batch)
+        error = ""
+    except paramiko.AuthenticationException:
+        error = "Authentication failed"
+    except Exception as ex:
+        error = str(ex) or type(ex).__name__
+    finally:
+        session.close()
+    metrics.observe("collect", router_ip, time.time() - collected_at, rows=rows)
+    put(batches, ("done", router_ip, collected_at, rows, error), cancelled)
+
+
+def write_batches(connection, batches, routers):
+    # Single writer: SQLite allows one writer at a time, so workers hand rows over a queue.
+    # Rows are staged in temporary tables and only replace a router's snapshot once the
+    # router has finished without errors; a router that fails partway keeps its last good
+    # snapshot and only its error is recorded.
+    for table in tableparser.TABLES:
+        connection.execute(f"CREATE TEMP TABLE IF NOT EXISTS staged_{table} AS SELECT * FROM main.{table} WHERE 0")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS temp.staged_{table}_router ON staged_{table} (router)")
+    inserts = {
+        table: f"INSERT INTO staged_{table} VALUES ({', '.join('?' for _ in columns(record_type))})"
+        for table, (command, record_type) in tableparser.TABLES.items()
+    }
+    results = []
+    while len(results) < routers:
+        item = batches.get()
+        if item[0] == "rows":
+            connection.executemany(inserts[item[1]], item[2])
+        else:
+            router_ip, collected_at, rows, error = item[1:]
+            for table in tableparser.TABLES:
+                if not error:
+                    connection.execute(f"DELETE FROM main.{table} WHERE router = ?", (router_ip,))
+                    connection.execute(f"INSERT INTO main.{table} SELECT * FROM staged_{table} WHERE router = ?", (router_ip,))
+                connection.execute(f"DELETE FROM staged_{table} WHERE router = ?", (router_ip,))
+            if error:
+                # collected_at and rows keep describing the snapshot that is still there
+                connection.execute(
+                    "INSERT INTO collections VALUES (?, NULL, 0, ?) ON CONFLICT (router) DO UPDATE SET error = excluded.error",
+                    (router_ip, error),
+                )
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO collections VALUES (?, ?, ?, ?)",
+                    (router_ip, collected_at, rows, error),
+                )
+            connection.commit()
+            results.append((router_ip, rows, error))
+            print(f"  {'OK' if not error else 'FAILED':<7}{router_ip}: {rows} rows{f' ({error})' if error else ''}")
+    return results
+
+
+def collect(routers, username, password, port=22, database=DATABASE, workers=16, skip_unreachable=True):
+    # Collect every router into the database and return (router, rows, error) per router
+    results = []
+    if skip_unreachable:
+        scan_results = fleetscan.scan(routers, port)
+        routers = [result["host"] for result in scan_results if result["reachable"]]
+        results += [(result["host"], 0, f"Unreachable: {result['error']}") for result in scan_results if not result["reachable"]]
+
+    connection = open_database(database)
+    batches = queue.Queue(maxsize=workers * 4)
+    cancelled = threading.Event()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            # Routers that took longest last time start first
+            for router_ip in latencyhistory.slowest_first(routers, "collect"):
+                executor.submit(collect_router, router_ip, username, password, port, batches, cancelled)
+            try:
+                results += write_batches(connection, batches, len(routers))
+            except BaseException:
+                # Release workers waiting to queue rows and drop routers not started yet
+                cancelled.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        connection.close()
+    return results
+
+
+def normalize_mac(mac):
+    # Accept aa-bb-cc-dd-ee-ff, aabb.ccdd.eeff, etc. and return AA:BB:CC:DD:EE:FF
+    digits = "".join(character for character in mac if character.isalnum()).upper()
+    return ":".join(digits[i:i + 2] for i in range(0, len(digits), 2))
+
+
+def find(connection, mac=None, ip=None):
+    # Look a MAC or IP up in every table that has it
+    column, value = ("mac_address", normalize_mac(mac)) if mac else ("address", ip)
+    matches = []
+    for table, (command, record_type) in tableparser.TABLES.items():
+        if column not in columns(record_type):
+            continue
+        fields = columns(record_type)
+        for row in connection.execute(f'SELECT * FROM {table} WHERE "{column}" = ?', (value,)):
+            matches.append((table, dict(zip(fields, row))))
+    return matches
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Collects ARP, DHCP, address and neighbor tables from a list of routers into SQLite.")
+    parser.add_argument("--list", type=str, help="Path to a file with one router per line.")
+    parser.add_argument("-P", "--port", type=int, default=22, help="SSH port. Default: 22")
+    parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
+    parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
+    parser.add_argument("--database", type=str, default=DATABASE, help=f"SQLite database path. Default: {DATABASE}")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="Routers collected in parallel. Default: 16")
+    parser.add_argument("--find-mac", type=str, help="Look up a MAC address in the database instead of collecting.")
+    parser.add_argument("--find-ip", type=str, help="Look up an IP address in the database instead of collecting.")
+    parser.add_argument("--metrics-json", type=str, help="Append per-phase timings as JSON lines to this file ('-' for stderr).")
+    parser.add_argument("--metrics-textfile", type=str, help="Write per-phase histograms to this Prometheus textfile when the run ends.")
+    args = parser.parse_args(argv)
+
+    if args.find_mac or args.find_ip:
+        connection = open_database(args.database)
+        started = time.perf_counter()
+        matches = find(connection, args.find_mac, args.find_ip)
+        elapsed = (time.perf_counter() - started) * 1000
+        for table, row in matches:
+            print(f"{table:<10} router={row['router']} interface={row.get('interface') or row.get('server', '')} "
+                  f"ip={row.get('address', '')} mac={row.get('mac_address', '')}")
+        print(f"{len(matches)} matches in {elapsed:.2f} ms")
+        connection.close()
+        return
+
+    # Interactive prompts for missing args
+    list_path = args.list or input("Router list: ").strip()
+    username = args.username or input("Username: ").strip()
+    password = args.password or getpass.getpass("Password: ").strip()
+    routers = routerlist.read_routers(list_path)
+
+    if args.metrics_json:
+        metrics.registry.open_json_log(args.metrics_json)
+    started = time.perf_counter()
+    results = collect(routers, username, password, args.port, args.database, args.workers)
+    failed = [result for result in results if result[2]]
+    print("-" * 25)
+    print(f"Collected {sum(result[1] for result in results)} rows from {len(results) - len(failed)} of "
+          f"{len(results)} routers in {time.perf_counter() - started:.2f}s into '{args.database}'")
+    # Keep an existing locate index current, so the next lookup doesn't pay for it
+    import locate
+
+    if os.path.exists(locate.index_path(args.database)):
+        index, updated = locate.update(args.database)
+        print(f"Updated the locate index for {updated} routers ({len(index)} entries)")
+    latencyhistory.record_run()
+    if args.metrics_textfile:
+        metrics.registry.write_textfile(args.metrics_textfile)
+    metrics.registry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+# Per-router latency history and the timeouts derived from it. At the end of a run the
+# slowest time each router took in each phase (TCP connect, key exchange, auth, probe,
+# every command) is taken from metrics.registry and kept on disk with the last few runs.
+# Timeouts are then a multiple of a router's slowest recent time, clamped to a floor and
+# ceiling per phase, so a fast router is given up on quickly and a router on a slow link
+# isn't cut off. Only phases that succeeded count: one that failed, typically by running
+# into its timeout, would otherwise raise the next timeout and let it grow to the ceiling.
+# Routers without enough history get the old fixed timeouts.
+# The per-router run times also order fleet runs slowest first, so the slowest routers
+# start early instead of deciding when the run ends.
+
+import cachefile
+
+CACHE_PATH = cachefile.cache_path("latency.json")
+# Runs remembered per router and phase
+SAMPLES = 20
+# Runs needed before a timeout is derived from them
+MIN_SAMPLES = 3
+# Timeout as a multiple of the slowest remembered time
+FACTOR = 4
+
+# phase -> (timeout without history, floor, ceiling) in seconds. "command" is per command.
+LIMITS = {
+    "probe": (5, 1, 15),
+    "tcp": (10, 2, 30),
+    "kex": (30, 5, 60),
+    "auth": (10, 3, 30),
+    "exec": (10, 2, 30),
+    "command": (300, 30, 1800),
+}
+# Whole-router phases the fleet scripts record, used for ordering
+RUN_PHASES = ("backup", "collect", "rollout")
+
+
+def history_key(phase, command=""):
+    return f"{phase} {command}" if command else phase
+
+
+class LatencyHistory(cachefile.JsonCache):
+    # The history file, keyed by router and then by phase, merged into at the end of a run
+
+    def __init__(self, path=CACHE_PATH):
+        super().__init__(path)
+
+    def samples(self, router, phase, command=""):
+        return self.load().get(router, {}).get(history_key(phase, command), [])
+
+    def timeout(self, router, phase, command="", default=None):
+        # Seconds to wait for this router in this phase (for "command", for this command)
+        initial, floor, ceiling = LIMITS[phase]
+        samples = self.samples(router, phase, command)
+        if len(samples) < MIN_SAMPLES:
+            return initial if default is None else default
+        return min(ceiling, max(floor, FACTOR * max(samples)))
+
+    def slowest_first(self, routers, phase):
+        # Routers ordered by their mean time in a RUN_PHASES phase, slowest first. Routers
+        # without history go first, since nothing says they are fast.
+        def mean(router):
+            samples = self.samples(router, phase)
+            return sum(samples) / len(samples) if samples else float("inf")
+
+        return sorted(routers, key=mean, reverse=True)
+
+    def record(self, registry):
+        # Add this run's slowest time per router and phase from a metrics.Registry. Only
+        # "command" is kept per command; other phases are timed per command too, but one
+        # timeout covers all of them. Timeout phases only take times that didn't fail;
+        # RUN_PHASES order routers, where a slow failure is as slow as a slow success.
+        observed = {}
+        with registry.lock:
+            for (phase, command, router), histogram in registry.histograms.items():
+                if phase in LIMITS:
+                    count, slowest = histogram.succeeded, histogram.max_succeeded
+                elif phase in RUN_PHASES:
+                    count, slowest = histogram.count, histogram.max
+                else:
+                    continue
+                if count:
+                    key = (router, history_key(phase, command if phase == "command" else ""))
+                    observed[key] = max(observed.get(key, 0.0), slowest)
+        if not observed:
+            return
+
+        def add(entries):
+            for (router, key), seconds in observed.items():
+                samples = entries.setdefault(router, {}).setdefault(key, [])
+                samples.append(round(seconds, 4))
+                del samples[:-SAMPLES]
+
+        self.write(add)
+
+
+# Process-wide history shared by everything imported into the same interpreter
+history = LatencyHistory()
+
+
+def timeout(router, phase, command="", default=None):
+    return history.timeout(router, phase, command, default)
+
+
+def slowest_first(routers, phase):
+    return history.slowest_first(routers, phase)
+
+
+def record_run():
+    # Called by the scripts when a run ends
+    import metrics
+
+    try:
+        history.record(metrics.registry)
+    except OSError as ex:
+        print(f"Could not save the latency history: {ex}")
@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+# Finds where a device lives: looks a MAC, IPv4 address or host name up in an index built
+# from the ARP, DHCP lease and neighbor tables that inventory collected into SQLite. MACs
+# are kept as 48-bit and IPv4 addresses as 32-bit integers in sorted arrays, and host names
+# as entries sorted by name, so a lookup is a binary search over arrays read straight from
+# a file next to the database. Before each lookup the collection times in the database are
+# compared with the ones the index was built from, and only routers collected since then
+# are read from the database again.
+#
+#   mikrotikautomation locate 00:11:22:33:44:55
+#   mikrotikautomation locate 10.0.0.15 --database fleet.db
+#   mikrotikautomation locate printer-2nd-floor
+
+import argparse
+import array
+import bisect
+import collections
+import json
+import os
+import re
+import socket
+import sqlite3
+import struct
+import sys
+import time
+
+import inventory
+
+MAGIC = b"MTLOCATE1\n"
+# table -> (interface, address, MAC, host name, status, last seen) of one router's entries.
+# Leases have no interface, so their DHCP server stands in for it.
+SOURCES = {
+    "arp": "SELECT interface, address, mac_address, '', status, '' FROM arp WHERE router = ?",
+    "dhcp": "SELECT server, address, mac_address, host_name, status, last_seen FROM dhcp WHERE router = ?",
+    "neighbors": "SELECT interface, address, mac_address, identity, '', '' FROM neighbors WHERE router = ?",
+}
+TABLE_NAMES = tuple(SOURCES)
+TABLE_NUMBERS = {table: number for number, table in enumerate(TABLE_NAMES)}
+# An entry is its table, the router and the SOURCES columns. The text columns are stored
+# as ids into one string table; collection times are kept per router.
+STRING_COLUMNS = ("router", "interface", "address", "mac", "host", "status", "last_seen")
+ENTRY_COLUMNS = ("table",) + STRING_COLUMNS
+# Array name -> typecode. The key arrays are sorted and *_rows holds the entry of each key.
+TYPECODES = dict(
+    {name: "I" for name in STRING_COLUMNS},
+    table="B",
+    mac_keys="Q",
+    mac_rows="I",
+    ip_keys="I",
+    ip_rows="I",
+    host_rows="I",
+)
+# aa:bb:cc:dd:ee:ff, aa-bb-cc-dd-ee-ff, aabb.ccdd.eeff or aabbccddeeff
+MAC_PATTERN = re.compile(
+    r"[0-9A-Fa-f]{2}([:-])(?:[0-9A-Fa-f]{2}\1){4}[0-9A-Fa-f]{2}"
+    r"|[0-9A-Fa-f]{4}\.[0-9A-Fa-f]{4}\.[0-9A-Fa-f]{4}"
+    r"|[0-9A-Fa-f]{12}"
+)
+MAC_SEPARATORS = re.compile(r"[:.\-]")
+
+
+def index_path(database):
+    return database + ".locate"
+
+
+def mac_to_int(mac):
+    # A MAC in one of the MAC_PATTERN notations -> 48-bit int, else None
+    if not MAC_PATTERN.fullmatch(mac.strip()):
+        return None
+    return int(MAC_SEPARATORS.sub("", mac.strip()), 16)
+
+
+def ip_to_int(address):
+    # Dotted IPv4 address, with or without a /prefix -> int, else None (IPv6, empty)
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, address.partition("/")[0]), "big")
+    except (OSError, ValueError):
+        return None
+
+
+def classify(query):
+    # ("ip", int), ("mac", int) or ("host", casefolded name). IPv4 is tried first, so a
+    # dotted address is never read as a MAC.
+    key = ip_to_int(query)
+    if key is not None:
+        return "ip", key
+    key = mac_to_int(query)
+    if key is not None:
+        return "mac", key
+    return "host", query.casefold()
+
+
+class LocationIndex:
+    # Entries stored column-wise in arrays, with the routers they were read from and when
+    # those were collected. Work is done per column and per distinct string rather than
+    # per entry, so an update doesn't cost a Python loop iteration for every entry kept.
+
+    def __init__(self, routers=None, strings=None, arrays=None):
+        self.routers = routers or {}
+        self.strings = strings or []
+        self.arrays = arrays or {name: array.array(typecode) for name, typecode in TYPECODES.items()}
+
+    def __len__(self):
+        return len(self.arrays["table"])
+
+    def remove(self, routers):
+        # Drop the entries read from these routers. add() appends a router's entries in one
+        # go and they are only ever removed together, so each router's entries are one
+        # contiguous block that can be cut out with a slice.
+        router_ids = {number for number, string in enumerate(self.strings) if string in routers}
+        counts = collections.Counter(self.arrays["router"])
+        for router_id in router_ids & counts.keys():
+            start = self.arrays["router"].index(router_id)
+            for name in ENTRY_COLUMNS:
+                del self.arrays[name][start:start + counts[router_id]]
+
+    def add(self, entries):
+        # Append (table, router, interface, address, mac, host, status, last seen) tuples
+        entries = list(entries)
+        if not entries:
+            return
+        ids = {string: number for number, string in enumerate(self.strings)}
+        tables, *columns = zip(*entries)
+        self.arrays["table"].extend(map(TABLE_NUMBERS.__getitem__, tables))
+        for name, values in zip(STRING_COLUMNS, columns):
+            self.arrays[name].extend([ids.setdefault(value or "", len(ids)) for value in values])
+        self.strings = list(ids)
+
+    def compact(self):
+        # Drop strings no entry uses any more, e.g. those of removed entries
+        used = set()
+        for name in STRING_COLUMNS:
+            used.update(self.arrays[name])
+        if len(used) == len(self.strings):
+            return
+        kept = sorted(used)
+        renumber = [0] * len(self.strings)
+        for number, old in enumerate(kept):
+            renumber[old] = number
+        self.strings = [self.strings[old] for old in kept]
+        for name in STRING_COLUMNS:
+            self.arrays[name] = array.array("I", map(renumber.__getitem__, self.arrays[name]))
+
+    def sort(self):
+        # Rebuild the sorted MAC, IP and host name arrays. Keys are worked out once per
+        # distinct string; entries without a key sort first (-1, "") and are left out.
+        rows = range(len(self))
+        for name, column, to_int in (("mac", "mac", mac_to_int), ("ip", "address", ip_to_int)):
+            by_id = [to_int(string) for string in self.strings]
+            by_id = [-1 if key is None else key for key in by_id]
+            keys = list(map(by_id.__getitem__, self.arrays[column]))
+            order = sorted(rows, key=keys.__getitem__)
+            first = bisect.bisect_left(order, 0, key=keys.__getitem__)
+            self.arrays[f"{name}_keys"] = array.array(TYPECODES[f"{name}_keys"], [keys[row] for row in order[first:]])
+            self.arrays[f"{name}_rows"] = array.array("I", order[first:])
+        folded = [string.casefold() for string in self.strings]
+        keys = list(map(folded.__getitem__, self.arrays["host"]))
+        order = sorted(rows, key=keys.__getitem__)
+        first = bisect.bisect_right(order, "", key=keys.__getitem__)
+        self.arrays["host_rows"] = array.array("I", order[first:])
+
+    def entry(self, row):
+        match = {"table": TABLE_NAMES[self.arrays["table"][row]]}
+        match.update((name, self.strings[self.arrays[name][row]]) for name in STRING_COLUMNS)
+        match["collected_at"] = self.routers.get(match["router"])
+        return match
+
+    def find(self, query):
+        # Entries for an IPv4 address, a MAC or a host name (see classify)
+        kind, key = classify(query)
+        if kind != "host":
+            keys, rows = self.arrays[f"{kind}_keys"], self.arrays[f"{kind}_rows"]
+            start = bisect.bisect_left(keys, key)
+            end = bisect.bisect_right(keys, key, start)
+        else:
+            host = self.arrays["host"]
+            strings = self.strings
+            rows = self.arrays["host_rows"]
+            start = bisect.bisect_left(rows, key, key=lambda row: strings[host[row]].casefold())
+            end = bisect.bisect_right(rows, key, start, key=lambda row: strings[host[row]].casefold())
+        return [self.entry(row) for row in rows[start:end]]
+
+    def save(self, path):
+        # Header (routers, strings and array sizes) as JSON, then the raw arrays. Arrays are
+        # in the machine's byte order; the index is a local cache, rebuilt when unreadable.
+        header = json.dumps({
+            "routers": self.routers,
+            "strings": self.strings,
+            "arrays": [[name, self.arrays[name].typecode, self.arrays[name].itemsize, len(self.arrays[name])] for name in TYPECODES],
+        }).encode()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(MAGIC + struct.pack("<I", len(header)) + header)
+            for name in TYPECODES:
+                self.arrays[name].tofile(file)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # The index saved at path, or None if there is none or it can't be used
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        offset = len(MAGIC) + 4
+        if not data.startswith(MAGIC) or len(data) < offset:
+            return None
+        try:
+            (header_size,) = struct.unpack_from("<I", data, len(MAGIC))
+            header = json.loads(data[offset:offset + header_size])
+            offset += header_size
+            arrays = {}
+            for name, typecode, itemsize, length in header["arrays"]:
+                values = array.array(typecode)
+                if values.itemsize != itemsize or TYPECODES.get(name) != typecode:
+                    return None
+                values.frombytes(data[offset:offset + itemsize * length])
+                offset += itemsize * length
+                arrays[name] = values
+        except (ValueError, KeyError, TypeError, struct.error):
+            return None
+        if set(arrays) != set(TYPECODES) or any(len(arrays[name]) != len(arrays["table"]) for name in ENTRY_COLUMNS):
+            return None
+        return cls(header["routers"], header["strings"], arrays)
+
+
+def update(database=inventory.DATABASE, path=None, rebuild=False):
+    # Bring the index of a database up to date and return (index, routers read again).
+    # Only routers whose collection time changed are read; the rest stay as indexed.
+    path = path or index_path(database)
+    index = None if rebuild else LocationIndex.load(path)
+    index = index or LocationIndex()
+    connection = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        # One read transaction, so a collection finishing meanwhile isn't half seen
+        connection.execute("BEGIN")
+        collected = dict(connection.execute("SELECT router, collected_at FROM collections"))
+        stale = {router for router, collected_at in collected.items() if index.routers.get(router) != collected_at}
+        removed = set(index.routers) - set(collected)
+        if not stale and not removed and os.path.exists(path):
+            return index, 0
+        index.remove(stale | removed)
+        for router in sorted(stale):
+            for table, query in SOURCES.items():
+                index.add((table, router) + row for row in connection.execute(query, (router,)))
+    finally:
+        connection.close()
+    index.routers = collected
+    index.compact()
+    index.sort()
+    index.save(path)
+    return index, len(stale)
+
+
+def format_match(match):
+    seen = match["last_seen"] or time.strftime("%Y-%m-%d %H:%M", time.localtime(match["collected_at"]))
+    details = [f"router={match['router']}", f"interface={match['interface']}", f"ip={match['address']}", f"mac={match['mac']}"]
+    details += [f"{field}={match[field]}" for field in ("host", "status") if match[field]]
+    return f"{match['table']:<10}" + " ".join(details) + f" last-seen={seen}"
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Finds the router, interface and lease a MAC address, IP address or host name was last seen on, using the inventory database.")
+    parser.add_argument("query", nargs="?", help="MAC address (any notation), IPv4 address or host name.")
+    parser.add_argument("--database", type=str, default=inventory.DATABASE, help=f"SQLite database written by inventory. Default: {inventory.DATABASE}")
+    parser.add_argument("--index", type=str, help="Index file. Default: the database path with '.locate' appended")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the whole database.")
+    parser.add_argument("--json", action="store_true", help="Print matches as JSON instead of one line each.")
+    args = parser.parse_args(argv)
+    if args.query is None and not args.rebuild:
+        parser.error("a MAC address, IP address or host name is required")
+    if not os.path.exists(args.database):
+        print(f"No inventory database at '{args.database}'. Run 'mikrotikautomation inventory' first.", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    try:
+        index, updated = update(args.database, args.index, args.rebuild)
+    except sqlite3.Error as ex:
+        print(f"Could not read '{args.database}': {ex}", file=sys.stderr)
+        return 1
+    if updated:
+        print(f"Indexed {updated} newly collected routers ({len(index)} entries) in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    if args.query is None:
+        return
+
+    started = time.perf_counter()
+    matches = index.find(args.query)
+    elapsed = (time.perf_counter() - started) * 1000
+    if args.json:
+        print(json.dumps(matches, indent=2))
+        return
+    for match in matches:
+        print(format_match(match))
+    print(f"{len(matches)} matches in {elapsed:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,48 @@
-def main():
-    print("Hello from mikrotikautomation!")
+#!/usr/bin/python3
+
+# Single entry point for the MikroTik tools: mikrotikautomation <command> [options].
+# Each command lives in its own module and is only imported when it is run, so --help and
+# the light commands don't pay for paramiko, networkx or matplotlib.
+
+import argparse
+import importlib
+import sys
+
+# command -> (module, help)
+COMMANDS = {
+    "run": ("runcommand", "Run one or more commands on a router over one session."),
+    "arp": ("getarp", "Print a router's ARP table."),
+    "dhcp": ("getdhcp", "Print a router's DHCP leases."),
+    "addresses": ("getaddresses", "Print a router's IP addresses."),
+    "neighbors": ("getmap", "Crawl neighbor tables and build a topology graph."),
+    "backup": ("mikrotikconfigbackup", "Back up one router or a list of routers."),
+    "scan": ("fleetscan", "Check SSH reachability of a list of routers."),
+    "inventory": ("inventory", "Collect fleet tables into a local SQLite database."),
+    "locate": ("locate", "Find the router and interface a MAC, IP or host name was seen on."),
+    "sessiond": ("sessiond", "Keep router sessions open for the other commands to reuse."),
+    "metadata": ("metacache", "Show or invalidate the cached router identity, version and board."),
+    "parse-dumps": ("parsedumps", "Parse saved table dumps offline into JSON Lines, CSV or text."),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="mikrotikautomation", description="Scripts for automating MikroTik routers.")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    for name, (module, help) in COMMANDS.items():
+        # Options belong to the command's own parser, which handles its --help too
+        subparsers.add_parser(name, help=help, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, remaining = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    module = importlib.import_module(COMMANDS[args.command][0])
+    return module.main(remaining, prog=f"mikrotikautomation {args.command}")
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+# On-disk cache of slow-changing router metadata: identity, RouterOS version, board name
+# and SSH host key fingerprint, keyed by host and port. Identity and version change a few
+# times a year, so the backup script and the collectors look them up here instead of
+# running /system/identity/print on every connection. Entries expire after a TTL, and an
+# entry whose host key no longer matches the router's is dropped, since that means the
+# address now belongs to a reinstalled or different router.
+#
+#   mikrotikautomation metadata                 show the cache
+#   mikrotikautomation metadata --invalidate 10.0.0.1
+#   mikrotikautomation metadata --clear
+
+import argparse
+import base64
+import hashlib
+import time
+
+import cachefile
+
+CACHE_PATH = cachefile.cache_path("metadata.json")
+CACHE_TTL = 24 * 3600
+
+
+def cache_key(host, port):
+    return f"{host}:{port}"
+
+
+def parse_identity(output):
+    # "name: core-router 1" -> "core-router 1"
+    return output.partition(":")[2].strip()
+
+
+def parse_resource(output):
+    # "  version: 7.14.2 (stable)\n  board-name: RB5009" -> {"version": ..., "board-name": ...}
+    values = {}
+    for line in output.splitlines():
+        key, separator, value = line.partition(":")
+        if separator:
+            values[key.strip()] = value.strip()
+    return values
+
+
+def host_key_fingerprint(session):
+    # OpenSSH style "SHA256:..." of the key the router presented; API sessions have none
+    transport = getattr(session, "transport", None)
+    if transport is None:
+        return ""
+    digest = hashlib.sha256(transport.get_remote_server_key().asbytes()).digest()
+    return "SHA256:" + base64.b64encode(digest).decode().rstrip("=")
+
+
+def fetch_metadata(session):
+    # Ask the router; works over SSH and the API since both run() return "key: value" lines
+    output, err, exit_status = session.run("/system/identity/print")
+    if exit_status != 0 or not parse_identity(output):
+        raise RuntimeError(f"Could not read the router identity: {err or 'empty reply'}")
+    metadata = {"identity": parse_identity(output)}
+    output, err, exit_status = session.run("/system/resource/print")
+    resource = parse_resource(output) if exit_status == 0 else {}
+    metadata["version"] = resource.get("version", "")
+    metadata["board"] = resource.get("board-name", "")
+    return metadata
+
+
+class MetadataCache(cachefile.JsonCache):
+    # The cache file, keyed by "host:port", with entries that expire after ttl seconds
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        super().__init__(path, indent=1)
+        self.ttl = ttl
+
+    def get(self, host, port):
+        # The cached entry if it is still within the TTL, else None
+        entry = self.load().get(cache_key(host, port))
+        if entry is None or time.time() - entry.get("checked", 0) >= self.ttl:
+            return None
+        return entry
+
+    def put(self, host, port, metadata):
+        entry = dict(metadata, checked=time.time())
+
+        def add(entries):
+            entries[cache_key(host, port)] = entry
+
+        self.write(add)
+        return entry
+
+    def invalidate(self, host=None, port=None):
+        # Drop the entries for one host (on one port, or all of its ports), or everything
+        def remove(entries):
+            for key in list(entries):
+                entry_host, _, entry_port = key.rpartition(":")
+                if (host is None or entry_host == host) and (port is None or entry_port == str(port)):
+                    del entries[key]
+
+        self.write(remove)
+
+    def lookup(self, session, refresh=False):
+        # Metadata for the router behind an open session, asking the router only when the
+        # entry is missing, expired, or was recorded for a different host key
+        fingerprint = host_key_fingerprint(session)
+        entry = None if refresh else self.get(session.router_ip, session.port)
+        if entry is not None and fingerprint and entry.get("host_key") != fingerprint:
+            entry = None
+        if entry is None:
+            metadata = fetch_metadata(session)
+            metadata["host_key"] = fingerprint
+            entry = self.put(session.router_ip, session.port, metadata)
+        return entry
+
+
+# Process-wide cache shared by everything imported into the same interpreter
+cache = MetadataCache()
+
+
+def lookup(session, refresh=False):
+    return cache.lookup(session, refresh)
+
+
+def router_identity(session, refresh=False):
+    return lookup(session, refresh)["identity"]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Shows or invalidates the cached router metadata (identity, version, board, host key).")
+    parser.add_argument("--invalidate", type=str, action="append", help="Drop the cached entries for this router. Repeatable.")
+    parser.add_argument("-P", "--port", type=int, help="With --invalidate, only drop the entry for this port.")
+    parser.add_argument("--clear", action="store_true", help="Drop every cached entry.")
+    parser.add_argument("--cache", type=str, default=CACHE_PATH, help=f"Cache file. Default: {CACHE_PATH}")
+    args = parser.parse_args(argv)
+
+    metadata_cache = MetadataCache(args.cache)
+    if args.clear:
+        metadata_cache.invalidate()
+        print(f"Cleared '{args.cache}'")
+        return
+    if args.invalidate:
+        for host in args.invalidate:
+            metadata_cache.invalidate(host, args.port)
+            print(f"Invalidated {host}{f':{args.port}' if args.port else ''}")
+        return
+
+    now = time.time()
+    for key, entry in sorted(metadata_cache.load().items()):
+        age = now - entry.get("checked", 0)
+        state = "fresh" if age < metadata_cache.ttl else "expired"
+        print(f"{key:<24}{entry.get('identity', ''):<24}{entry.get('version', ''):<20}{entry.get('board', ''):<20}"
+              f"{state} ({age / 3600:.1f}h)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+# Per-phase timers and byte counters for connections, commands and transfers.
+# The session layer, the scanner and the backup script record every phase (TCP connect,
+# key exchange, auth, command exec, exit status wait, SFTP transfer, ...) into one
+# process-wide registry. A run can stream each observation as a JSON line while it
+# happens and write a Prometheus textfile (per-router and fleet-wide histograms) at the
+# end, for node_exporter's textfile collector to pick up.
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def command_label(command):
+    # "/system backup save name=x password=y" -> "/system backup save".
+    # Arguments are dropped so passwords and file names never reach logs or labels.
+    words = []
+    for word in command.split():
+        if "=" in word:
+            break
+        words.append(word)
+    return " ".join(words)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max", "succeeded", "max_succeeded")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        # Observations that didn't end in an error, kept apart for the latency history:
+        # a phase that failed on its timeout says nothing about how long it needs
+        self.succeeded = 0
+        self.max_succeeded = 0.0
+
+    def observe(self, value, failed=False):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+        if not failed:
+            self.succeeded += 1
+            self.max_succeeded = max(self.max_succeeded, value)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+class Registry:
+    # Collects observations from every thread of the process
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (phase, command, router) -> Histogram
+        self.histograms = {}
+        # (phase, command, router) -> bytes
+        self.bytes = {}
+        self.json_log = None
+
+    def open_json_log(self, path):
+        # Write one JSON object per observation to path ("-" for stderr)
+        self.json_log = sys.stderr if path == "-" else open(path, "a")
+
+    def observe(self, phase, router, seconds, bytes=None, command="", **fields):
+        # Record one timed phase, optionally with the bytes it moved
+        key = (phase, command, router)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds, failed="error" in fields)
+            if bytes is not None:
+                self.bytes[key] = self.bytes.get(key, 0) + bytes
+            if self.json_log is not None:
+                entry = {"time": round(time.time(), 3), "router": router, "phase": phase, "seconds": round(seconds, 6)}
+                if command:
+                    entry["command"] = command
+                if bytes is not None:
+                    entry["bytes"] = bytes
+                entry.update(fields)
+                self.json_log.write(json.dumps(entry) + "\n")
+                self.json_log.flush()
+
+    @contextlib.contextmanager
+    def timer(self, phase, router, command="", **fields):
+        # Time a block. The yielded dict can be filled in with "bytes" or extra fields.
+        # A block that raises is still recorded, with the error.
+        extra = dict(fields)
+        started = time.perf_counter()
+        try:
+            yield extra
+        except BaseException as ex:
+            extra["error"] = type(ex).__name__
+            raise
+        finally:
+            self.observe(phase, router, time.perf_counter() - started, command=command, **extra)
+
+    def textfile(self):
+        # Prometheus text exposition of everything recorded so far
+        with self.lock:
+            histograms = {key: (list(value.counts), value.sum, value.count) for key, value in self.histograms.items()}
+            counters = dict(self.bytes)
+
+        # Fleet-wide histograms are the per-router ones summed over routers
+        fleet = {}
+        for (phase, command, router), (counts, total, count) in histograms.items():
+            merged = fleet.setdefault((phase, command), [[0] * len(BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+        lines = []
+
+        def histogram_lines(name, help, series):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (counts, total, count) in sorted(series.items()):
+                for bound, bucket in zip(BUCKETS, counts):
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {bucket}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        def labels_for(phase, command, router=None):
+            labels = (("phase", phase),)
+            if command:
+                labels += (("command", command),)
+            if router is not None:
+                labels += (("router", router),)
+            return labels
+
+        histogram_lines(
+            "mikrotik_phase_seconds", "Time spent in each phase, per router.",
+            {labels_for(*key): value for key, value in histograms.items()},
+        )
+        histogram_lines(
+            "mikrotik_fleet_phase_seconds", "Time spent in each phase across all routers.",
+            {labels_for(*key): value for key, value in fleet.items()},
+        )
+        lines.append("# HELP mikrotik_phase_bytes_total Bytes moved in each phase, per router.")
+        lines.append("# TYPE mikrotik_phase_bytes_total counter")
+        for key, count in sorted(counters.items()):
+            lines.append(f"mikrotik_phase_bytes_total{format_labels(labels_for(*key))} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Written atomically so the textfile collector never reads half a file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.textfile())
+        os.replace(temp_path, path)
+
+    def close(self):
+        if self.json_log is not None and self.json_log is not sys.stderr:
+            self.json_log.close()
+        self.json_log = None
+
+
+# Process-wide registry shared by everything imported into the same interpreter
+registry = Registry()
+
+
+def observe(phase, router, seconds, bytes=None, command="", **fields):
+    registry.observe(phase, router, seconds, bytes, command, **fields)
+
+
+def timer(phase, router, command="", **fields):
+    return registry.timer(phase, router, command, **fields)
@@ -6,71 +6,49 @@
 
 # This script connects to a MikroTik router and creates a backup file. Optionally you can pull the backup to the local system.
 
-import paramiko
+import sshsession
+import fleetscan
+import latencyhistory
+import metacache
+import metrics
+import routerlist
+import backupstore
+import sftptransfer
 import getpass
 import datetime
 import argparse
+import gzip
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Create an ArgumentParser object
-parser = argparse.ArgumentParser(description="Logs into MikroTik router and creates a config backup.")
-
-# Add arguments
-parser.add_argument("-r", "--router-ip", type=str, help="Hostname or remote IP address without CIDR notation. \nEx. 192.168.10.1 or router.org.lan")
-parser.add_argument("-P", "--port", type=int, help="Select the port to use. Default: 22")
-parser.add_argument("--list", type=str, help="Provide the path to a list. Ex. /home/user/Documents/list.txt")
-parser.add_argument("-u", "--username", type=str, help="Username Ex. admin")
-parser.add_argument("-p", "--password", type=str, help="Enter router password. If you skip this option then you will be prompted for it. (hides the pass)")
-parser.add_argument("-d", "--directory", type=str, help="Path to save config file. If backup is not defined then the remote copy and delete operations will be skipped. \nEx. C:\\backup\\")
-parser.add_argument("--delete", action="store_true", help="Delete the remote backup file from the router. Default: False")
-parser.add_argument("-e", "--encryption-password", type=str, help="Enter your backup encryption password.")
-
-# Parse the command-line arguments
-args = parser.parse_args()
-config = vars(args)
-# Output to test if arguments are being accepted
-print(config)
-
-# Assigning arguments to variables for SSH parameters
-# args values must be the later value and not the first one
-# Even though the argument above is router-ip this args value must be args.router_ip
-router_ip = args.router_ip
-port = args.port
-list = args.list
-username = args.username
-password = args.password
-directory = args.directory
-delete_remote_file = args.delete
-encryption_password = args.encryption_password
-
-# If arguments aren't supplied then ask user for input to define SSH parameters
-if args.router_ip is None:
-    # Prompt for Router IP
-    router_ip = input("Enter the IP address: ").strip()
-if args.port is None:
-    # Prompt for SSH port number
-    port = int(input("Enter an SSH port number: "))
-if args.username is None:
-    # Prompt for Username
-    username = input("Username: ").strip()
-if args.password is None:
-    # Prompt for Password
-    password = getpass.getpass(prompt="Password: ").strip()
-if args.directory is None:
-    # Prompt for Directory
-    directory = input("Enter the local backup directory: ").strip()
-if args.encryption_password is None:
-    # Prompt for Encryption Password
-    encryption_password = getpass.getpass(prompt="Encryption Password: ").strip()
-
-# Get routes from file and compose a list
-with open(f"{list}", "r") as file:
-    # Read lines and strip for routers
-    router_ip_addresses = [line.strip() for line in file.readlines()]
-
-# Print routers
-print("Listing routers...")
-print(router_ip_addresses)
+def build_parser(prog=None):
+    # Create an ArgumentParser object
+    parser = argparse.ArgumentParser(prog=prog, description="Logs into MikroTik router and creates a config backup.")
+
+    # Add arguments
+    parser.add_argument("-r", "--router-ip", type=str, help="Hostname or remote IP address without CIDR notation. \nEx. 192.168.10.1 or router.org.lan")
+    parser.add_argument("-P", "--port", type=int, help="Select the port to use. Default: 22")
+    parser.add_argument("--list", type=str, help="Provide the path to a list. Ex. /home/user/Documents/list.txt")
+    parser.add_argument("-u", "--username", type=str, help="Username Ex. admin")
+    parser.add_argument("-p", "--password", type=str, help="Enter router password. If you skip this option then you will be prompted for it. (hides the pass)")
+    parser.add_argument("-d", "--directory", type=str, help="Path to save config file. If backup is not defined then the remote copy and delete operations will be skipped. \nEx. C:\\backup\\")
+    parser.add_argument("--delete", action="store_true", help="Delete the remote backup file from the router. Default: False")
+    parser.add_argument("-e", "--encryption-password", type=str, help="Enter your backup encryption password.")
+    parser.add_argument("--export-mode", choices=["file", "stream"], default="file", help="'file' writes the export to the router and fetches it over SFTP. 'stream' pipes /export output straight into a local compressed file. Default: file")
+    parser.add_argument("--compression", choices=["gzip", "zstd", "none"], default="gzip", help="Compression for streamed exports. Default: gzip")
+    parser.add_argument("--store", action="store_true", help="Keep backups in a content-addressed store inside --directory. Unchanged exports are stored once and skip the system backup download. Default: False")
+    parser.add_argument("--sftp-window", type=int, default=64, help="Number of SFTP read requests kept in flight while downloading. Default: 64")
+    parser.add_argument("--retries", type=int, default=3, help="Times to retry an interrupted download, resuming from the partial file. Default: 3")
+    parser.add_argument("--ranges", type=int, default=1, help="Fetch large backup files as this many parallel byte ranges. Downloads are verified by size only; RouterOS can't checksum files over SFTP. Default: 1")
+    parser.add_argument("--skip-unreachable", action="store_true", help="Probe every router concurrently first and skip the ones that don't answer on the SSH port. Default: False")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of routers to back up in parallel. Default: 1")
+    parser.add_argument("--refresh-metadata", action="store_true", help="Ask every router for its identity instead of using the metadata cache. Default: False")
+    parser.add_argument("--metrics-json", type=str, help="Append per-phase timings as JSON lines to this file ('-' for stderr).")
+    parser.add_argument("--metrics-textfile", type=str, help="Write per-phase histograms to this Prometheus textfile when the run ends.")
+    return parser
 
 # Define function to append endswitch to path if there isn't one
 def save_endswitch_to_path(path):
@@ -79,149 +57,381 @@ def save_endswitch_to_path(path):
         path += os.path.sep # Append a endswitch to the path
     return path
 
-# Call function to append endswitch to directory path if it's defined and it's blank
-if "directory" in globals() and directory != "":
-    directory = save_endswitch_to_path(directory)
+def parse_options(argv=None, prog=None):
+    # Parse the command-line arguments
+    options = build_parser(prog).parse_args(argv)
+    # Output to test if arguments are being accepted
+    print({key: value for key, value in vars(options).items() if "password" not in key})
 
-# Create SSH and SFTP clients
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    # If arguments aren't supplied then ask user for input to define SSH parameters
+    if options.router_ip is None and options.list is None:
+        # Prompt for Router IP
+        options.router_ip = input("Enter the IP address: ").strip()
+    if options.port is None:
+        # Prompt for SSH port number
+        options.port = int(input("Enter an SSH port number: "))
+    if options.username is None:
+        # Prompt for Username
+        options.username = input("Username: ").strip()
+    if options.password is None:
+        # Prompt for Password
+        options.password = getpass.getpass(prompt="Password: ").strip()
+    if options.directory is None:
+        # Prompt for Directory
+        options.directory = input("Enter the local backup directory: ").strip()
+    if options.encryption_password is None:
+        # Prompt for Encryption Password
+        options.encryption_password = getpass.getpass(prompt="Encryption Password: ").strip()
 
-# Get current date and time for backup file naming
-now = datetime.datetime.now()
+    # Append endswitch to directory path if it's defined and it's not blank
+    if options.directory != "":
+        options.directory = save_endswitch_to_path(options.directory)
 
-try:
-    def connect_to_router(router_ip, port, username, password):
-        # Connect to the router
-        ssh.connect(router_ip, port=port, username=username, password=password)
-        print(f"Connected to {router_ip} MikroTik router.")
-
-    def get_router_identity():
-        # Get router identity
-        global router_identity
-        identity_command = "/system/identity/print"
-        stdin, stdout, stderr = ssh.exec_command(identity_command)
-        router_identity = stdout.read().decode("utf-8").strip().split()[1]
-        # return router_identity
-
-    def name_files(router_identity):
-        global cfg_bak_filename
-        cfg_bak_filename = f"{router_identity}_cfg_backup_{now.strftime('%Y-%m-%d-%H%M%S')}"
-        cfg_bak_filename = f"{cfg_bak_filename}.rsc"
-        global sys_bak_filename
-        sys_bak_filename = f"{router_identity}_sys_backup_{now.strftime('%Y-%m-%d-%H%M%S')}"
-        sys_bak_filename = f"{sys_bak_filename}.backup"
-        # return cfg_bak_filename, sys_bak_filename
-
-    def execute_backups():
-        # Execute the config backup command
+    # Content-addressed store shared by all workers
+    options.backup_store = backupstore.BackupStore(options.directory) if options.store and options.directory else None
+    if options.store and options.backup_store is None:
+        print("The backup store needs a local backup directory. Falling back to plain backups.")
+
+    # Get current date and time for backup file naming
+    options.now = datetime.datetime.now()
+    return options
+
+def read_router_list(options):
+    # Get routers from the list file, or use the single router given with -r
+    if options.list is None:
+        return [options.router_ip]
+    return routerlist.read_routers(options.list)
+
+# Serialise printing so output from parallel workers doesn't interleave mid-line
+print_lock = threading.Lock()
+
+def log(router_ip, message):
+    # Prefix every message with the router so parallel output stays readable
+    with print_lock:
+        print(f"[{router_ip}] {message}")
+
+def connect_to_router(router_ip, port, username, password):
+    # Open a dedicated session for this router; every command below reuses its transport
+    session = sshsession.RouterSession(router_ip, username, password, port).connect()
+    log(router_ip, f"Connected to {router_ip} MikroTik router.")
+    return session
+
+def get_router_identity(session, refresh=False):
+    # Get router identity from the metadata cache; the router is only asked when the cached
+    # entry is missing, expired or belongs to a different host key
+    return metacache.router_identity(session, refresh)
+
+def name_files(router_identity, now, router_ip, port):
+    # File names only keep letters, digits, '.' and '-' of the identity. Identities aren't
+    # unique (every router starts out as "MikroTik") and the timestamp is the same for the
+    # whole run, so the host and port are part of the name too; otherwise parallel workers
+    # would download into, and resume from, each other's files.
+    file_identity = backupstore.safe_name(f"{router_identity}_{router_ip}-{port}")
+    cfg_bak_filename = f"{file_identity}_cfg_backup_{now.strftime('%Y-%m-%d-%H%M%S')}"
+    cfg_bak_filename = f"{cfg_bak_filename}.rsc"
+    sys_bak_filename = f"{file_identity}_sys_backup_{now.strftime('%Y-%m-%d-%H%M%S')}"
+    sys_bak_filename = f"{sys_bak_filename}.backup"
+    return cfg_bak_filename, sys_bak_filename
+
+def open_compressed(path, compression):
+    # Open a local file for writing with the requested compression
+    if compression == "gzip":
+        return gzip.open(path, "wb")
+    if compression == "zstd":
+        # Standard library since Python 3.14
+        from compression import zstd
+        return zstd.open(path, "wb")
+    return open(path, "wb")
+
+def stream_export(session, router_ip, cfg_bak_filename, options):
+    # Pipe /export output from the channel into a local compressed file, hashing it on the way
+    suffix = {"gzip": ".gz", "zstd": ".zst", "none": ""}[options.compression]
+    cfg_bak_path = options.directory + cfg_bak_filename + suffix
+    checksum = hashlib.sha256()
+    size = 0
+    stream = session.stream("/export")
+    try:
+        with open_compressed(cfg_bak_path, options.compression) as file:
+            for chunk in stream.chunks():
+                checksum.update(chunk)
+                file.write(chunk)
+                size += len(chunk)
+    except Exception:
+        # Don't leave a truncated export behind
+        if os.path.exists(cfg_bak_path):
+            os.remove(cfg_bak_path)
+        raise
+    finally:
+        stream.close()
+
+    if size == 0:
+        os.remove(cfg_bak_path)
+        log(router_ip, "Config export was empty. Backup may have failed.")
+        return None, None
+
+    # Record the checksum of the uncompressed export next to it, in sha256sum format
+    digest = checksum.hexdigest()
+    with open(f"{cfg_bak_path}.sha256", "w") as file:
+        file.write(f"{digest}  {cfg_bak_filename}\n")
+    log(router_ip, f"Config export streamed to '{cfg_bak_path}' ({size} bytes, sha256 {digest}).")
+    return cfg_bak_path, digest
+
+def command_failed(router_ip, command, err, exit_status):
+    # RouterOS reports most failures as text with exit status 0, so treat stderr as failure too
+    if exit_status == 0 and not err.strip():
+        return None
+    message = f"'{command.split(' password=')[0]}' failed (exit {exit_status}): {err.strip() or 'no error output'}"
+    log(router_ip, f"{message}. Backup may have failed.")
+    return message
+
+def execute_backups(session, router_ip, cfg_bak_filename, sys_bak_filename, options):
+    # Execute the backup commands and wait for them to complete. Returns None, or the
+    # error of the first command that failed.
+    # (The config backup is skipped when the export is streamed instead of written to the router)
+    if cfg_bak_filename is not None:
         cfg_bak_cmd = f"/export file={cfg_bak_filename}"
-        stdin, stdout, stderr = ssh.exec_command(cfg_bak_cmd)
-        # Wait for the command to complete
-        stdout.channel.recv_exit_status()
-        # Rename config backup variable for file checks
-        # global cfg_bak_filename
-        # cfg_bak_filename = f"{cfg_bak_filename}.rsc"
-
-        # Execute the system backup command
-        if "encryption_password" in globals() and encryption_password != "":
-            print("System backup will be encrypted with aes-sha256 and provided password.")
-            sys_bak_cmd = f"/system backup save name={sys_bak_filename} password={encryption_password}"
-            stdin, stdout, stderr = ssh.exec_command(sys_bak_cmd)
-            # Wait for the command to complete
-            stdout.channel.recv_exit_status()
-            output = stdout.read().decode('utf-8')
-        else:
-            print("WARNING! System backup will not be encrypted. No password provided.")
-            sys_bak_cmd = f"/system backup save name={sys_bak_filename} dont-encrypt yes"
-            stdin, stdout, stderr = ssh.exec_command(sys_bak_cmd)
-            # Wait for the command to complete
-            stdout.channel.recv_exit_status()
-            output = stdout.read().decode('utf-8')
-        # Rename System backup variable for file checks
-        # global sys_bak_filename
-        # sys_bak_filename = f"{sys_bak_filename}.backup"
-        # return output, cfg_bak_filename, sys_bak_filename
-
-    def verify_backup_creation(cfg_bak_filename, sys_bak_filename):
-        # Check if the backup file was created successfully
-        sftp_client = ssh.open_sftp()
-        global remote_files
-        remote_files = sftp_client.listdir()
-
-        # Check that the config backup file was created
-        if cfg_bak_filename in remote_files:
-            cfg_bak_filesize = sftp_client.stat(cfg_bak_filename).st_size
-            if cfg_bak_filesize > 0:
-                print(f"Config backup completed successfully. Configuration saved as '{cfg_bak_filename}'.")
-            else:
-                print("Config backup file size is 0. Backup may have failed.")
-        else:
-            print("Config backup file not found. Backup may have failed.")
-    
-        # Check that the system backup file was created
-        if sys_bak_filename in remote_files:
-            sys_bak_filesize = sftp_client.stat(sys_bak_filename).st_size
-            if sys_bak_filesize > 0:
-                print(f"System backup completed successfully. Configuration saved as '{sys_bak_filename}'.")
-            else:
-                print("System backup file size is 0. Backup may have failed.")
+        output, err, exit_status = session.run(cfg_bak_cmd)
+        failed = command_failed(router_ip, cfg_bak_cmd, err, exit_status)
+        if failed:
+            return failed
+
+    # Execute the system backup command
+    if options.encryption_password:
+        log(router_ip, "System backup will be encrypted with aes-sha256 and provided password.")
+        sys_bak_cmd = f"/system backup save name={sys_bak_filename} password={options.encryption_password}"
+    else:
+        log(router_ip, "WARNING! System backup will not be encrypted. No password provided.")
+        sys_bak_cmd = f"/system backup save name={sys_bak_filename} dont-encrypt yes"
+    # Wait for the command to complete
+    output, err, exit_status = session.run(sys_bak_cmd)
+    return command_failed(router_ip, sys_bak_cmd, err, exit_status)
+
+def remote_size(sftp_client, router_ip, filename):
+    # Size of a file on the router, or None if it doesn't exist
+    try:
+        with metrics.timer("sftp_stat", router_ip):
+            return sftp_client.stat(filename).st_size
+    except FileNotFoundError:
+        return None
+
+def verify_backup_creation(session, router_ip, cfg_bak_filename, sys_bak_filename):
+    # Check if the backup files were created successfully with direct stat calls
+    sftp_client = session.open_sftp()
+    remote_sizes = {}
+    verified = True
+
+    # Check that the config backup file was created (not applicable to streamed exports)
+    if cfg_bak_filename is not None:
+        cfg_bak_filesize = remote_size(sftp_client, router_ip, cfg_bak_filename)
+        if cfg_bak_filesize is None:
+            log(router_ip, "Config backup file not found. Backup may have failed.")
+            verified = False
+        elif cfg_bak_filesize > 0:
+            remote_sizes[cfg_bak_filename] = cfg_bak_filesize
+            log(router_ip, f"Config backup completed successfully. Configuration saved as '{cfg_bak_filename}'.")
         else:
-            print("System backup file not found. Backup may have failed.")
-        # return remote_files
+            log(router_ip, "Config backup file size is 0. Backup may have failed.")
+            verified = False
+
+    # Check that the system backup file was created
+    sys_bak_filesize = remote_size(sftp_client, router_ip, sys_bak_filename)
+    if sys_bak_filesize is None:
+        log(router_ip, "System backup file not found. Backup may have failed.")
+        verified = False
+    elif sys_bak_filesize > 0:
+        remote_sizes[sys_bak_filename] = sys_bak_filesize
+        log(router_ip, f"System backup completed successfully. Configuration saved as '{sys_bak_filename}'.")
+    else:
+        log(router_ip, "System backup file size is 0. Backup may have failed.")
+        verified = False
+    return remote_sizes, verified
+
+def fetch_file(session, router_ip, filename, local_path, options):
+    # Resumable download: an interrupted attempt leaves a .part file the next one continues
+    import paramiko
 
-    def download_backups(cfg_bak_filename, sys_bak_filename, remote_files):
-        # Backup files to local directory
-        sftp_client = ssh.open_sftp()
-        if cfg_bak_filename in remote_files and directory:
-            # Define local path for the config backup file
-            cfg_bak_path = directory + cfg_bak_filename
-            sys_bak_path = directory + sys_bak_filename
+    for attempt in range(1, options.retries + 2):
+        started = time.perf_counter()
+        try:
+            with metrics.timer("sftp_download", router_ip, attempt=attempt) as phase:
+                fetched, size, digest = sftptransfer.download(session.open_sftp(), filename, local_path, options.sftp_window, options.ranges)
+                phase["bytes"] = fetched
+            break
+        except (OSError, EOFError, paramiko.SSHException, sftptransfer.TransferError) as ex:
+            if attempt > options.retries:
+                raise
+            log(router_ip, f"Download of '{filename}' failed ({ex}). Retrying ({attempt}/{options.retries})...")
+            # Drop the broken transport; open_sftp() reconnects on the next attempt
+            session.close()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    log(router_ip, f"Fetched '{filename}': {fetched} of {size} bytes in {elapsed:.2f}s ({fetched / elapsed / 1024:.1f} KiB/s), local sha256 {digest}")
+    return size
 
+def download_backups(session, router_ip, cfg_bak_filename, sys_bak_filename, remote_sizes, options):
+    # Backup files to local directory; streamed exports pass cfg_bak_filename=None
+    remote_backups = [filename for filename in (cfg_bak_filename, sys_bak_filename) if filename is not None]
+    found = all(filename in remote_sizes for filename in remote_backups)
+    if found and options.directory:
+        for filename in remote_backups:
             # Download the backup file to the local directory
-            sftp_client.get(cfg_bak_filename, cfg_bak_path)
-            print(f"Config backup copied to '{cfg_bak_path}'")
-            sftp_client.get(sys_bak_filename, sys_bak_path)
-            print(f"System backup copied to '{sys_bak_path}'")
-
-            # Remove the backup file from the router (optional)
-            if delete_remote_file == True:
-                sftp_client.remove(cfg_bak_filename)
-                print(f"Config backup file '{cfg_bak_filename}' removed from the router.")
-                sftp_client.remove(sys_bak_filename)
-                print(f"System backup file '{sys_bak_filename}' removed from the router.")
-    
-        elif cfg_bak_filename in remote_files and not directory:
-            print("Local backup directory not provided. Skipping file transfer and deletion.")
- 
-        else:
-            print(f"An error occurred! Backup file not found!")
-
-except paramiko.AuthenticationException:
-    print("Authentication failed. Please check your credentials.")
-except paramiko.SSHException as ssh_ex:
-    print(f"Error occurred while connecting to the router: {ssh_ex}")
-except Exception as ex:
-    print(f"An error occurred: {ex}")
-# finally:
-
-def main():
-    for router_ip in router_ip_addresses:
-        print(f"Starting process on {router_ip}...")
+            local_path = options.directory + filename
+            fetch_file(session, router_ip, filename, local_path, options)
+            log(router_ip, f"Backup copied to '{local_path}'")
+
+        # Remove the backup files from the router (optional)
+        if options.delete == True:
+            for filename in remote_backups:
+                session.open_sftp().remove(filename)
+                log(router_ip, f"Backup file '{filename}' removed from the router.")
+        return True
+
+    elif found and not options.directory:
+        log(router_ip, "Local backup directory not provided. Skipping file transfer and deletion.")
+        return True
+
+    else:
+        log(router_ip, f"An error occurred! Backup file not found!")
+        return False
+
+def store_backups(session, router_ip, router_identity, sys_bak_filename, options):
+    # Stream the export into the store and only take and fetch a system backup when it changed
+    store = options.backup_store
+    stream = session.stream("/export")
+    try:
+        export_digest, export_path, stored = store.put_export(stream.chunks())
+    finally:
+        stream.close()
+    if export_digest is None:
+        log(router_ip, "Config export was empty. Backup may have failed.")
+        return False, "Config export was empty"
+
+    latest = store.latest(router_identity, router_ip, options.port)
+    if latest is not None and latest["export"] == export_digest:
+        store.record(router_identity, router_ip, options.port, export_digest, latest["backup"])
+        log(router_ip, f"Config unchanged since {latest['created']} ({export_digest[:12]}). Skipping system backup.")
+        return True, f"Unchanged ({export_digest[:12]})"
+
+    # The config changed, so take a fresh system backup and add it to the store
+    failed = execute_backups(session, router_ip, None, sys_bak_filename, options)
+    if failed:
+        return False, failed
+    remote_sizes, verified = verify_backup_creation(session, router_ip, None, sys_bak_filename)
+    if not verified:
+        return False, "System backup missing or empty on the router"
+    temp_path = store.temp_file()
+    try:
+        fetch_file(session, router_ip, sys_bak_filename, temp_path, options)
+    except Exception:
+        os.remove(temp_path)
+        sftptransfer.discard(temp_path)
+        raise
+    backup_digest, backup_path, _ = store.put_file(temp_path, ".backup")
+    if options.delete == True:
+        session.open_sftp().remove(sys_bak_filename)
+        log(router_ip, f"Backup file '{sys_bak_filename}' removed from the router.")
+
+    store.record(router_identity, router_ip, options.port, export_digest, backup_digest)
+    log(router_ip, f"New config version {export_digest[:12]} stored as '{export_path}', system backup as '{backup_path}'.")
+    return True, f"New version ({export_digest[:12]})"
+
+def backup_router(router_ip, options):
+    # Run the full backup sequence for one router and return (router_ip, succeeded, message)
+    import paramiko
+
+    log(router_ip, f"Starting process on {router_ip}...")
+    started = time.perf_counter()
+    session = None
+    try:
         # Connect to the router
-        connect_to_router(router_ip, port, username, password)
+        session = connect_to_router(router_ip, options.port, options.username, options.password)
         # Fetch the router identity
-        get_router_identity()
+        router_identity = get_router_identity(session, options.refresh_metadata)
         # Create backup file names
-        name_files(router_identity)
+        cfg_bak_filename, sys_bak_filename = name_files(router_identity, options.now, router_ip, options.port)
+        if options.backup_store is not None:
+            # The store always streams the export; it decides whether a system backup is needed
+            stored, message = store_backups(session, router_ip, router_identity, sys_bak_filename, options)
+            return router_ip, stored, message
+        if options.export_mode == "stream":
+            # Stream the export straight to disk; nothing is written to the router's flash
+            if not options.directory:
+                log(router_ip, "Streaming the export needs a local backup directory.")
+                return router_ip, False, "No local backup directory for streamed export"
+            cfg_bak_path, digest = stream_export(session, router_ip, cfg_bak_filename, options)
+            if cfg_bak_path is None:
+                return router_ip, False, "Config export was empty"
+            cfg_bak_filename = None
         # Create the backups
-        execute_backups()
+        failed = execute_backups(session, router_ip, cfg_bak_filename, sys_bak_filename, options)
+        if failed:
+            return router_ip, False, failed
         # Verify that the backup was created
-        verify_backup_creation(cfg_bak_filename, sys_bak_filename)
+        remote_sizes, verified = verify_backup_creation(session, router_ip, cfg_bak_filename, sys_bak_filename)
         # Download the backups using SFTP to local directory
-        download_backups(cfg_bak_filename, sys_bak_filename, remote_files)
+        downloaded = download_backups(session, router_ip, cfg_bak_filename, sys_bak_filename, remote_sizes, options)
+        if verified and downloaded:
+            return router_ip, True, f"Backed up as '{router_identity}'"
+        return router_ip, False, "Backup files missing or empty on the router"
+    except paramiko.AuthenticationException:
+        log(router_ip, "Authentication failed. Please check your credentials.")
+        return router_ip, False, "Authentication failed"
+    except paramiko.SSHException as ssh_ex:
+        log(router_ip, f"Error occurred while connecting to the router: {ssh_ex}")
+        return router_ip, False, f"SSH error: {ssh_ex}"
+    except Exception as ex:
+        log(router_ip, f"An error occurred: {ex}")
+        return router_ip, False, f"Error: {ex}"
+    finally:
         # Close the SSH connection
-        ssh.close()
+        if session is not None:
+            session.close()
+        metrics.observe("backup", router_ip, time.perf_counter() - started)
+
+def print_summary(results):
+    # Print a per-router success/failure summary
+    succeeded = [result for result in results if result[1]]
+    failed = [result for result in results if not result[1]]
+    print("-" * 25)
+    print(f"Backup summary: {len(succeeded)} succeeded, {len(failed)} failed")
+    for router_ip, ok, message in results:
+        status = "OK" if ok else "FAILED"
+        print(f"  {status:<7}{router_ip}: {message}")
+    print("-" * 25)
+
+def main(argv=None, prog=None):
+    options = parse_options(argv, prog)
+    router_ip_addresses = read_router_list(options)
+    if options.metrics_json:
+        metrics.registry.open_json_log(options.metrics_json)
+
+    # Print routers
+    print("Listing routers...")
+    print(router_ip_addresses)
+
+    results = []
+    targets = router_ip_addresses
+    if options.skip_unreachable:
+        # One concurrent scan up front, so dead routers don't each cost a connect timeout
+        scan_results = fleetscan.scan(router_ip_addresses, options.port)
+        targets = [result["host"] for result in scan_results if result["reachable"]]
+        for result in scan_results:
+            if not result["reachable"]:
+                log(result["host"], f"Skipping unreachable router: {result['error']}")
+                results.append((result["host"], False, f"Unreachable: {result['error']}"))
+
+    # Each router gets its own SSH session, so routers can be processed in parallel.
+    # Routers that took longest last time start first, so they don't finish the run alone.
+    workers = max(1, min(options.workers, len(targets) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results += executor.map(lambda router_ip: backup_router(router_ip, options), latencyhistory.slowest_first(targets, "backup"))
+    position = {router_ip: i for i, router_ip in enumerate(router_ip_addresses)}
+    results.sort(key=lambda result: position.get(result[0], len(position)))
+    print_summary(results)
+    latencyhistory.record_run()
+
+    if options.metrics_textfile:
+        metrics.registry.write_textfile(options.metrics_textfile)
+    metrics.registry.close()
 
 if __name__ == "__main__":
     main()
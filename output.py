@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+# Output layer for table records: --format text|jsonl|csv and --output. Each writer turns
+# a record into one string and hands it to a single write on a large buffer, so dumping a
+# big table costs one call per record and one syscall per buffer instead of several
+# print() calls per entry. Text stays the default; jsonl and csv are for piping into
+# other tools. New formats are added to WRITERS.
+
+import csv
+import io
+import json
+import operator
+import sys
+
+BUFFER_SIZE = 1 << 20
+SEPARATOR = "-" * 25
+
+
+def open_output(path=None):
+    # Returns (file, owned). stdout ("-" or no path) is reopened on its descriptor with a
+    # bigger buffer; what print() buffered before is flushed first so the order holds.
+    if path not in (None, "-"):
+        return open(path, "w", buffering=BUFFER_SIZE, encoding="utf-8", newline=""), True
+    sys.stdout.flush()
+    try:
+        return open(sys.stdout.fileno(), "w", buffering=BUFFER_SIZE, encoding="utf-8", newline="", closefd=False), True
+    except (AttributeError, ValueError, io.UnsupportedOperation):
+        # stdout replaced by something without a descriptor (e.g. redirected in-process)
+        return sys.stdout, False
+
+
+class Writer:
+    # Writes records of one tableparser record type; extra holds fixed fields (e.g. the
+    # router) put in front of every record by the structured formats. headings=False
+    # leaves out the CSV header row, for output that is appended to another writer's.
+
+    def __init__(self, file, record_type, extra=None, format_entry=None, owned=False, headings=True):
+        self.file = file
+        self.owned = owned
+        self.headings = headings
+        self.fields = tuple(extra or {}) + record_type.fields()
+        self.extra = tuple((extra or {}).values())
+        self.values = operator.attrgetter(*record_type.fields())
+        self.format_entry = format_entry
+        self.count = 0
+        self.header()
+
+    def header(self):
+        pass
+
+    def render(self, record):
+        raise NotImplementedError
+
+    def write(self, record):
+        self.file.write(self.render(record))
+        self.count += 1
+
+    def write_all(self, records):
+        write = self.file.write
+        render = self.render
+        for record in records:
+            write(render(record))
+            self.count += 1
+        return self.count
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TextWriter(Writer):
+    # The collectors' readable blocks, or "field: value" lines for record types without one
+
+    def render(self, record):
+        if self.format_entry is not None:
+            return self.format_entry(record)
+        lines = [f"{field}: {value}" for field, value in zip(self.fields, self.extra + self.values(record))]
+        return "\n".join(lines) + f"\n{SEPARATOR}\n"
+
+
+def json_value(value):
+    if isinstance(value, str):
+        return json.encoder.encode_basestring(value)
+    return "null" if value is None else json.dumps(value)
+
+
+class JsonLinesWriter(Writer):
+    # Keys and the extra fields are encoded once into a template. Every record field is a
+    # string apart from the index (an int, or None for API records), so the rest go
+    # through the C string encoder in one map().
+
+    def header(self):
+        extra = "".join(f"{json_value(field)}: {json_value(value)}, " for field, value in zip(self.fields, self.extra))
+        keys = ", ".join(f"{json_value(field)}: %s" for field in self.fields[len(self.extra):])
+        self.template = "{" + extra.replace("%", "%%") + keys + "}\n"
+
+    def render(self, record, encode_string=json.encoder.encode_basestring):
+        values = self.values(record)
+        return self.template % (json_value(values[0]), *map(encode_string, values[1:]))
+
+
+class CsvWriter(Writer):
+    # The csv module already hands each formatted row to the file in one write
+
+    def header(self):
+        self.csv = csv.writer(self.file)
+        if self.headings:
+            self.csv.writerow(self.fields)
+
+    def write(self, record):
+        self.csv.writerow(self.extra + self.values(record))
+        self.count += 1
+
+    def write_all(self, records):
+        writerow = self.csv.writerow
+        extra = self.extra
+        values = self.values
+        for record in records:
+            writerow(extra + values(record))
+            self.count += 1
+        return self.count
+
+
+WRITERS = {
+    "text": TextWriter,
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+}
+FORMATS = tuple(WRITERS)
+
+
+def add_output_arguments(parser, default="text"):
+    parser.add_argument("--format", choices=FORMATS, default=default, help=f"Output format. Default: {default}")
+    parser.add_argument("-o", "--output", type=str, help="Write records to this file instead of stdout.")
+
+
+def open_writer(format, record_type, path=None, extra=None, format_entry=None):
+    # A writer for --format/--output; use it as a context manager so it gets flushed
+    file, owned = open_output(path)
+    return WRITERS[format](file, record_type, extra, format_entry, owned)
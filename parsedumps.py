@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+# Offline parser for saved table dumps: "print terse" (or "print detail") output that was
+# archived to files, or plain "print" output, which is recognised by its "#" column header
+# and read by column position. Every file is memory-mapped, files larger than --chunk-size are split
+# on line boundaries (entry boundaries for detail output), and the chunks are parsed by a
+# pool of processes with the same record types as the live collectors. Workers render
+# their records too and hand back finished output, which is written in file and chunk
+# order. Only a few chunks per worker are in flight at a time, so memory stays bounded
+# however large the archive is. A file that can't be read, or that no entry could be read
+# from, is reported and makes the run exit with status 1.
+#
+#   mikrotikautomation parse-dumps -t dhcp archive/ -o leases.jsonl
+#   mikrotikautomation parse-dumps -t arp --format csv dumps/*.txt > arp.csv
+
+import argparse
+import collections
+import concurrent.futures
+import io
+import itertools
+import mmap
+import os
+import re
+import sys
+import time
+
+import output
+import tableparser
+
+CHUNK_SIZE = 16 * 1024 * 1024
+# Chunks submitted per worker ahead of the one being written
+IN_FLIGHT = 2
+# An entry in detail output ends at a blank line
+DETAIL_BOUNDARY = re.compile(rb"\n[ \t\r]*\n")
+# Column header of plain print output ("#   ADDRESS   MAC-ADDRESS ..."), looked for at the
+# start of a file
+COLUMN_HEADER = re.compile(rb"^[ \t]*#[ \t]+[A-Z][^\r\n]*", re.MULTILINE)
+HEADER_SEARCH_SIZE = 64 * 1024
+
+
+def dump_files(paths):
+    # Files named on the command line, and every file under named directories, in order
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(names):
+                    yield os.path.join(directory, name)
+        else:
+            yield path
+
+
+def column_header(path):
+    # The column header line of a plain print dump, None for terse or detail output
+    with open(path, "rb") as file:
+        match = COLUMN_HEADER.search(file.read(HEADER_SEARCH_SIZE))
+    return match.group().decode("utf-8", errors="replace") if match else None
+
+
+def split_chunks(path, chunk_size, detail=False):
+    # (start, end) byte ranges of about chunk_size that never cut an entry in two
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    if size <= chunk_size:
+        return [(0, size)]
+    chunks = []
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = start + chunk_size
+            if end >= size:
+                end = size
+            elif detail:
+                match = DETAIL_BOUNDARY.search(data, end - 1)
+                end = match.end() if match else size
+            else:
+                newline = data.find(b"\n", end - 1)
+                end = size if newline < 0 else newline + 1
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def parse_chunk(path, start, end, table, detail, format, header=None):
+    # Parse one byte range of a dump and return (path, records, rendered output). Runs in a
+    # worker process, so only the finished text is sent back instead of pickled records.
+    record_type = tableparser.TABLES[table][1]
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode("utf-8", errors="replace")
+    if header is None:
+        records = tableparser.parse_text(text, record_type, detail)
+    else:
+        # Chunks after the first need the file's header to know where the columns are
+        records = tableparser.parse_columns(itertools.chain([header], text.splitlines()), record_type)
+    buffer = io.StringIO()
+    writer = output.WRITERS[format](buffer, record_type, {"file": path}, headings=False)
+    count = writer.write_all(records)
+    return path, count, buffer.getvalue()
+
+
+def ordered_results(executor, function, tasks, limit):
+    # Like executor.map, but with at most limit tasks submitted at a time, so a large
+    # archive isn't read into memory ahead of the writer
+    pending = collections.deque()
+    for task in tasks:
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, *task))
+    while pending:
+        yield pending.popleft().result()
+
+
+def parse_dumps(paths, table, format="jsonl", output_path=None, workers=None, chunk_size=CHUNK_SIZE, detail=False):
+    # Parse every dump into one output and return (files, records, files that failed)
+    workers = workers or os.cpu_count() or 1
+    # path -> entries read from it, for every file that could be opened
+    counts = {}
+    failed = []
+
+    def tasks():
+        for path in dump_files(paths):
+            try:
+                header = column_header(path)
+                # Plain print output has an entry per line, whatever --detail says
+                chunks = split_chunks(path, chunk_size, detail and header is None)
+            except (OSError, ValueError) as ex:
+                print(f"Skipping '{path}': {ex}", file=sys.stderr)
+                failed.append(path)
+                continue
+            counts[path] = 0
+            for start, end in chunks:
+                yield path, start, end, table, detail, format, header
+
+    with output.open_writer(format, tableparser.TABLES[table][1], output_path, {"file": ""}) as writer:
+        if workers == 1:
+            for path, count, text in (parse_chunk(*task) for task in tasks()):
+                writer.file.write(text)
+                writer.count += count
+                counts[path] += count
+        else:
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                for path, count, text in ordered_results(executor, parse_chunk, tasks(), workers * IN_FLIGHT):
+                    writer.file.write(text)
+                    writer.count += count
+                    counts[path] += count
+    for path, count in counts.items():
+        if not count:
+            print(f"No {table} entries found in '{path}'; is it a dump of that table?", file=sys.stderr)
+            failed.append(path)
+    return len(counts), writer.count, failed
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Parses saved RouterOS table dumps (print terse, print detail or plain print output) into one JSON Lines, CSV or text output.")
+    parser.add_argument("paths", nargs="+", help="Dump files, or directories whose files are all read.")
+    parser.add_argument("-t", "--table", choices=tableparser.TABLES, required=True, help="Table the dumps hold.")
+    parser.add_argument("--detail", action="store_true", help="The dumps are 'print detail' output instead of 'print terse'.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Parser processes. Default: one per CPU")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"Bytes per chunk large files are split into. Default: {CHUNK_SIZE}")
+    output.add_output_arguments(parser, default="jsonl")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    files, records, failed = parse_dumps(args.paths, args.table, args.format, args.output, args.workers, args.chunk_size, args.detail)
+    elapsed = time.perf_counter() - started
+    print(f"Parsed {records} entries from {files} files in {elapsed:.2f}s ({records / elapsed if elapsed else 0:,.0f} entries/s)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
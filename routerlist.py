@@ -0,0 +1,21 @@
+#!/usr/bin/python3
+
+# Router list files, as taken by --list in every fleet command: one router per line,
+# optionally followed by the router's site ("10.0.0.1 branch-3"), which `run` uses for its
+# per-site limits. Blank lines and anything after a "#" are ignored.
+
+
+def read_targets(path):
+    # "router [site]" per line -> [(router, site)]
+    targets = []
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split("#", 1)[0].split()
+            if fields:
+                targets.append((fields[0], fields[1] if len(fields) > 1 else ""))
+    return targets
+
+
+def read_routers(path):
+    # Just the routers of a list file, in list order
+    return [router for router, _ in read_targets(path)]
@@ -0,0 +1,373 @@
+#!/usr/bin/python3
+
+# Client for the RouterOS API (TCP 8728, or TLS on 8729 for the api-ssl service).
+# The API speaks length-prefixed words grouped into sentences, so replies arrive as
+# attribute dicts and nothing has to be scraped from printed tables. Every request is
+# sent with a .tag and one reader thread routes replies by tag, so many queries can be
+# in flight on the same connection at once.
+
+import queue
+import shlex
+import socket
+import threading
+import time
+
+import latencyhistory
+import metrics
+
+API_PORT = 8728
+API_TLS_PORT = 8729
+# Longest wait for the next reply sentence of a request before giving up
+REPLY_TIMEOUT = 60
+
+# API paths for the tables in tableparser.TABLES. The API needs full menu names where
+# the CLI accepts abbreviations.
+TABLE_PATHS = {
+    "arp": "/ip/arp/print",
+    "dhcp": "/ip/dhcp-server/lease/print",
+    "addresses": "/ip/address/print",
+    "neighbors": "/ip/neighbor/print",
+}
+
+# CLI print options that only change how text is laid out; API replies are always structured
+LAYOUT_OPTIONS = {"terse", "detail", "brief", "without-paging", "value-list"}
+# CLI "where" comparisons the API query words can express: "a<b" is "?<a=b" and "a!=b" is
+# "?a=b" negated by "?#!". Conditions are ANDed, as in the API.
+WHERE_OPERATORS = (("!=", "?{}={}", "?#!"), ("<", "?<{}={}", None), (">", "?>{}={}", None), ("=", "?{}={}", None))
+
+
+class ApiError(Exception):
+    # A !trap or !fatal reply, or a connection that failed mid-request
+
+    def __init__(self, message, category=None):
+        super().__init__(message)
+        self.category = category
+
+
+class AuthenticationError(ApiError):
+    pass
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes((length,))
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xF0" + length.to_bytes(4, "big")
+
+
+def encode_sentence(words):
+    # Each word is its length followed by its bytes; an empty word ends the sentence
+    data = bytearray()
+    for word in words:
+        encoded = word.encode("utf-8")
+        data += encode_length(len(encoded))
+        data += encoded
+    data += b"\x00"
+    return bytes(data)
+
+
+def split_sentence(buffer, position):
+    # Decode the sentence starting at buffer[position]. Returns (words, position after it),
+    # or None if the buffer doesn't hold the whole sentence yet.
+    words = []
+    end = len(buffer)
+    while position < end:
+        first = buffer[position]
+        if first < 0x80:
+            length, size = first, 1
+        elif first < 0xC0:
+            length, size = first & 0x3F, 2
+        elif first < 0xE0:
+            length, size = first & 0x1F, 3
+        elif first < 0xF0:
+            length, size = first & 0x0F, 4
+        else:
+            length, size = 0, 5
+        if position + size > end:
+            return None
+        for i in range(1, size):
+            length = (length << 8) | buffer[position + i]
+        position += size
+        if length == 0:
+            return words, position
+        if position + length > end:
+            return None
+        words.append(buffer[position:position + length].decode("utf-8", errors="replace"))
+        position += length
+    return None
+
+
+class SentenceReader:
+    # Reads sentences from a socket in large chunks instead of one read call per word
+
+    def __init__(self, sock, chunk_size=65536):
+        self.sock = sock
+        self.chunk_size = chunk_size
+        self.buffer = b""
+        self.position = 0
+
+    def read_sentence(self):
+        while True:
+            sentence = split_sentence(self.buffer, self.position)
+            if sentence is not None:
+                words, self.position = sentence
+                return words
+            chunk = self.sock.recv(self.chunk_size)
+            if not chunk:
+                raise ApiError("Connection closed by the router")
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+
+
+def parse_sentence(words):
+    # ["!re", "=address=10.0.0.1", ".tag=3"] -> ("!re", "3", {"address": "10.0.0.1"})
+    reply = words[0] if words else ""
+    tag = None
+    attributes = {}
+    for word in words[1:]:
+        if word.startswith("="):
+            key, _, value = word[1:].partition("=")
+            attributes[key] = value
+        elif word.startswith(".tag="):
+            tag = word[5:]
+    return reply, tag, attributes
+
+
+def where_query(condition):
+    # 'interface=bridge' -> ['?interface=bridge']; anything else raises ValueError
+    for operator, query, suffix in WHERE_OPERATORS:
+        key, found, value = condition.partition(operator)
+        if found and key and not any(character in key for character in "!<>=~"):
+            return [query.format(key, value)] + ([suffix] if suffix else [])
+    raise ValueError(f"Can't translate the condition '{condition}' into an API query; "
+                     "only 'where' with name=value, name!=value, name<value and name>value joined by 'and' is supported")
+
+
+def api_command(command):
+    # Translate CLI syntax into API words:
+    # '/ip address add address=10.0.0.1/24 interface=ether1' ->
+    # ['/ip/address/add', '=address=10.0.0.1/24', '=interface=ether1']
+    # '/ip arp print where interface=bridge' -> ['/ip/arp/print', '?interface=bridge']
+    # proplist= and .proplist= become the =.proplist= argument. API query words (?...) and
+    # .tag, the only bare "." word, are passed through as they are.
+    path = []
+    arguments = []
+    tokens = shlex.split(command)
+    if "where" in tokens:
+        position = tokens.index("where")
+        tokens, conditions = tokens[:position], tokens[position + 1:]
+        if not conditions:
+            raise ValueError(f"Nothing follows 'where' in '{command}'")
+        queries = [where_query(condition) for condition in conditions if condition != "and"]
+    else:
+        queries = []
+    for token in tokens:
+        if token.startswith(("?", ".tag=")):
+            arguments.append(token)
+        elif token.startswith(("proplist=", ".proplist=")):
+            arguments.append(f"=.{token.lstrip('.')}")
+        elif "=" in token:
+            arguments.append(f"={token}")
+        elif token not in LAYOUT_OPTIONS:
+            path += [part for part in token.split("/") if part]
+    return ["/" + "/".join(path)] + arguments + [word for query in queries for word in query]
+
+
+class ApiReply:
+    # Iterable over the attribute dicts (!re sentences) of one tagged request as they
+    # arrive. Like sshsession.CommandStream, err and exit_status are set once it has
+    # been consumed; "done" holds the attributes of the final !done (e.g. "ret").
+
+    def __init__(self, session, tag, command, timeout=REPLY_TIMEOUT):
+        self.session = session
+        self.tag = tag
+        self.command = metrics.command_label(command)
+        self.timeout = timeout
+        self.sentences = queue.Queue()
+        self.started = time.perf_counter()
+        self.records = 0
+        self.err = ""
+        self.exit_status = None
+        self.done = {}
+
+    def __iter__(self):
+        while self.exit_status is None:
+            try:
+                reply, attributes = self.sentences.get(timeout=self.timeout)
+            except queue.Empty:
+                # Late replies to this tag are dropped from here on
+                self.session.release(self.tag)
+                raise TimeoutError(f"No reply to '{self.command}' within {self.timeout}s")
+            if reply == "!re":
+                self.records += 1
+                yield attributes
+            elif reply == "!trap":
+                # A !done still follows a trap
+                self.err = attributes.get("message", "Command failed")
+            elif reply == "!done":
+                self.done = attributes
+                self.finish(1 if self.err else 0)
+            elif reply == "!fatal":
+                self.finish(1)
+                raise ApiError(attributes.get("message", "Connection closed by the router"))
+
+    def finish(self, exit_status):
+        self.exit_status = exit_status
+        self.session.release(self.tag)
+        metrics.observe("command", self.session.router_ip, time.perf_counter() - self.started, command=self.command,
+                        records=self.records, exit_status=exit_status)
+
+    def cancel(self):
+        # Ask the router to stop this request (used for listen); it ends with a trap and !done
+        if self.exit_status is None:
+            self.session.send(["/cancel", f"=tag={self.tag}"])
+
+    def close(self):
+        if self.exit_status is None:
+            self.cancel()
+            for _ in self:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ApiSession:
+    # One logged-in API connection to a router that multiplexes tagged requests
+
+    def __init__(self, router_ip, username, password, port=None, tls=False, timeout=REPLY_TIMEOUT):
+        self.router_ip = router_ip
+        self.username = username
+        self.password = password
+        self.tls = tls
+        self.port = port or (API_TLS_PORT if tls else API_PORT)
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.pending = {}
+        self.next_tag = 0
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        # Requests handed to the router so far, as on sshsession.RouterSession
+        self.commands_sent = 0
+
+    def connect(self):
+        with metrics.timer("tcp", self.router_ip):
+            sock = socket.create_connection((self.router_ip, self.port), timeout=latencyhistory.timeout(self.router_ip, "tcp"))
+        try:
+            if self.tls:
+                with metrics.timer("tls", self.router_ip):
+                    sock = self.wrap_tls(sock)
+            self.sock = sock
+            self.reader = SentenceReader(sock)
+            with metrics.timer("auth", self.router_ip):
+                self.login()
+        except BaseException:
+            sock.close()
+            raise
+        # The reader thread blocks on the socket; timeouts are per request from here on
+        sock.settimeout(None)
+        threading.Thread(target=self.read_replies, daemon=True).start()
+        return self
+
+    def wrap_tls(self, sock):
+        # api-ssl runs with a self-signed certificate, or none at all (anonymous DH), so
+        # like the SSH side nothing about the router's identity is verified
+        import ssl
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.set_ciphers("DEFAULT:ADH:@SECLEVEL=0")
+        return context.wrap_socket(sock, server_hostname=self.router_ip)
+
+    def login(self):
+        # Post-6.43 login: name and password in one /login sentence
+        self.sock.sendall(encode_sentence(["/login", f"=name={self.username}", f"=password={self.password}"]))
+        while True:
+            reply, tag, attributes = parse_sentence(self.reader.read_sentence())
+            if reply == "!done":
+                return
+            if reply in ("!trap", "!fatal"):
+                raise AuthenticationError(attributes.get("message", "Login failed"))
+
+    def send(self, words):
+        with self.send_lock:
+            self.sock.sendall(encode_sentence(words))
+
+    def read_replies(self):
+        # Route every reply sentence to the request it is tagged with
+        try:
+            while True:
+                reply, tag, attributes = parse_sentence(self.reader.read_sentence())
+                if reply == "!fatal":
+                    raise ApiError(attributes.get("message", "Connection closed by the router"))
+                with self.lock:
+                    pending = self.pending.get(tag)
+                if pending is not None:
+                    pending.sentences.put((reply, attributes))
+        except (ApiError, OSError, ValueError) as ex:
+            # The connection is gone; fail every request still waiting on it
+            with self.lock:
+                pending, self.pending = list(self.pending.values()), {}
+            for reply in pending:
+                reply.sentences.put(("!fatal", {"message": str(ex) or "Connection closed by the router"}))
+
+    def request(self, command, timeout=None):
+        # Send a command (CLI syntax or a list of API words) and return its ApiReply
+        words = api_command(command) if isinstance(command, str) else list(command)
+        with self.lock:
+            self.next_tag += 1
+            tag = str(self.next_tag)
+            reply = ApiReply(self, tag, " ".join(words), self.timeout if timeout is None else timeout)
+            self.pending[tag] = reply
+            self.commands_sent += 1
+        self.send(words + [f".tag={tag}"])
+        return reply
+
+    def release(self, tag):
+        with self.lock:
+            self.pending.pop(tag, None)
+
+    def talk(self, command):
+        # Send a command and return all of its records; a trap raises ApiError
+        reply = self.request(command)
+        records = list(reply)
+        if reply.err:
+            raise ApiError(reply.err)
+        return records
+
+    def stream(self, command):
+        return self.request(command)
+
+    def run(self, command):
+        # Same contract as RouterSession.run: (output, error, exit status). Records are
+        # shown as "key: value" lines, separated by blank lines when there are several.
+        reply = self.request(command)
+        blocks = ["\n".join(f"{key}: {value}" for key, value in attributes.items()) for attributes in reply]
+        if reply.done:
+            blocks.append("\n".join(f"{key}: {value}" for key, value in reply.done.items()))
+        return "\n\n".join(blocks), reply.err, reply.exit_status
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,80 +1,349 @@
 #!/usr/bin/python3
 
-import paramiko
+# Runs commands on one router, or rolls them out across a router list (--list) with
+# bounded concurrency, per-site limits, retries and a canary stage, writing a JSON or CSV
+# report of every router's output and status.
+
+import collector
+import latencyhistory
+import metrics
+import routerlist
+import routerosapi
+import sshsession
 import getpass
 import argparse
+import contextlib
+import csv
+import json
+import random
 import socket
-import sys
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Logs into MikroTik router and runs a single command.")
-parser.add_argument("-r", "--router-ip", type=str, help="Router IP or hostname (e.g. 192.168.10.1)")
-parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
-parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
-parser.add_argument("-c", "--command", type=str, help="Command to execute on the router")
-args = parser.parse_args()
-
-# Interactive prompts for missing args
-router_ip = args.router_ip or input("Enter router IP: ").strip()
-username = args.username or input("Username: ").strip()
-password = args.password or getpass.getpass("Password: ").strip()
-command = args.command or input("Command to execute: ").strip()
-
-# Pre-check: test TCP connectivity
-try:
-    sock = socket.create_connection((router_ip, 22), timeout=5)
-    banner = sock.recv(1024).decode(errors="ignore")
-    sock.close()
-    if not banner.startswith("SSH-"):
-        print(f"Unexpected response on port 22: {banner.strip() or 'No banner received'}")
-        print("Check if SSH is enabled and accessible on the router.")
-        sys.exit(1)
-except (socket.timeout, ConnectionRefusedError):
-    print("Could not reach the router on port 22 (connection refused or timed out).")
-    print("Verify SSH is enabled and not blocked by a firewall.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Unexpected socket error: {e}")
-    sys.exit(1)
-
-# Create SSH client
-ssh_client = paramiko.SSHClient()
-ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-try:
-    # Connect
-    ssh_client.connect(
-        hostname=router_ip,
-        username=username,
-        password=password,
-        port=22,
-        timeout=10,
-        banner_timeout=30,
-        auth_timeout=10,
-        look_for_keys=False,
-        allow_agent=False,
-    )
-    print("Connected to MikroTik router.")
-
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    output = stdout.read().decode("utf-8", errors="ignore").strip()
-    err = stderr.read().decode("utf-8", errors="ignore").strip()
-
-    if output:
-        print("\n--- Command Output ---")
-        print(output)
-    if err:
-        print("\n--- Command Error ---")
-        print(err)
-
-except paramiko.AuthenticationException:
-    print("Authentication failed. Check your username or password.")
-except paramiko.SSHException as ssh_ex:
-    print(f"SSH error: {ssh_ex}")
-except socket.timeout:
-    print("Connection timed out. The router may be unreachable or slow to respond.")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-finally:
-    ssh_client.close()
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Longest wait between retries of one router
+MAX_BACKOFF = 60
+
+
+def build_parser(prog=None):
+    # Argument parser setup
+    parser = argparse.ArgumentParser(prog=prog, description="Logs into MikroTik router and runs one or more commands over a single session.")
+    parser.add_argument("-r", "--router-ip", type=str, help="Router IP or hostname (e.g. 192.168.10.1)")
+    parser.add_argument("-u", "--username", type=str, help="Username (e.g. admin)")
+    parser.add_argument("-p", "--password", type=str, help="Password. If omitted, you'll be prompted.")
+    parser.add_argument("-c", "--command", type=str, action="append", help="Command to execute on the router. Repeat to run several commands in order.")
+    parser.add_argument("--script", type=str, help="Path to a file with one command per line. Blank lines and lines starting with # are skipped.")
+    parser.add_argument("--stop-on-error", action="store_true", help="Stop running commands after the first one that fails. Default: False")
+    collector.add_transport_argument(parser)
+    parser.add_argument("-P", "--port", type=int, default=sshsession.DEFAULT_PORT, help=f"SSH port. Default: {sshsession.DEFAULT_PORT}")
+    fleet = parser.add_argument_group("fleet rollout", "Run the commands on every router in --list.")
+    fleet.add_argument("--list", type=str, help="Path to a file with one router per line, optionally followed by its site name (e.g. '10.1.0.1 branch-3').")
+    fleet.add_argument("-w", "--workers", type=int, default=16, help="Routers worked on at once. Default: 16")
+    fleet.add_argument("--site-concurrency", type=int, help="Most routers of one site worked on at once.")
+    fleet.add_argument("--site-rate", type=float, help="Most routers of one site started per second.")
+    fleet.add_argument("--retries", type=int, default=2, help="Times to retry a router after a timeout or SSH/API error before a command was sent. A command that fails after it was sent is reported as interrupted and never sent again. Default: 2")
+    fleet.add_argument("--backoff", type=float, default=2, help="Seconds before the first retry; doubled for every further retry. Default: 2")
+    fleet.add_argument("--canary", type=int, default=0, help="Run on the first N routers first, and stop the rollout if any of them fails. Default: 0")
+    fleet.add_argument("--report", type=str, help="Write every router's output and status to this file.")
+    fleet.add_argument("--report-format", choices=["json", "csv"], help="Report format. Default: from the --report extension, else json")
+    return parser
+
+
+def read_script(path):
+    # Read commands from a script file, one per line
+    with open(path, "r") as file:
+        lines = [line.strip() for line in file.readlines()]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def run_commands(session, commands, stop_on_error=False, show=print, results=None):
+    # Run commands in order on new channels of one transport (or tagged requests on one
+    # API connection).
+    # Returns (command, output, error, exit status, elapsed seconds) per command that ran;
+    # pass a list as results to keep what finished if a later command raises.
+    results = [] if results is None else results
+    for number, command in enumerate(commands, start=1):
+        started = time.perf_counter()
+        output, err, exit_status = session.run(command)
+        elapsed = time.perf_counter() - started
+        results.append((command, output, err, exit_status, elapsed))
+
+        if show is not None:
+            show(f"\n--- [{number}/{len(commands)}] {command} (exit {exit_status}, {elapsed:.3f}s) ---")
+            if output:
+                show(output)
+            if err:
+                show("\n--- Command Error ---")
+                show(err)
+
+        # RouterOS reports most failures as text with exit status 0, so treat stderr as failure too
+        if stop_on_error and (exit_status != 0 or err):
+            if show is not None:
+                show("Stopping after failed command.")
+            break
+    return results
+
+
+def interleave_sites(targets):
+    # Round-robin over sites, keeping list order within a site, so workers waiting on one
+    # busy site's limits don't hold up routers at other sites
+    sites = {}
+    for target in targets:
+        sites.setdefault(target[1], []).append(target)
+    queues = list(sites.values())
+    ordered = []
+    while queues:
+        ordered += [queue.pop(0) for queue in queues]
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+class SiteLimiter:
+    # Caps how many routers of one site are worked on at once and how fast they start
+
+    def __init__(self, concurrency=None, rate=None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.condition = threading.Condition()
+        self.active = {}
+        self.next_start = {}
+
+    @contextlib.contextmanager
+    def slot(self, site):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.concurrency and self.active.get(site, 0) >= self.concurrency:
+                    self.condition.wait()
+                elif self.rate and now < self.next_start.get(site, 0):
+                    self.condition.wait(self.next_start[site] - now)
+                else:
+                    break
+            self.active[site] = self.active.get(site, 0) + 1
+            if self.rate:
+                self.next_start[site] = now + 1 / self.rate
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active[site] -= 1
+                self.condition.notify_all()
+
+
+def failed_commands(results):
+    # RouterOS reports most failures as text with exit status 0, so stderr counts too
+    return [result for result in results if result[3] != 0 or result[2]]
+
+
+# Serialise progress lines from the workers
+print_lock = threading.Lock()
+
+
+def rollout_router(target, commands, username, password, args, limiter):
+    # Run the commands on one router, retrying after timeouts and SSH/API errors that hit
+    # before a command was sent (connecting, opening a channel), from the first command
+    # that hadn't run. A command that was sent may have run even though it failed, so it
+    # is recorded as interrupted, with no exit status, and the router is stopped there
+    # rather than given the command again. Returns the router's report entry.
+    import paramiko
+
+    router_ip, site = target
+    started = time.perf_counter()
+    results = []
+    attempts = 0
+    error = ""
+    interrupted = False
+    delay = args.backoff
+    while True:
+        attempts += 1
+        session = None
+        finished = len(results)
+        try:
+            with limiter.slot(site):
+                session = collector.connect(args.transport, router_ip, username, password, args.api_port, args.port)
+                sent = session.commands_sent
+                attempt_started = time.perf_counter()
+                run_commands(session, commands[len(results):], args.stop_on_error, show=None, results=results)
+            error = ""
+            break
+        except (paramiko.AuthenticationException, routerosapi.AuthenticationError):
+            error = "Authentication failed"
+            break
+        except Exception as ex:
+            error = f"{type(ex).__name__}: {ex}" if str(ex) else type(ex).__name__
+            if session is not None and session.commands_sent - sent > len(results) - finished:
+                elapsed = time.perf_counter() - attempt_started - sum(result[4] for result in results[finished:])
+                results.append((commands[len(results)], "", error, None, elapsed))
+                interrupted = True
+                break
+            if not isinstance(ex, (socket.timeout, paramiko.SSHException, routerosapi.ApiError)) or attempts > args.retries:
+                break
+        finally:
+            collector.close(session, router_ip)
+        time.sleep(min(delay, MAX_BACKOFF) * random.uniform(0.5, 1.5))
+        delay *= 2
+
+    metrics.observe("rollout", router_ip, time.perf_counter() - started, attempts=attempts)
+    if interrupted:
+        status = "interrupted"
+    elif error:
+        status = "error"
+    elif failed_commands(results) or len(results) < len(commands):
+        status = "failed"
+    else:
+        status = "ok"
+    entry = {
+        "router": router_ip, "site": site, "status": status, "attempts": attempts, "error": error,
+        "seconds": round(time.perf_counter() - started, 3),
+        "commands": [
+            {"command": command, "exit_status": exit_status, "seconds": round(elapsed, 3), "output": output, "error": err}
+            for command, output, err, exit_status, elapsed in results
+        ],
+    }
+    with print_lock:
+        if interrupted:
+            detail = f"'{results[-1][0]}' may or may not have run: {error}"
+        else:
+            detail = error or f"{len(results)}/{len(commands)} commands, {len(failed_commands(results))} failed"
+        print(f"  {status.upper():<7}{router_ip}{f' ({site})' if site else ''}: {detail} "
+              f"[{attempts} attempt{'s' if attempts > 1 else ''}, {entry['seconds']:.2f}s]")
+    return entry
+
+
+def unique_targets(targets):
+    # The first entry for every router; a router listed twice would get the commands twice
+    seen = set()
+    unique = []
+    for target in targets:
+        if target[0] in seen:
+            print(f"Ignoring the repeated list entry for {target[0]}")
+            continue
+        seen.add(target[0])
+        unique.append(target)
+    return unique
+
+
+def rollout(targets, commands, username, password, args):
+    # Canary routers first, then the rest unless a canary failed. Returns report entries
+    # in list order, with "skipped" for routers a failed canary stage kept from running.
+    targets = unique_targets(targets)
+    limiter = SiteLimiter(args.site_concurrency, args.site_rate)
+    canaries, rest = targets[:args.canary], targets[args.canary:]
+    entries = {}
+    # Routers that took longest last time start first (within the site interleaving)
+    position = {router_ip: i for i, router_ip in enumerate(latencyhistory.slowest_first([target[0] for target in rest], "rollout"))}
+    rest = sorted(rest, key=lambda target: position[target[0]])
+    for stage, stage_targets in (("canary", canaries), ("rollout", interleave_sites(rest))):
+        if not stage_targets:
+            continue
+        if stage == "canary":
+            print(f"Canary stage: {len(stage_targets)} routers")
+        elif canaries:
+            failed = [entries[target]["router"] for target in canaries if entries[target]["status"] != "ok"]
+            if failed:
+                print(f"Canary failed on {', '.join(failed)}; not rolling out to the other {len(stage_targets)} routers.")
+                for target in stage_targets:
+                    entries[target] = {"router": target[0], "site": target[1], "status": "skipped", "attempts": 0,
+                                       "error": "Canary failed", "seconds": 0, "commands": []}
+                break
+            print(f"Rollout stage: {len(stage_targets)} routers")
+        with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(stage_targets)))) as executor:
+            stage_entries = executor.map(lambda target: rollout_router(target, commands, username, password, args, limiter), stage_targets)
+            entries.update(zip(stage_targets, stage_entries))
+    return [entries[target] for target in targets]
+
+
+def write_report(entries, path, report_format=None):
+    # JSON keeps the per-router structure; CSV has one row per router and command
+    report_format = report_format or ("csv" if path.lower().endswith(".csv") else "json")
+    if report_format == "json":
+        with open(path, "w") as file:
+            json.dump(entries, file, indent=2)
+        return
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["router", "site", "status", "attempts", "router_error", "command", "exit_status", "seconds", "output", "error"])
+        for entry in entries:
+            head = [entry["router"], entry["site"], entry["status"], entry["attempts"], entry["error"]]
+            for command in entry["commands"] or [{}]:
+                writer.writerow(head + [command.get(field, "") for field in ("command", "exit_status", "seconds", "output", "error")])
+
+
+def main(argv=None, prog=None):
+    args = build_parser(prog).parse_args(argv)
+    import paramiko
+
+    if args.list:
+        return main_fleet(args)
+
+    # Interactive prompts for missing args
+    router_ip = args.router_ip or input("Enter router IP: ").strip()
+    username = args.username or input("Username: ").strip()
+    password = args.password or getpass.getpass("Password: ").strip()
+    commands = list(args.command or [])
+    if args.script:
+        commands += read_script(args.script)
+    if not commands:
+        commands = [input("Command to execute: ").strip()]
+
+    # Pre-check: test TCP connectivity (the API doesn't send a banner to probe for)
+    if args.transport == "ssh":
+        sshsession.require_ssh(router_ip, args.port)
+
+    results = []
+    session = None
+    try:
+        # Connect once; every command runs on a new channel of the same transport
+        session = collector.connect(args.transport, router_ip, username, password, args.api_port, args.port)
+        print("Connected to MikroTik router.")
+        run_commands(session, commands, args.stop_on_error, results=results)
+
+    except (paramiko.AuthenticationException, routerosapi.AuthenticationError):
+        print("Authentication failed. Check your username or password.")
+    except paramiko.SSHException as ssh_ex:
+        print(f"SSH error: {ssh_ex}")
+    except routerosapi.ApiError as api_ex:
+        print(f"API error: {api_ex}")
+    except socket.timeout:
+        print("Connection timed out. The router may be unreachable or slow to respond.")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+    finally:
+        collector.close(session)
+        latencyhistory.record_run()
+
+    # Per-command summary for batches
+    if len(commands) > 1:
+        print("-" * 25)
+        print(f"Ran {len(results)} of {len(commands)} commands in {sum(result[4] for result in results):.3f}s")
+        for command, output, err, exit_status, elapsed in results:
+            print(f"  exit {exit_status:<4}{elapsed:8.3f}s  {command}")
+        print("-" * 25)
+
+
+def main_fleet(args):
+    targets = routerlist.read_targets(args.list)
+    username = args.username or input("Username: ").strip()
+    password = args.password or getpass.getpass("Password: ").strip()
+    commands = list(args.command or [])
+    if args.script:
+        commands += read_script(args.script)
+    if not commands:
+        commands = [input("Command to execute: ").strip()]
+
+    print(f"Running {len(commands)} command{'s' if len(commands) > 1 else ''} on {len(targets)} routers...")
+    started = time.perf_counter()
+    entries = rollout(targets, commands, username, password, args)
+    latencyhistory.record_run()
+    counts = {status: sum(1 for entry in entries if entry["status"] == status) for status in ("ok", "failed", "interrupted", "error", "skipped")}
+    print("-" * 25)
+    print(f"{counts['ok']} ok, {counts['failed']} failed, {counts['interrupted']} interrupted mid-command, "
+          f"{counts['error']} unreachable or errored, {counts['skipped']} skipped in {time.perf_counter() - started:.2f}s")
+    if args.report:
+        write_report(entries, args.report, args.report_format)
+        print(f"Report written to '{args.report}'")
+    return 0 if counts["ok"] == len(entries) else 1
+
 
+if __name__ == "__main__":
+    main()
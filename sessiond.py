@@ -0,0 +1,467 @@
+#!/usr/bin/python3
+
+# Local session daemon, like OpenSSH's ControlMaster: keeps authenticated SSH transports
+# to routers open and runs commands on new channels of them for the scripts, which talk
+# to it over a Unix socket. A command through the daemon costs one round trip to the
+# router instead of TCP connect + key exchange + password auth every time a script runs.
+#
+#   mikrotikautomation sessiond &               start it (foreground; use & or a service)
+#   mikrotikautomation run -r 10.0.0.1 -u admin -c "/system/resource/print"
+#   mikrotikautomation sessiond --status
+#   mikrotikautomation sessiond --stop
+#
+# While the socket exists, sshsession.get_session() hands out DaemonSession objects that
+# run their commands through the daemon, so runcommand and the collectors use it without
+# any option. Set MIKROTIK_SESSIOND to use another socket, or to "" to bypass the daemon.
+#
+# Each request is one connection: a JSON line, then frames of a kind byte, a 4-byte length
+# and a payload: "o" stdout, "e" stderr, "x" exit status, "!" error. Transports idle for
+# --idle seconds are closed, and at most --max-sessions are kept per router.
+
+import argparse
+import hashlib
+import hmac
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import cachefile
+import latencyhistory
+import metrics
+import sshsession
+
+SOCKET_PATH = cachefile.cache_path("sessiond.sock")
+IDLE_TIMEOUT = 300
+MAX_SESSIONS = 2
+FRAME_HEADER = struct.Struct("!cI")
+
+
+def socket_path():
+    return os.environ.get("MIKROTIK_SESSIOND", SOCKET_PATH)
+
+
+def available(path=None):
+    # True when a daemon is listening on the socket. A socket file left behind by a daemon
+    # that died doesn't count, so the scripts fall back to sessions of their own.
+    path = socket_path() if path is None else path
+    if not path or not os.path.exists(path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1)
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def send_frame(sock, kind, payload=b""):
+    sock.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def read_exact(file, size):
+    data = file.read(size)
+    if len(data) < size:
+        raise DaemonError("Session daemon closed the connection")
+    return data
+
+
+def read_frame(file):
+    kind, length = FRAME_HEADER.unpack(read_exact(file, FRAME_HEADER.size))
+    return kind, read_exact(file, length) if length else b""
+
+
+def password_digest(password):
+    return hashlib.sha256(password.encode("utf-8")).digest()
+
+
+class DaemonError(Exception):
+    pass
+
+
+class SessionCapError(DaemonError):
+    pass
+
+
+def raise_error(error):
+    # Re-raise an error the daemon reported as the exception the scripts already handle
+    import paramiko
+
+    message = error.get("message", "")
+    if error.get("kind") == "auth":
+        raise paramiko.AuthenticationException(message)
+    if error.get("kind") == "ssh":
+        raise paramiko.SSHException(message)
+    if error.get("kind") == "timeout":
+        raise socket.timeout(message)
+    raise DaemonError(message)
+
+
+class Slot:
+    # One transport held by the daemon, with the number of channels running on it
+
+    def __init__(self, session, username, digest):
+        self.session = session
+        self.username = username
+        self.digest = digest
+        self.active = 0
+        self.last_used = time.monotonic()
+
+
+class DaemonPool:
+    # Transports per (router, port). A request reuses the least busy transport opened with
+    # the same username and password, and opens another (up to max_sessions per router)
+    # only when every matching one already has a command running.
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.slots = {}
+        self.router_locks = {}
+        self.lock = threading.Lock()
+
+    def router_lock(self, key):
+        with self.lock:
+            return self.router_locks.setdefault(key, threading.Lock())
+
+    def acquire(self, router_ip, port, username, password):
+        key = (router_ip, port)
+        digest = password_digest(password)
+        # Connecting happens under the router's lock, so concurrent first requests to a
+        # router share one handshake and other routers aren't held up
+        with self.router_lock(key):
+            slots = self.slots.setdefault(key, [])
+            matching = [slot for slot in slots if slot.username == username and hmac.compare_digest(slot.digest, digest)]
+            slot = min(matching, key=lambda slot: slot.active, default=None)
+            idle = [other for other in slots if not other.active]
+            # At the cap, busy transports take more channels rather than opening another
+            if slot is None or (slot.active and (len(slots) < self.max_sessions or idle)):
+                if slot is None and len(slots) >= self.max_sessions and not idle:
+                    raise SessionCapError(f"All {self.max_sessions} sessions to {router_ip} are busy")
+                session = sshsession.RouterSession(router_ip, username, password, port).connect()
+                if len(slots) >= self.max_sessions:
+                    # Make room by closing the transport that has been idle the longest;
+                    # only once the new one is in, so a wrong password can't evict anything
+                    evicted = min(idle, key=lambda other: other.last_used)
+                    slots.remove(evicted)
+                    evicted.session.close()
+                slot = Slot(session, username, digest)
+                slots.append(slot)
+            with self.lock:
+                slot.active += 1
+                slot.last_used = time.monotonic()
+            return slot
+
+    def release(self, slot):
+        with self.lock:
+            slot.active -= 1
+            slot.last_used = time.monotonic()
+
+    def evict_idle(self):
+        # Close transports nobody has used for idle_timeout seconds
+        now = time.monotonic()
+        with self.lock:
+            keys = list(self.slots)
+        for key in keys:
+            with self.router_lock(key):
+                slots = self.slots.get(key, [])
+                for slot in [slot for slot in slots if not slot.active and now - slot.last_used >= self.idle_timeout]:
+                    slots.remove(slot)
+                    slot.session.close()
+                    print(f"Closed idle session to {key[0]}:{key[1]}")
+
+    def status(self):
+        now = time.monotonic()
+        with self.lock:
+            return [
+                {"router": router_ip, "port": port, "username": slot.username, "active": slot.active,
+                 "idle_seconds": round(now - slot.last_used, 1), "connected": slot.session.is_active()}
+                for (router_ip, port), slots in self.slots.items() for slot in list(slots)
+            ]
+
+    def close(self):
+        with self.lock:
+            slots = [slot for slots in self.slots.values() for slot in slots]
+            self.slots = {}
+        for slot in slots:
+            slot.session.close()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    # One request per connection: "connect", "exec", "status" or "stop"
+
+    def handle(self):
+        import paramiko
+
+        try:
+            line = self.rfile.readline()
+            if not line:
+                # available() checking that the daemon is there
+                return
+            request = json.loads(line)
+            op = request.get("op")
+            if op == "status":
+                self.send_json("x", {"sessions": self.server.pool.status()})
+            elif op == "stop":
+                self.send_json("x", {"stopping": True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif op in ("connect", "exec"):
+                self.run(request, op == "exec")
+            else:
+                self.send_json("!", {"kind": "request", "message": f"Unknown request '{op}'"})
+        except paramiko.AuthenticationException as ex:
+            self.send_json("!", {"kind": "auth", "message": str(ex) or "Authentication failed"})
+        except paramiko.SSHException as ex:
+            self.send_json("!", {"kind": "ssh", "message": str(ex)})
+        except socket.timeout as ex:
+            self.send_json("!", {"kind": "timeout", "message": str(ex) or "Timed out"})
+        except (BrokenPipeError, ConnectionResetError):
+            # The script went away, e.g. it stopped reading a stream early
+            pass
+        except Exception as ex:
+            self.send_json("!", {"kind": "error", "message": str(ex) or type(ex).__name__})
+
+    def send_json(self, kind, value):
+        try:
+            send_frame(self.request, kind.encode(), json.dumps(value).encode())
+        except OSError:
+            pass
+
+    def run(self, request, execute):
+        slot = self.server.pool.acquire(request["router"], request.get("port", sshsession.DEFAULT_PORT),
+                                        request["username"], request["password"])
+        try:
+            if not execute:
+                self.send_json("x", {"connected": True})
+                return
+            channel = slot.session.open_channel(request["command"])
+            try:
+                for chunk in sshsession.iter_chunks(channel):
+                    send_frame(self.request, b"o", chunk)
+                with channel.makefile_stderr("rb") as stderr:
+                    err = stderr.read()
+                exit_status = sshsession.recv_exit_status(channel)
+            finally:
+                channel.close()
+        finally:
+            self.server.pool.release(slot)
+        send_frame(self.request, b"e", err)
+        self.send_json("x", {"exit_status": exit_status})
+
+
+class SessionDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=None, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT):
+        self.path = socket_path() if path is None else path
+        self.pool = DaemonPool(max_sessions, idle_timeout)
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            # A socket left behind by a daemon that didn't shut down cleanly
+            if probe(self.path):
+                raise DaemonError(f"A session daemon is already listening on '{self.path}'")
+            os.unlink(self.path)
+        # The socket hands out authenticated sessions, so only this user may connect
+        previous_umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, RequestHandler)
+        finally:
+            os.umask(previous_umask)
+        self.stopped = threading.Event()
+
+    def evict_loop(self):
+        interval = max(1, min(self.pool.idle_timeout / 4, 30))
+        while not self.stopped.wait(interval):
+            self.pool.evict_idle()
+
+    def serve(self):
+        threading.Thread(target=self.evict_loop, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.stopped.set()
+            self.pool.close()
+            self.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+def request(path, message, timeout=None):
+    # Send one request and return the connected socket and a reader for the reply frames
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(sshsession.CONNECT_TIMEOUT)
+        sock.connect(path)
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+    except BaseException:
+        sock.close()
+        raise
+    return sock, sock.makefile("rb")
+
+
+def call(path, message):
+    # A request answered with a single frame
+    sock, reader = request(path, message, sshsession.CONNECT_TIMEOUT)
+    try:
+        kind, payload = read_frame(reader)
+    finally:
+        reader.close()
+        sock.close()
+    if kind == b"!":
+        raise_error(json.loads(payload))
+    return json.loads(payload)
+
+
+def probe(path):
+    try:
+        call(path, {"op": "status"})
+        return True
+    except (OSError, DaemonError):
+        return False
+
+
+class DaemonChannel:
+    # The reply frames of one "exec" request, with the parts of the paramiko Channel
+    # interface that sshsession.CommandStream uses
+
+    def __init__(self, sock, reader):
+        self.sock = sock
+        self.reader = reader
+        self.err = b""
+        self.exit_status = None
+
+    def recv(self, size):
+        # Next stdout chunk, b"" once stdout is done
+        while self.exit_status is None:
+            kind, payload = read_frame(self.reader)
+            if kind == b"o":
+                return payload
+            if kind == b"e":
+                self.err = payload
+            elif kind == b"x":
+                self.exit_status = json.loads(payload)["exit_status"]
+            elif kind == b"!":
+                self.close()
+                raise_error(json.loads(payload))
+        return b""
+
+    def makefile_stderr(self, mode="rb"):
+        while self.exit_status is None:
+            self.recv(0)
+        return io.BytesIO(self.err)
+
+    def recv_exit_status(self):
+        while self.exit_status is None:
+            self.recv(0)
+        return self.exit_status
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class DaemonSession:
+    # Same interface as sshsession.RouterSession for running commands, backed by the daemon.
+    # Closing it leaves the daemon's transport open for the next script.
+
+    def __init__(self, router_ip, username, password, port=sshsession.DEFAULT_PORT, path=None):
+        self.router_ip = router_ip
+        self.username = username
+        self.password = password
+        self.port = port
+        self.path = socket_path() if path is None else path
+        self.transport = None
+        # Counted when the daemon is asked to run a command, as on sshsession.RouterSession
+        self.commands_sent = 0
+
+    def message(self, op, **fields):
+        return dict({"op": op, "router": self.router_ip, "port": self.port, "username": self.username,
+                     "password": self.password}, **fields)
+
+    def connect(self):
+        # Authenticates through the daemon, which reuses its transport if it has one
+        with metrics.timer("daemon_connect", self.router_ip):
+            call(self.path, self.message("connect"))
+        return self
+
+    def is_active(self):
+        return available(self.path)
+
+    def ensure_connected(self):
+        return self
+
+    def stream(self, command, chunk_size=sshsession.STREAM_CHUNK_SIZE):
+        # The daemon enforces the router's timeouts; this only guards against the daemon hanging
+        self.commands_sent += 1
+        with metrics.timer("exec", self.router_ip, metrics.command_label(command)):
+            sock, reader = request(self.path, self.message("exec", command=command), latencyhistory.LIMITS["command"][2])
+        return sshsession.CommandStream(DaemonChannel(sock, reader), chunk_size, self.router_ip, command)
+
+    def run(self, command):
+        # Run a command and return (output, error, exit status)
+        stream = self.stream(command)
+        raw = b"".join(stream.chunks())
+        return raw.decode("utf-8", errors="ignore").strip(), stream.err, stream.exit_status
+
+    def open_sftp(self):
+        raise DaemonError("SFTP isn't available through the session daemon")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Keeps authenticated SSH sessions to routers open for the other scripts, which use it through a Unix socket.")
+    parser.add_argument("--socket", type=str, default=socket_path(), help=f"Unix socket path. Default: $MIKROTIK_SESSIOND or {SOCKET_PATH}")
+    parser.add_argument("--idle", type=float, default=IDLE_TIMEOUT, help=f"Close sessions unused for this many seconds. Default: {IDLE_TIMEOUT}")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help=f"Most sessions kept open to one router. Default: {MAX_SESSIONS}")
+    parser.add_argument("--status", action="store_true", help="Show the sessions a running daemon holds.")
+    parser.add_argument("--stop", action="store_true", help="Stop a running daemon.")
+    args = parser.parse_args(argv)
+
+    if args.status or args.stop:
+        if not probe(args.socket):
+            print(f"No session daemon on '{args.socket}'")
+            return 1
+        if args.stop:
+            call(args.socket, {"op": "stop"})
+            print("Session daemon stopped.")
+            return
+        sessions = call(args.socket, {"op": "status"})["sessions"]
+        for session in sessions:
+            print(f"  {session['router']}:{session['port']:<8}{session['username']:<16}{session['active']} active, "
+                  f"idle {session['idle_seconds']}s{'' if session['connected'] else ' (disconnected)'}")
+        print(f"{len(sessions)} sessions")
+        return
+
+    daemon = SessionDaemon(args.socket, args.max_sessions, args.idle)
+    print(f"Session daemon listening on '{daemon.path}'")
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+
+# Resumable SFTP downloads.
+# Data goes to "<file>.part" and is renamed into place only after its size matches the
+# remote file. The content is compared too when the server hashes files for us (the
+# check-file extension), but RouterOS doesn't, so from a router only the size is verified. A
+# retried download continues from where the previous attempt stopped. Large files can be
+# fetched as several byte ranges in parallel over one SFTP session to fill slow, high
+# latency links; range progress is kept in "<file>.part.ranges" so those resume too.
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+READ_SIZE = 32768
+WINDOW = 64
+# How often range progress is flushed and recorded
+PROGRESS_INTERVAL = 1024 * 1024
+# Files smaller than this are never split into ranges
+RANGE_MIN_SIZE = 4 * 1024 * 1024
+
+
+class TransferError(Exception):
+    pass
+
+
+def sha256_file(path):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def remote_sha256(sftp_client, remote_path):
+    # Ask the server to hash the file (check-file extension). RouterOS doesn't implement
+    # it, in which case only the size can be compared.
+    try:
+        with sftp_client.open(remote_path, "rb") as remote:
+            return remote.check("sha256").hex()
+    except (IOError, OSError):
+        return None
+
+
+def copy_range(sftp_client, remote_path, local_path, start, end, window, progress=None):
+    # Copy bytes [start, end) of the remote file into the same offsets of the local file
+    if start >= end:
+        return
+    with sftp_client.open(remote_path, "rb") as remote, open(local_path, "r+b") as local:
+        remote.seek(start)
+        # Pipeline read requests for the whole range instead of one round trip per read
+        remote.prefetch(end, max_concurrent_requests=window)
+        local.seek(start)
+        position = start
+        reported = start
+        while position < end:
+            data = remote.read(min(READ_SIZE, end - position))
+            if not data:
+                raise TransferError(f"Remote file ended at {position} bytes, expected {end}")
+            local.write(data)
+            position += len(data)
+            if progress is not None and (position - reported >= PROGRESS_INTERVAL or position == end):
+                # Only record progress for data that has actually reached the file
+                local.flush()
+                progress(position)
+                reported = position
+
+
+def download_sequential(sftp_client, remote_path, part_path, remote_size, window):
+    # Continue a contiguous .part file from its current size
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > remote_size:
+        # The remote file changed underneath us; start over
+        offset = 0
+    with open(part_path, "r+b" if offset else "wb") as local:
+        local.truncate(offset)
+    copy_range(sftp_client, remote_path, part_path, offset, remote_size, window)
+    return offset
+
+
+def download_ranges(sftp_client, remote_path, part_path, remote_size, window, ranges):
+    # Fetch several byte ranges at once over the same SFTP session, recording progress so
+    # an interrupted download only refetches what is missing
+    state_path = f"{part_path}.ranges"
+    state = None
+    if os.path.exists(state_path) and os.path.exists(part_path):
+        with open(state_path, "r") as file:
+            state = json.load(file)
+        if state.get("size") != remote_size:
+            state = None
+    if state is None:
+        step = -(-remote_size // ranges)
+        state = {
+            "size": remote_size,
+            "ranges": [[start, min(start + step, remote_size), start] for start in range(0, remote_size, step)],
+        }
+        with open(part_path, "wb") as local:
+            local.truncate(remote_size)
+    resumed = sum(done - start for start, end, done in state["ranges"])
+
+    lock = threading.Lock()
+
+    def save_state():
+        with open(state_path, "w") as file:
+            json.dump(state, file)
+
+    def fetch(span):
+        def progress(position):
+            with lock:
+                span[2] = position
+                save_state()
+        copy_range(sftp_client, remote_path, part_path, span[2], span[1], window, progress)
+
+    with lock:
+        save_state()
+    with ThreadPoolExecutor(max_workers=len(state["ranges"])) as executor:
+        futures = [executor.submit(fetch, span) for span in state["ranges"]]
+        for future in futures:
+            future.result()
+    os.remove(state_path)
+    return resumed
+
+
+def discard(local_path):
+    # Remove the partial download state for local_path
+    for path in (f"{local_path}.part", f"{local_path}.part.ranges"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def download(sftp_client, remote_path, local_path, window=WINDOW, ranges=1):
+    # Download remote_path to local_path, resuming an earlier .part if there is one.
+    # Returns (bytes fetched this call, total size, sha256 of the local file).
+    remote_size = sftp_client.stat(remote_path).st_size
+    part_path = f"{local_path}.part"
+
+    if os.path.exists(f"{part_path}.ranges") or (ranges > 1 and remote_size >= RANGE_MIN_SIZE and not os.path.exists(part_path)):
+        resumed = download_ranges(sftp_client, remote_path, part_path, remote_size, window, max(ranges, 1))
+    else:
+        resumed = download_sequential(sftp_client, remote_path, part_path, remote_size, window)
+
+    # Verify before the file takes its final name
+    local_size = os.path.getsize(part_path)
+    if local_size != remote_size:
+        raise TransferError(f"Size mismatch for '{remote_path}': local {local_size}, remote {remote_size}")
+    digest = sha256_file(part_path)
+    remote_digest = remote_sha256(sftp_client, remote_path)
+    if remote_digest is not None and remote_digest != digest:
+        # A corrupt .part can't be resumed from, so throw it away
+        os.remove(part_path)
+        raise TransferError(f"Checksum mismatch for '{remote_path}'")
+
+    os.replace(part_path, local_path)
+    return remote_size - resumed, remote_size, digest
@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+# Shared SSH session layer for the MikroTik scripts.
+# Authenticated transports are kept open with keepalives and every command runs on a
+# new channel of an existing transport, so several commands against the same router
+# only pay for one TCP + SSH handshake. paramiko is imported on first connect so that
+# importing this module stays cheap. The connect phases (TCP, key exchange, auth) and
+# every command are timed into metrics.registry.
+
+import fleetscan
+import latencyhistory
+import metrics
+import socket
+import sys
+import threading
+import time
+
+# Defaults shared by every script. Timeouts are the ones used for routers without enough
+# latency history; see latencyhistory.py.
+DEFAULT_PORT = 22
+PROBE_TIMEOUT = latencyhistory.LIMITS["probe"][0]
+CONNECT_TIMEOUT = latencyhistory.LIMITS["tcp"][0]
+BANNER_TIMEOUT = latencyhistory.LIMITS["kex"][0]
+AUTH_TIMEOUT = latencyhistory.LIMITS["auth"][0]
+COMMAND_TIMEOUT = latencyhistory.LIMITS["command"][0]
+KEEPALIVE_INTERVAL = 30
+STREAM_CHUNK_SIZE = 32768
+
+
+def require_ssh(router_ip, port=DEFAULT_PORT, timeout=PROBE_TIMEOUT):
+    # Pre-check used by the scripts: explain what is wrong and exit if SSH isn't reachable.
+    # A recent result from the fleet scanner's cache is trusted, so a router that was just
+    # seen up doesn't pay for an extra TCP connection before the real one. With the session
+    # daemon running there is nothing to check: it reports unreachable routers itself.
+    import sessiond
+
+    if sessiond.available():
+        return None
+    result = fleetscan.check_host(router_ip, port, timeout)
+    if result["reachable"]:
+        return result
+    if result["banner"] or result["error"].startswith("Unexpected response"):
+        print(f"Unexpected response on port {port}: {result['banner'] or 'No banner received'}")
+        print("Check if SSH is enabled and accessible on the router.")
+    elif result["error"] in ("Timed out", "Connection refused"):
+        print(f"Could not reach the router on port {port} (connection refused or timed out).")
+        print("Verify SSH is enabled and not blocked by a firewall.")
+    else:
+        print(f"Unexpected socket error: {result['error']}")
+    sys.exit(1)
+
+
+def recv_exit_status(channel):
+    # paramiko's recv_exit_status() waits forever; the channel's timeout is the deadline.
+    # (Daemon channels read the status from their socket, which has its own timeout.)
+    status_event = getattr(channel, "status_event", None)
+    if status_event is not None and not status_event.wait(channel.gettimeout()):
+        channel.close()
+        raise socket.timeout(f"No exit status within {channel.gettimeout():.0f}s")
+    return channel.recv_exit_status()
+
+
+def iter_chunks(channel, chunk_size=STREAM_CHUNK_SIZE):
+    # Yield raw stdout chunks from a channel until the command closes it
+    while True:
+        chunk = channel.recv(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_lines(chunks):
+    # Yield decoded lines from an iterable of output chunks as they arrive instead of
+    # buffering it all
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        if b"\n" not in chunk:
+            continue
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8", errors="ignore")
+    if pending:
+        yield pending.rstrip(b"\r").decode("utf-8", errors="ignore")
+
+
+class CommandStream:
+    # Iterable over the output lines of a running command.
+    # err and exit_status are filled in once the output has been consumed.
+
+    def __init__(self, channel, chunk_size=STREAM_CHUNK_SIZE, router="", command=""):
+        self.channel = channel
+        self.chunk_size = chunk_size
+        self.router = router
+        self.command = metrics.command_label(command)
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.err = ""
+        self.exit_status = None
+
+    def chunks(self):
+        # Raw stdout chunks, for output that isn't line oriented (e.g. an export piped to disk)
+        try:
+            for chunk in iter_chunks(self.channel, self.chunk_size):
+                self.bytes += len(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped early; don't wait for output nobody will read
+            self.channel.close()
+            raise
+        self.finish()
+
+    def __iter__(self):
+        # Closing this early closes chunks(), which releases the channel
+        return iter_lines(self.chunks())
+
+    def finish(self):
+        # Collect stderr and the exit status, then release the channel
+        if self.exit_status is not None:
+            return
+        with self.channel.makefile_stderr("rb") as stderr:
+            self.err = stderr.read().decode("utf-8", errors="ignore").strip()
+        with metrics.timer("exit_wait", self.router, self.command):
+            self.exit_status = recv_exit_status(self.channel)
+        self.channel.close()
+        metrics.observe("command", self.router, time.perf_counter() - self.started, self.bytes, self.command,
+                        exit_status=self.exit_status)
+
+    def close(self):
+        self.channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RouterSession:
+    # One authenticated SSH transport to a router that hands out a fresh channel per command
+
+    def __init__(self, router_ip, username, password, port=DEFAULT_PORT, keepalive=KEEPALIVE_INTERVAL):
+        self.router_ip = router_ip
+        self.username = username
+        self.password = password
+        self.port = port
+        self.keepalive = keepalive
+        self.transport = None
+        self.sftp = None
+        self.lock = threading.Lock()
+        # Commands handed to the router so far, whether or not they finished; a command
+        # that failed before this went up never reached the router
+        self.commands_sent = 0
+
+    def connect(self):
+        # Authenticate once; later commands reuse this transport. The transport is driven
+        # directly rather than through SSHClient so TCP connect, key exchange and auth can
+        # be timed separately. Like the AutoAddPolicy the scripts used, any host key is accepted.
+        # Every phase's timeout comes from the router's latency history.
+        import paramiko
+
+        with metrics.timer("tcp", self.router_ip):
+            sock = socket.create_connection((self.router_ip, self.port), timeout=latencyhistory.timeout(self.router_ip, "tcp"))
+        # Commands on an open transport are a few small packets each way; without this,
+        # Nagle holds the channel requests back until the router's delayed ACK (~40 ms)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(sock)
+        transport.banner_timeout = latencyhistory.timeout(self.router_ip, "kex")
+        transport.auth_timeout = latencyhistory.timeout(self.router_ip, "auth")
+        try:
+            with metrics.timer("kex", self.router_ip):
+                transport.start_client(timeout=transport.banner_timeout)
+            with metrics.timer("auth", self.router_ip):
+                transport.auth_password(self.username, self.password)
+        except BaseException:
+            transport.close()
+            raise
+        # Keep idle transports from being dropped by the router or a NAT in between
+        transport.set_keepalive(self.keepalive)
+        self.transport = transport
+        return self
+
+    def is_active(self):
+        return self.transport is not None and self.transport.is_active()
+
+    def ensure_connected(self):
+        # Reconnect if the transport was never opened or has dropped
+        with self.lock:
+            if not self.is_active():
+                self.close()
+                self.connect()
+        return self
+
+    def open_channel(self, command):
+        # Start a command on a new channel of the existing transport. The channel's timeout
+        # bounds every wait for output and for the exit status.
+        self.ensure_connected()
+        label = metrics.command_label(command)
+        with metrics.timer("exec", self.router_ip, label):
+            channel = self.transport.open_session(timeout=latencyhistory.timeout(self.router_ip, "exec"))
+            channel.settimeout(latencyhistory.timeout(self.router_ip, "command", label))
+            self.commands_sent += 1
+            channel.exec_command(command)
+        return channel
+
+    def run(self, command):
+        # Run a command and return (output, error, exit status)
+        label = metrics.command_label(command)
+        channel = self.open_channel(command)
+        # "command" covers output and exit status; starting the command is timed as "exec"
+        started = time.perf_counter()
+        with channel.makefile("rb") as stdout, channel.makefile_stderr("rb") as stderr:
+            raw = stdout.read()
+            output = raw.decode("utf-8", errors="ignore").strip()
+            err = stderr.read().decode("utf-8", errors="ignore").strip()
+        with metrics.timer("exit_wait", self.router_ip, label):
+            exit_status = recv_exit_status(channel)
+        channel.close()
+        metrics.observe("command", self.router_ip, time.perf_counter() - started, len(raw), label, exit_status=exit_status)
+        return output, err, exit_status
+
+    def stream(self, command, chunk_size=STREAM_CHUNK_SIZE):
+        # Run a command and iterate over its output lines while the router is still sending
+        return CommandStream(self.open_channel(command), chunk_size, self.router_ip, command)
+
+    def open_sftp(self):
+        # One SFTP session per router, reused for every stat, download and delete
+        import paramiko
+
+        self.ensure_connected()
+        if self.sftp is None or self.sftp.get_channel().closed:
+            with metrics.timer("sftp_open", self.router_ip):
+                self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+                # No SFTP request may wait longer than a command would
+                self.sftp.get_channel().settimeout(COMMAND_TIMEOUT)
+        return self.sftp
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+            self.sftp = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SessionPool:
+    # Keeps one authenticated session per (router, port, username) and reuses it
+
+    def __init__(self, keepalive=KEEPALIVE_INTERVAL):
+        self.keepalive = keepalive
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, router_ip, username, password, port=DEFAULT_PORT):
+        # Return a live session, connecting only if there isn't one already
+        key = (router_ip, port, username)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = RouterSession(router_ip, username, password, port, self.keepalive)
+                self.sessions[key] = session
+        return session.ensure_connected()
+
+    def close(self, router_ip=None):
+        # Close every session, or only the sessions for one router
+        with self.lock:
+            keys = [key for key in self.sessions if router_ip is None or key[0] == router_ip]
+            sessions = [self.sessions.pop(key) for key in keys]
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Process-wide pool shared by everything imported into the same interpreter
+pool = SessionPool()
+
+
+def get_session(router_ip, username, password, port=DEFAULT_PORT):
+    # Commands go through the session daemon (sessiond.py) when one is running
+    import sessiond
+
+    if sessiond.available():
+        try:
+            return sessiond.DaemonSession(router_ip, username, password, port).connect()
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The daemon went away since the check
+            pass
+    return pool.get(router_ip, username, password, port)
@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+
+# Parser for RouterOS "print terse" and "print detail" output.
+# Rows are key=value pairs instead of fixed columns, so a missing or oddly sized column
+# can't make a row disappear the way it did with the per-script regexes. Input is consumed
+# one line at a time and records are yielded as soon as they are complete.
+# Plain "print" output, as in older saved dumps, is read by its column header instead.
+
+import re
+
+# key="quoted value" or key=value; quoted values may contain spaces and escaped quotes
+ATTRIBUTE_PATTERN = re.compile(r'([^\s=]+)=("(?:[^"\\]|\\.)*"|\S*)')
+ESCAPE_PATTERN = re.compile(r"\\(.)")
+# Column names in the header of plain print output ("#   ADDRESS   MAC-ADDRESS ...")
+COLUMN_PATTERN = re.compile(r"[A-Z][A-Z0-9-]*")
+
+
+def unquote(value):
+    # Strip RouterOS quoting from a value
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return ESCAPE_PATTERN.sub(r"\1", value[1:-1])
+    return value
+
+
+class Row:
+    # One printed entry: its index, flag letters, comment and raw attributes
+    __slots__ = ("index", "flags", "comment", "attrs")
+
+    def __init__(self, index, flags="", comment="", attrs=None):
+        self.index = index
+        self.flags = flags
+        self.comment = comment
+        self.attrs = attrs if attrs is not None else {}
+
+    def __repr__(self):
+        return f"Row(index={self.index!r}, flags={self.flags!r}, comment={self.comment!r}, attrs={self.attrs!r})"
+
+
+def parse_attributes(text, attrs):
+    # Add every key=value pair in text to attrs
+    if '"' not in text:
+        # Fast path: nothing is quoted, so whitespace splitting is enough
+        for token in text.split():
+            key, sep, value = token.partition("=")
+            if sep:
+                attrs[key] = value
+    else:
+        for key, value in ATTRIBUTE_PATTERN.findall(text):
+            attrs[key] = unquote(value)
+    return attrs
+
+
+def is_flag(token):
+    # Flag letters are short upper-case words like "X" or "XD"
+    return "=" not in token and token.isalpha() and token.isupper()
+
+
+def start_row(line):
+    # Return a Row if line starts a new entry (" 12 XD address=..."), otherwise None
+    if '"' not in line and ";;;" not in line:
+        # Fast path: plain tokens, flags are the flag words right after the index
+        tokens = line.split()
+        if not tokens or not tokens[0].isdigit():
+            return None
+        flags = ""
+        attrs = {}
+        in_flags = True
+        for token in tokens[1:]:
+            key, sep, value = token.partition("=")
+            if sep:
+                attrs[key] = value
+                in_flags = False
+            elif in_flags and token.isalpha() and token.isupper():
+                flags += token
+            else:
+                in_flags = False
+        return Row(int(tokens[0]), flags, "", attrs)
+
+    stripped = line.lstrip()
+    if not stripped or not stripped[0].isdigit():
+        return None
+    head, _, rest = stripped.partition(" ")
+    if not head.isdigit():
+        return None
+
+    # Flag letters sit between the index and the first attribute or comment
+    flags = []
+    comment = ""
+    rest = rest.lstrip()
+    while rest:
+        if rest.startswith(";;;"):
+            comment = rest[3:].strip()
+            rest = ""
+            break
+        token, _, remainder = rest.partition(" ")
+        if not is_flag(token):
+            break
+        flags.append(token)
+        rest = remainder.lstrip()
+
+    row = Row(int(head), "".join(flags), comment)
+    parse_attributes(rest, row.attrs)
+    return row
+
+
+def iter_rows(lines, detail=False):
+    # Yield a Row for every entry in an iterable of lines.
+    # In terse output every entry is one line. In detail output an entry continues over
+    # indented lines until the next index or a blank line, so it is yielded when it ends.
+    # Numbered lines without a single attribute (plain print output) aren't entries.
+    row = None
+    for line in lines:
+        new_row = start_row(line)
+        if not detail:
+            if new_row is not None and new_row.attrs:
+                yield new_row
+            continue
+
+        if new_row is not None:
+            if row is not None and row.attrs:
+                yield row
+            row = new_row
+        elif row is not None:
+            stripped = line.strip()
+            if not stripped:
+                if row.attrs:
+                    yield row
+                row = None
+            elif stripped.startswith(";;;"):
+                row.comment = stripped[3:].strip()
+            else:
+                parse_attributes(stripped, row.attrs)
+    if row is not None and row.attrs:
+        yield row
+
+
+def iter_column_rows(lines):
+    # Yield a Row for every entry of plain print output. Values sit under their column
+    # name in the "#" header line, so each is the text between its column's start and the
+    # next one's; an empty column is just an empty value. Comments are ";;;" lines above
+    # their entry.
+    columns = None
+    comment = ""
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            columns = [(match.group().lower(), match.start()) for match in COLUMN_PATTERN.finditer(line)]
+            continue
+        if not columns:
+            continue
+        if stripped.startswith(";;;"):
+            comment = stripped[3:].strip()
+            continue
+        head = line[:columns[0][1]].split()
+        if not head or not head[0].isdigit():
+            continue
+        ends = [start for _, start in columns[1:]] + [None]
+        attrs = {name: line[start:end].strip() for (name, start), end in zip(columns, ends)}
+        yield Row(int(head[0]), "".join(head[1:]), comment, attrs)
+        comment = ""
+
+
+# API boolean attributes and the flag letters print shows for them
+FLAG_ATTRIBUTES = (
+    ("disabled", "X"),
+    ("invalid", "I"),
+    ("dhcp", "H"),
+    ("dynamic", "D"),
+    ("published", "P"),
+    ("complete", "C"),
+    ("blocked", "B"),
+    ("radius", "R"),
+)
+
+
+class Record:
+    # Base for typed table entries. Subclasses list their fields in __slots__ and map
+    # each field to the RouterOS attribute it is read from in "attributes".
+    __slots__ = ("index", "flags", "comment")
+    attributes = {}
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        record.index = row.index
+        record.flags = row.flags
+        get = row.attrs.get
+        # Detail output puts comments on a ";;;" line, terse output as comment=...
+        record.comment = row.comment or get("comment", "")
+        for field, key in cls.attributes.items():
+            setattr(record, field, get(key, ""))
+        return record
+
+    @classmethod
+    def from_attributes(cls, attributes):
+        # Build a record from a RouterOS API reply. The API uses the same attribute names
+        # as terse output but reports flags as booleans and the index as an ".id" like "*1A".
+        item_id = attributes.get(".id", "")
+        index = int(item_id[1:], 16) if item_id.startswith("*") else None
+        flags = "".join(letter for name, letter in FLAG_ATTRIBUTES if attributes.get(name) == "true")
+        return cls.from_row(Row(index, flags, "", attributes))
+
+    @classmethod
+    def fields(cls):
+        return ("index", "flags", "comment") + tuple(cls.attributes)
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.fields()}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={value!r}" for field, value in self.as_dict().items())
+        return f"{type(self).__name__}({values})"
+
+
+class ArpEntry(Record):
+    __slots__ = ("address", "mac_address", "interface", "status")
+    attributes = {
+        "address": "address",
+        "mac_address": "mac-address",
+        "interface": "interface",
+        "status": "status",
+    }
+
+
+class Lease(Record):
+    __slots__ = ("address", "mac_address", "host_name", "server", "status", "last_seen")
+    attributes = {
+        "address": "address",
+        "mac_address": "mac-address",
+        "host_name": "host-name",
+        "server": "server",
+        "status": "status",
+        "last_seen": "last-seen",
+    }
+
+
+class Address(Record):
+    __slots__ = ("address", "network", "interface")
+    attributes = {
+        "address": "address",
+        "network": "network",
+        "interface": "interface",
+    }
+
+
+class Neighbor(Record):
+    __slots__ = ("interface", "address", "mac_address", "identity", "platform", "version", "board")
+    attributes = {
+        "interface": "interface",
+        "address": "address",
+        "mac_address": "mac-address",
+        "identity": "identity",
+        "platform": "platform",
+        "version": "version",
+        "board": "board",
+    }
+
+
+# Command and record type for each table the collectors know about
+TABLES = {
+    "arp": ("/ip/arp/print terse", ArpEntry),
+    "dhcp": ("/ip/dhcp/lease/print terse", Lease),
+    "addresses": ("/ip/address/print terse", Address),
+    "neighbors": ("/ip/neighbor/print terse", Neighbor),
+}
+
+
+def parse(lines, record_type, detail=False):
+    # Yield record_type instances from an iterable of lines
+    from_row = record_type.from_row
+    for row in iter_rows(lines, detail):
+        yield from_row(row)
+
+
+def parse_text(text, record_type, detail=False):
+    # Convenience wrapper for output that is already in memory
+    return parse(text.splitlines(), record_type, detail)
+
+
+def parse_columns(lines, record_type):
+    # Yield record_type instances from plain print output
+    from_row = record_type.from_row
+    for row in iter_column_rows(lines):
+        yield from_row(row)
@@ -1,20 +1,15 @@
-import re
+import tableparser
 
 with open("dhcpleases.txt", mode="r") as f:
-    output = f.read()
+    dhcp_leases = list(tableparser.parse_columns(f, tableparser.Lease))
 
-pattern = r"(\d+\.\d+\.\d+\.\d+)\s+(\w+:\w+:\w+:\w+:\w+:\w+)(?:\s+(\S+)|\s+)(?:\s+(\S+))\s+(\w+)\s+(\w+)(?:\s+$|$)"
-
-m = re.findall(rf"{pattern}", output, flags=re.MULTILINE)
-
-if m:
-    dhcp_leases = m
+if dhcp_leases:
     print("-" * 25)
     for entry in dhcp_leases:
-        print(f"Server: {entry[3]}")
-        print(f"  IP: {entry[0]}")
-        print(f"  MAC: {entry[1]}")
-        print(f"  Hostname: {entry[2]}")
-        print(f"  Status: {entry[4]}")
-        print(f"  Last Seen: {entry[5]}")
-        print("-" * 25)
\ No newline at end of file
+        print(f"Server: {entry.server}")
+        print(f"  IP: {entry.address}")
+        print(f"  MAC: {entry.mac_address}")
+        print(f"  Hostname: {entry.host_name}")
+        print(f"  Status: {entry.status}")
+        print(f"  Last Seen: {entry.last_seen}")
+        print("-" * 25)
@@ -0,0 +1,27 @@
+import sqlite3
+
+import addressaudit
+
+
+def test_missing_or_invalid_database(tmp_path, capsys):
+    assert addressaudit.main(["--database", str(tmp_path / "missing.db")]) == 1
+    assert "No inventory database" in capsys.readouterr().err
+
+    (tmp_path / "notes.db").write_text("not a database\n")
+    assert addressaudit.main(["--database", str(tmp_path / "notes.db")]) == 1
+    assert "Could not read" in capsys.readouterr().err
+
+    sqlite3.connect(str(tmp_path / "empty.db")).close()
+    assert addressaudit.main(["--database", str(tmp_path / "empty.db")]) == 1
+
+
+def test_duplicates_and_mismatched_prefixes():
+    report = addressaudit.audit([
+        ("r1", "ether1", "10.0.0.1/24", ""),
+        ("r2", "ether1", "10.0.0.1/24", ""),
+        ("r3", "ether2", "10.0.0.9/16", ""),
+        ("r4", "ether3", "10.9.0.1/24", "X"),
+    ])
+    assert [finding["ip"] for finding in report["duplicates"]] == ["10.0.0.1"]
+    assert [(finding["subnet"], finding["within"]) for finding in report["mismatched_prefixes"]] == [("10.0.0.0/24", "10.0.0.0/16")]
+    assert report["addresses"] == 3
@@ -0,0 +1,63 @@
+import json
+
+import backupstore
+
+
+def test_identity_with_slash_gets_a_safe_index(tmp_path):
+    store = backupstore.BackupStore(str(tmp_path))
+    assert store.record("site/core 1", "10.0.0.1", 22, "e1", "b1")
+    assert not store.record("site/core 1", "10.0.0.1", 22, "e1", "b1")
+    assert [path.name for path in (tmp_path / "index").iterdir()] == ["site_core_1_10.0.0.1-22.json"]
+    assert [version["export"] for version in store.versions("site/core 1", "10.0.0.1", 22)] == ["e1"]
+
+
+def test_routers_sharing_an_identity_keep_their_own_history(tmp_path):
+    store = backupstore.BackupStore(str(tmp_path))
+    assert store.record("MikroTik", "10.0.0.1", 22, "e1", "b1")
+    assert store.record("MikroTik", "10.0.0.2", 22, "e2", "b2")
+    assert not store.record("MikroTik", "10.0.0.1", 22, "e1", "b1")
+    assert store.latest("MikroTik", "10.0.0.1", 22)["export"] == "e1"
+    assert store.latest("MikroTik", "10.0.0.2", 22)["export"] == "e2"
+    assert store.latest("MikroTik", "10.0.0.1", 2222) is None
+
+
+def test_identity_index_hands_over_this_routers_versions(tmp_path):
+    store = backupstore.BackupStore(str(tmp_path))
+    old = [
+        {"created": "2024-01-01T00:00:00", "checked": "2024-01-01T00:00:00", "router_ip": "10.0.0.1", "export": "e1", "backup": "b1"},
+        {"created": "2024-01-01T00:00:00", "checked": "2024-01-01T00:00:00", "router_ip": "10.0.0.2", "export": "e9", "backup": "b9"},
+    ]
+    (tmp_path / "index" / "core.json").write_text(json.dumps(old))
+
+    assert store.latest("core router", "10.0.0.1", 22)["export"] == "e1"
+    assert store.record("core router", "10.0.0.1", 22, "e2", "b2")
+    assert [version["export"] for version in store.versions("core router", "10.0.0.1", 22)] == ["e1", "e2"]
+    assert [version["export"] for version in store.versions("core router", "10.0.0.2", 22)] == ["e9"]
+    assert sorted(path.name for path in (tmp_path / "index").iterdir()) == ["core.json", "core_router_10.0.0.1-22.json"]
+
+
+def test_export_hash_ignores_the_date_header(tmp_path):
+    body = [b"/ip address\n", b"add address=10.0.0.1/24 interface=ether1\n"]
+
+    def digest(chunks):
+        hasher = backupstore.ExportHasher()
+        for chunk in chunks:
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+    monday = digest([b"# 2024-01-15 10:00:00 by Rou", b"terOS 7.13.2\n/ip add", b"ress\n", body[1]])
+    tuesday = digest([b"# jan/16/2024 10:00:00 by RouterOS 7.13.2\n", *body])
+    assert monday == tuesday
+    assert digest([b"# a comment\n", *body]) != digest([b"# another comment\n", *body])
+    # No newline at all: the single line is still hashed
+    assert digest([b"/system identity"]) != digest([b"/system clock"])
+
+    store = backupstore.BackupStore(str(tmp_path))
+    assert store.put_export([b"# 2024-01-15 10:00:00 by RouterOS 7.13.2\n", *body])[0] == monday
+
+
+def test_empty_export_is_not_stored(tmp_path):
+    store = backupstore.BackupStore(str(tmp_path))
+    assert store.put_export([]) == (None, None, False)
+    assert store.put_export([b""]) == (None, None, False)
+    assert list((tmp_path / "objects").iterdir()) == []
@@ -0,0 +1,23 @@
+import cachefile
+import fleetscan
+
+
+def test_write_merges_with_other_processes(tmp_path):
+    path = str(tmp_path / "sub" / "cache.json")
+    first = cachefile.JsonCache(path)
+    second = cachefile.JsonCache(path)
+    assert first.load() == {}
+
+    # Another process writes after this one has loaded the file
+    second.write(lambda entries: entries.update(a=1))
+    first.write(lambda entries: entries.update(b=2))
+    assert first.load() == {"a": 1, "b": 2}
+    assert cachefile.JsonCache(path).load() == {"a": 1, "b": 2}
+    assert [name for name in (tmp_path / "sub").iterdir()] == [tmp_path / "sub" / "cache.json"]
+
+
+def test_unreadable_file_is_an_empty_cache(tmp_path):
+    (tmp_path / "scan.json").write_text("{not json")
+    assert fleetscan.load_cache(str(tmp_path / "scan.json")) == {}
+    fleetscan.save_cache([{"host": "10.0.0.1", "port": 22, "reachable": True}], str(tmp_path / "scan.json"))
+    assert list(fleetscan.load_cache(str(tmp_path / "scan.json"))) == ["10.0.0.1:22"]
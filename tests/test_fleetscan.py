@@ -0,0 +1,32 @@
+import time
+
+import fleetscan
+import latencyhistory
+
+
+def test_unreachable_results_are_probed_again_sooner(tmp_path, monkeypatch):
+    probed = []
+
+    async def probe_all(hosts, port=22, timeout=None, concurrency=None, timeouts=None):
+        probed.extend(hosts)
+        return [{"host": host, "port": port, "reachable": True, "rtt_ms": None, "checked": time.time()} for host in hosts]
+
+    monkeypatch.setattr(fleetscan, "probe_all", probe_all)
+    monkeypatch.setattr(latencyhistory, "timeout", lambda router, phase, command="", default=None: default)
+    cache_path = str(tmp_path / "scan.json")
+    checked = time.time() - fleetscan.NEGATIVE_TTL - 1
+    fleetscan.save_cache([
+        {"host": "up", "port": 22, "reachable": True, "checked": checked},
+        {"host": "down", "port": 22, "reachable": False, "checked": checked},
+        {"host": "just-down", "port": 22, "reachable": False, "checked": time.time()},
+    ], cache_path)
+
+    results = fleetscan.scan(["up", "down", "just-down"], cache_path=cache_path)
+    assert probed == ["down"]
+    assert [result["reachable"] for result in results] == [True, True, False]
+
+    # The single-host pre-check never trusts a cached "unreachable"
+    assert fleetscan.check_host("just-down", cache_path=cache_path)["reachable"]
+    assert probed == ["down", "just-down"]
+    assert fleetscan.check_host("up", cache_path=cache_path)["reachable"]
+    assert probed == ["down", "just-down"]
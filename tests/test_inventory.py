@@ -0,0 +1,42 @@
+import queue
+import threading
+
+import pytest
+
+import inventory
+import tableparser
+
+
+def lease_row(router, collected_at, address):
+    lease = tableparser.Lease.from_attributes({".id": "*1", "address": address, "mac-address": "AA:BB:CC:DD:EE:01"})
+    return (router, collected_at) + tuple(getattr(lease, field) for field in tableparser.Lease.fields())
+
+
+def run_writer(connection, items, routers=1):
+    batches = queue.Queue()
+    for item in items:
+        batches.put(item)
+    return inventory.write_batches(connection, batches, routers)
+
+
+def test_failed_router_keeps_last_good_snapshot(tmp_path):
+    connection = inventory.open_database(str(tmp_path / "inventory.db"))
+    run_writer(connection, [("rows", "dhcp", [lease_row("r1", 1.0, "10.0.0.5")]), ("done", "r1", 1.0, 1, "")])
+    # Second run times out after sending part of the table
+    run_writer(connection, [("rows", "dhcp", [lease_row("r1", 2.0, "10.0.0.6")]), ("done", "r1", 2.0, 1, "timed out")])
+
+    assert connection.execute("SELECT address, collected_at FROM dhcp").fetchall() == [("10.0.0.5", 1.0)]
+    assert connection.execute("SELECT collected_at, rows, error FROM collections").fetchall() == [(1.0, 1, "timed out")]
+
+    run_writer(connection, [("rows", "dhcp", [lease_row("r1", 3.0, "10.0.0.7")]), ("done", "r1", 3.0, 1, "")])
+    assert connection.execute("SELECT address FROM dhcp").fetchall() == [("10.0.0.7",)]
+    assert connection.execute("SELECT collected_at, error FROM collections").fetchall() == [(3.0, "")]
+
+
+def test_put_gives_up_once_cancelled():
+    batches = queue.Queue(maxsize=1)
+    batches.put("full")
+    cancelled = threading.Event()
+    cancelled.set()
+    with pytest.raises(RuntimeError):
+        inventory.put(batches, "rows", cancelled)
@@ -0,0 +1,31 @@
+import latencyhistory
+import metrics
+
+
+def run(history, phase, seconds, error=None):
+    # One run of a script that timed `phase` once; metrics.timer adds error= when the block raises
+    registry = metrics.Registry()
+    registry.observe(phase, "r1", seconds, **({"error": error} if error else {}))
+    history.record(registry)
+
+
+def test_failed_connects_do_not_raise_the_timeout(tmp_path):
+    history = latencyhistory.LatencyHistory(str(tmp_path / "latency.json"))
+    for _ in range(3):
+        run(history, "tcp", 0.05)
+    assert history.timeout("r1", "tcp") == 2
+
+    # Connects that hit their timeout leave the timeout where it was
+    for _ in range(3):
+        run(history, "tcp", 10.0, "timeout")
+    assert history.timeout("r1", "tcp") == 2
+    assert len(history.samples("r1", "tcp")) == 3
+
+
+def test_failed_runs_still_order_routers(tmp_path):
+    history = latencyhistory.LatencyHistory(str(tmp_path / "latency.json"))
+    registry = metrics.Registry()
+    registry.observe("backup", "slow", 40.0, error="TimeoutError")
+    registry.observe("backup", "fast", 2.0)
+    history.record(registry)
+    assert history.slowest_first(["fast", "slow"], "backup") == ["slow", "fast"]
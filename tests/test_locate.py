@@ -0,0 +1,37 @@
+import pytest
+
+import locate
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("10.0.0.15", ("ip", 0x0A00000F)),
+    ("192.168.100.254", ("ip", 0xC0A864FE)),
+    ("10.0.0.15/24", ("ip", 0x0A00000F)),
+    ("00:11:22:33:44:55", ("mac", 0x001122334455)),
+    ("00-11-22-33-44-55", ("mac", 0x001122334455)),
+    ("0011.2233.4455", ("mac", 0x001122334455)),
+    ("001122334455", ("mac", 0x001122334455)),
+    ("aa:bb:cc:dd:ee:FF", ("mac", 0xAABBCCDDEEFF)),
+    ("printer-2nd-floor", ("host", "printer-2nd-floor")),
+    ("Core-Router", ("host", "core-router")),
+    # Mixed or misplaced separators are not MACs
+    ("00:11-22:33:44:55", ("host", "00:11-22:33:44:55")),
+    ("001.122.334.455", ("host", "001.122.334.455")),
+    ("cafe-babe-face", ("host", "cafe-babe-face")),
+])
+def test_classify(query, expected):
+    assert locate.classify(query) == expected
+
+
+def test_find_dotted_ip_with_three_digit_octets():
+    index = locate.LocationIndex()
+    index.add([
+        ("arp", "r1", "bridge", "192.168.100.254", "00:11:22:33:44:55", "", "reachable", ""),
+        ("dhcp", "r1", "dhcp1", "10.0.0.5", "AA:BB:CC:DD:EE:01", "Phone", "bound", "1m"),
+    ])
+    index.routers = {"r1": 1.0}
+    index.sort()
+    assert [match["interface"] for match in index.find("192.168.100.254")] == ["bridge"]
+    assert [match["address"] for match in index.find("aabb.ccdd.ee01")] == ["10.0.0.5"]
+    assert [match["table"] for match in index.find("phone")] == ["dhcp"]
+    assert index.find("10.0.0.6") == []
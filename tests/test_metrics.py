@@ -0,0 +1,48 @@
+import json
+
+import metrics
+
+
+def test_textfile_has_router_and_fleet_histograms(tmp_path):
+    registry = metrics.Registry()
+    registry.observe("auth", "10.0.0.1", 0.02)
+    registry.observe("auth", "10.0.0.2", 0.3)
+    registry.observe("command", "10.0.0.1", 0.004, bytes=2048, command="/ip arp print")
+    registry.observe("command", "10.0.0.1", 0.006, bytes=1024, command="/ip arp print")
+    path = str(tmp_path / "mikrotik.prom")
+    registry.write_textfile(path)
+    with open(path) as file:
+        lines = file.read().splitlines()
+
+    assert 'mikrotik_phase_seconds_bucket{phase="auth",router="10.0.0.1",le="0.025"} 1' in lines
+    assert 'mikrotik_phase_seconds_bucket{phase="auth",router="10.0.0.2",le="0.25"} 0' in lines
+    assert 'mikrotik_phase_seconds_count{phase="auth",router="10.0.0.2"} 1' in lines
+    assert 'mikrotik_fleet_phase_seconds_bucket{phase="auth",le="0.5"} 2' in lines
+    assert 'mikrotik_fleet_phase_seconds_bucket{phase="auth",le="+Inf"} 2' in lines
+    assert 'mikrotik_phase_seconds_bucket{phase="command",command="/ip arp print",router="10.0.0.1",le="0.005"} 1' in lines
+    assert 'mikrotik_phase_bytes_total{phase="command",command="/ip arp print",router="10.0.0.1"} 3072' in lines
+    assert lines.count("# TYPE mikrotik_phase_seconds histogram") == 1
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
+
+
+def test_timer_records_errors_and_labels_drop_arguments(tmp_path):
+    registry = metrics.Registry()
+    path = str(tmp_path / "phases.jsonl")
+    registry.open_json_log(path)
+    try:
+        with registry.timer("sftp_download", "10.0.0.1") as phase:
+            phase["bytes"] = 10
+            raise OSError("lost")
+    except OSError:
+        pass
+    registry.observe("command", 'router "a"\n', 1, command=metrics.command_label("/system backup save name=x password=y"))
+    registry.close()
+
+    with open(path) as file:
+        entries = [json.loads(line) for line in file]
+    assert [(entry["phase"], entry.get("bytes"), entry.get("error")) for entry in entries] == \
+        [("sftp_download", 10, "OSError"), ("command", None, None)]
+    assert entries[1]["command"] == "/system backup save"
+    histogram = registry.histograms[("sftp_download", "", "10.0.0.1")]
+    assert (histogram.count, histogram.succeeded) == (1, 0)
+    assert 'router="router \\"a\\"\\n"' in registry.textfile()
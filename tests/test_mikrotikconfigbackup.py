@@ -0,0 +1,40 @@
+import argparse
+import datetime
+
+import mikrotikconfigbackup
+
+
+def test_file_names_differ_for_routers_sharing_an_identity():
+    now = datetime.datetime(2026, 1, 2, 3, 4, 5)
+    first = mikrotikconfigbackup.name_files("MikroTik", now, "10.0.0.1", 22)
+    second = mikrotikconfigbackup.name_files("MikroTik", now, "10.0.0.2", 22)
+    other_port = mikrotikconfigbackup.name_files("MikroTik", now, "10.0.0.1", 2222)
+    assert len({*first, *second, *other_port}) == 6
+    assert first == ("MikroTik_10.0.0.1-22_cfg_backup_2026-01-02-030405.rsc", "MikroTik_10.0.0.1-22_sys_backup_2026-01-02-030405.backup")
+    # Nothing the unquoted file= and name= arguments can't take
+    assert mikrotikconfigbackup.name_files("core / edge", now, "fe80::1", 22)[0] == "core_edge_fe80_1-22_cfg_backup_2026-01-02-030405.rsc"
+
+
+class FakeSession:
+    def __init__(self, replies):
+        self.replies = replies
+        self.commands = []
+
+    def run(self, command):
+        self.commands.append(command)
+        return self.replies.get(command.split(" name=")[0].split(" file=")[0], ("", "", 0))
+
+
+def test_failed_system_backup_is_reported():
+    options = argparse.Namespace(encryption_password="secret")
+    session = FakeSession({"/system backup save": ("", "failure: not enough space\n", 0)})
+    failed = mikrotikconfigbackup.execute_backups(session, "10.0.0.1", "a.rsc", "a.backup", options)
+    assert failed == "'/system backup save name=a.backup' failed (exit 0): failure: not enough space"
+    assert session.commands == ["/export file=a.rsc", "/system backup save name=a.backup password=secret"]
+
+    # A failed export stops before the system backup
+    session = FakeSession({"/export": ("", "", 1)})
+    assert "'/export file=a.rsc' failed (exit 1)" in mikrotikconfigbackup.execute_backups(session, "10.0.0.1", "a.rsc", "a.backup", options)
+    assert session.commands == ["/export file=a.rsc"]
+
+    assert mikrotikconfigbackup.execute_backups(FakeSession({}), "10.0.0.1", None, "a.backup", options) is None
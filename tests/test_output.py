@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import output
+import tableparser
+
+
+def leases():
+    return [
+        tableparser.Lease.from_attributes({".id": "*1A", "address": "10.0.0.5", "mac-address": "AA:BB:CC:DD:EE:01",
+                                           "host-name": 'printer "2nd floor"', "server": "dhcp1", "status": "bound",
+                                           "dynamic": "true", "comment": "héllo, world"}),
+        tableparser.Lease.from_row(tableparser.Row(3, "", "", {"address": "10.0.0.6", "status": "waiting"})),
+    ]
+
+
+def test_json_lines_match_json_dumps():
+    file = io.StringIO()
+    with output.WRITERS["jsonl"](file, tableparser.Lease, extra={"router": "10.0.0.1"}) as writer:
+        assert writer.write_all(leases()) == 2
+    lines = [json.loads(line) for line in file.getvalue().splitlines()]
+    assert lines == [dict({"router": "10.0.0.1"}, **lease.as_dict()) for lease in leases()]
+    assert lines[0]["index"] == 26 and lines[0]["flags"] == "D"
+    assert list(lines[0]) == ["router", *tableparser.Lease.fields()]
+
+
+def test_csv_rows_with_and_without_header():
+    file = io.StringIO()
+    with output.WRITERS["csv"](file, tableparser.Lease, extra={"router": "10.0.0.1"}) as writer:
+        writer.write(leases()[0])
+        writer.write_all(leases()[1:])
+    rows = list(csv.reader(io.StringIO(file.getvalue())))
+    assert rows[0] == ["router", *tableparser.Lease.fields()]
+    assert rows[1][:5] == ["10.0.0.1", "26", "D", "héllo, world", "10.0.0.5"]
+    assert rows[1][6] == 'printer "2nd floor"'
+    assert rows[2][:2] == ["10.0.0.1", "3"]
+
+    file = io.StringIO()
+    output.WRITERS["csv"](file, tableparser.Lease, headings=False).write_all(leases())
+    assert len(list(csv.reader(io.StringIO(file.getvalue())))) == 2
+
+
+def test_text_blocks_and_output_file(tmp_path):
+    path = str(tmp_path / "leases.txt")
+    with output.open_writer("text", tableparser.Address, path, extra={"router": "r1"}) as writer:
+        writer.write(tableparser.Address.from_attributes({"address": "10.0.0.1/24", "network": "10.0.0.0", "interface": "bridge"}))
+    with open(path) as file:
+        assert file.read() == ("router: r1\nindex: None\nflags: \ncomment: \naddress: 10.0.0.1/24\nnetwork: 10.0.0.0\n"
+                               f"interface: bridge\n{output.SEPARATOR}\n")
+    file = io.StringIO()
+    output.TextWriter(file, tableparser.Address, format_entry=lambda record: f"{record.address}\n").write(
+        tableparser.Address.from_attributes({"address": "10.0.0.2/24"}))
+    assert file.getvalue() == "10.0.0.2/24\n"
@@ -0,0 +1,35 @@
+import json
+
+import parsedumps
+
+COLUMNS = """Flags: X - disabled, R - radius, D - dynamic, B - blocked
+ #   ADDRESS         MAC-ADDRESS       HOST-NAME  SERVER  STATUS  LAST-SEEN
+ 0   10.0.0.5        AA:BB:CC:DD:EE:01 printer    dhcp1   bound   1m2s
+ 1 D 10.0.0.6        AA:BB:CC:DD:EE:02            dhcp1   bound   5s
+ 2 D 10.0.0.7        AA:BB:CC:DD:EE:03 phone      dhcp1   bound   9s
+"""
+TERSE = " 0 D address=10.0.0.9 mac-address=AA:BB:CC:DD:EE:09 server=dhcp2 status=bound\n"
+
+
+def read_jsonl(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_plain_print_dump_split_into_chunks(tmp_path):
+    (tmp_path / "columns.txt").write_text(COLUMNS)
+    out = tmp_path / "out.jsonl"
+    files, records, failed = parsedumps.parse_dumps([str(tmp_path / "columns.txt")], "dhcp", "jsonl", str(out), 1, 150)
+    assert (files, records, failed) == (1, 3, [])
+    leases = read_jsonl(out)
+    assert [lease["address"] for lease in leases] == ["10.0.0.5", "10.0.0.6", "10.0.0.7"]
+    assert leases[1]["host_name"] == "" and leases[2]["host_name"] == "phone"
+
+
+def test_files_without_entries_fail_the_run(tmp_path, capsys):
+    (tmp_path / "a-terse.txt").write_text(TERSE)
+    (tmp_path / "b-notes.txt").write_text("not a dump\n")
+    out = tmp_path / "out.jsonl"
+    assert parsedumps.main(["-t", "dhcp", "-w", "1", "-o", str(out), str(tmp_path / "a-terse.txt"), str(tmp_path / "b-notes.txt")]) == 1
+    assert "b-notes.txt" in capsys.readouterr().err
+    assert [lease["address"] for lease in read_jsonl(out)] == ["10.0.0.9"]
@@ -0,0 +1,8 @@
+import routerlist
+
+
+def test_sites_comments_and_blank_lines(tmp_path):
+    path = tmp_path / "routers.txt"
+    path.write_text("# core\n10.0.0.1 hq\n\n  10.0.0.2   branch-3  # spare\n10.0.0.3\n   # 10.0.0.4\n")
+    assert routerlist.read_targets(str(path)) == [("10.0.0.1", "hq"), ("10.0.0.2", "branch-3"), ("10.0.0.3", "")]
+    assert routerlist.read_routers(str(path)) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
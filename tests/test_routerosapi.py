@@ -0,0 +1,84 @@
+import socket
+import threading
+
+import pytest
+
+import routerosapi
+
+
+def test_word_lengths_round_trip_at_every_encoding_boundary():
+    for length in (0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000):
+        encoded = routerosapi.encode_length(length)
+        assert len(encoded) == 1 + (length >= 0x80) + (length >= 0x4000) + (length >= 0x200000)
+    words = ["/ip/arp/print", "=comment=" + "x" * 0x80, "=comment=" + "y" * 0x4000]
+    data = routerosapi.encode_sentence(words) + routerosapi.encode_sentence(["!done"])
+    assert routerosapi.split_sentence(data, 0)[0] == words
+    # A sentence cut short anywhere is incomplete, not garbage
+    for end in (1, 2, 150, len(data) // 2):
+        assert routerosapi.split_sentence(data[:end], 0) is None
+
+
+def test_cli_commands_become_api_words():
+    assert routerosapi.api_command("/ip address add address=10.0.0.1/24 interface=ether1") == \
+        ["/ip/address/add", "=address=10.0.0.1/24", "=interface=ether1"]
+    assert routerosapi.api_command("/ip arp print terse proplist=address,mac-address where interface=bridge and dynamic!=true") == \
+        ["/ip/arp/print", "=.proplist=address,mac-address", "?interface=bridge", "?dynamic=true", "?#!"]
+    assert routerosapi.api_command("/interface/print .proplist=name where rx-byte>1000") == \
+        ["/interface/print", "=.proplist=name", "?>rx-byte=1000"]
+    assert routerosapi.api_command("/ip/arp/print ?interface=bridge") == ["/ip/arp/print", "?interface=bridge"]
+    with pytest.raises(ValueError):
+        routerosapi.api_command('/ip arp print where address~"10.0."')
+    with pytest.raises(ValueError):
+        routerosapi.api_command("/ip arp print where interface=bridge or interface=ether1")
+
+
+class FakeRouter:
+    # The router's end of a socket pair, with a session logged in on the other end
+    def __init__(self):
+        router_side, client_side = socket.socketpair()
+        self.sock = router_side
+        self.reader = routerosapi.SentenceReader(router_side)
+        self.session = routerosapi.ApiSession("fake", "u", "p", timeout=5)
+        self.session.sock = client_side
+        self.session.reader = routerosapi.SentenceReader(client_side)
+        threading.Thread(target=self.session.read_replies, daemon=True).start()
+
+    def receive(self):
+        return self.reader.read_sentence()
+
+    def reply(self, *words):
+        self.sock.sendall(routerosapi.encode_sentence(list(words)))
+
+
+def test_records_trap_and_done_are_routed_by_tag():
+    router = FakeRouter()
+    first = router.session.request("/ip/arp/print")
+    second = router.session.request("/ip/address/remove .id=*9")
+    assert router.receive() == ["/ip/arp/print", ".tag=1"]
+    assert router.receive() == ["/ip/address/remove", "=.id=*9", ".tag=2"]
+    assert router.session.commands_sent == 2
+
+    router.reply("!trap", "=message=no such item", ".tag=2")
+    router.reply("!re", "=address=10.0.0.1", ".tag=1")
+    router.reply("!done", ".tag=2")
+    router.reply("!re", "=address=10.0.0.2", ".tag=1")
+    router.reply("!done", "=ret=*1", ".tag=1")
+    assert [record["address"] for record in first] == ["10.0.0.1", "10.0.0.2"]
+    assert (first.exit_status, first.err, first.done) == (0, "", {"ret": "*1"})
+    assert list(second) == []
+    assert (second.exit_status, second.err) == (1, "no such item")
+    assert router.session.pending == {}
+
+
+def test_fatal_fails_waiting_requests_and_timeouts_release_the_tag():
+    router = FakeRouter()
+    reply = router.session.request("/system/identity/print", timeout=0.05)
+    with pytest.raises(TimeoutError):
+        list(reply)
+    assert router.session.pending == {}
+
+    reply = router.session.request("/system/identity/print")
+    router.reply("!fatal", "=message=session terminated")
+    with pytest.raises(routerosapi.ApiError, match="session terminated"):
+        list(reply)
+    assert reply.exit_status == 1
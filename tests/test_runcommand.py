@@ -0,0 +1,122 @@
+import argparse
+import socket
+import threading
+import time
+
+import paramiko
+import pytest
+
+import collector
+import runcommand
+
+
+class FakeSession:
+    # Runs commands from a script of outcomes: "no-channel" fails before the command is sent,
+    # "timeout" after
+    def __init__(self, router, log, outcomes):
+        self.router = router
+        self.log = log
+        self.outcomes = outcomes
+        self.commands_sent = 0
+
+    def run(self, command):
+        if self.outcomes.get((self.router, command)) == "no-channel":
+            del self.outcomes[(self.router, command)]
+            raise paramiko.ChannelException(2, "Connect failed")
+        self.commands_sent += 1
+        self.log.append((self.router, command))
+        if self.outcomes.get((self.router, command)) == "timeout":
+            raise socket.timeout("timed out")
+        return "", "", 0
+
+
+@pytest.fixture
+def fleet(monkeypatch):
+    # connect_failures: router -> connects that time out before the session is made
+    state = {"log": [], "outcomes": {}, "connect_failures": {}}
+
+    def connect(transport, router_ip, username, password, api_port=None, ssh_port=22):
+        if state["connect_failures"].get(router_ip, 0):
+            state["connect_failures"][router_ip] -= 1
+            raise socket.timeout("timed out")
+        return FakeSession(router_ip, state["log"], state["outcomes"])
+
+    monkeypatch.setattr(collector, "connect", connect)
+    monkeypatch.setattr(collector, "close", lambda session, router_ip=None: None)
+    return state
+
+
+def options(**overrides):
+    values = dict(transport="ssh", api_port=None, port=22, stop_on_error=False, retries=2, backoff=0,
+                  workers=4, site_concurrency=None, site_rate=None, canary=0)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+def test_connect_timeouts_are_retried(fleet):
+    fleet["connect_failures"]["r1"] = 2
+    entry = runcommand.rollout_router(("r1", ""), ["/a", "/b"], "u", "p", options(), runcommand.SiteLimiter())
+    assert (entry["status"], entry["attempts"]) == ("ok", 3)
+    assert fleet["log"] == [("r1", "/a"), ("r1", "/b")]
+
+    fleet["connect_failures"]["r2"] = 3
+    entry = runcommand.rollout_router(("r2", ""), ["/a"], "u", "p", options(), runcommand.SiteLimiter())
+    assert (entry["status"], entry["attempts"], entry["commands"]) == ("error", 3, [])
+
+
+def test_channel_open_failure_is_retried_from_that_command(fleet):
+    fleet["outcomes"][("r1", "/b")] = "no-channel"
+    entry = runcommand.rollout_router(("r1", ""), ["/a", "/b", "/c"], "u", "p", options(), runcommand.SiteLimiter())
+    assert (entry["status"], entry["attempts"]) == ("ok", 2)
+    assert fleet["log"] == [("r1", "/a"), ("r1", "/b"), ("r1", "/c")]
+
+
+def test_command_that_failed_after_sending_is_not_sent_again(fleet):
+    fleet["outcomes"][("r1", "/ip address add address=10.0.0.1/24 interface=ether1")] = "timeout"
+    commands = ["/a", "/ip address add address=10.0.0.1/24 interface=ether1", "/c"]
+    entry = runcommand.rollout_router(("r1", ""), commands, "u", "p", options(), runcommand.SiteLimiter())
+    assert entry["status"] == "interrupted"
+    assert entry["attempts"] == 1
+    assert fleet["log"] == [("r1", "/a"), ("r1", commands[1])]
+    assert [command["exit_status"] for command in entry["commands"]] == [0, None]
+    assert "timed out" in entry["commands"][1]["error"]
+
+
+def test_failed_canary_skips_the_rest_and_duplicates_run_once(fleet, capsys):
+    fleet["connect_failures"]["r1"] = 10
+    targets = [("r1", "a"), ("r2", "a"), ("r2", "b"), ("r3", "b")]
+    entries = runcommand.rollout(targets, ["/a"], "u", "p", options(canary=1, retries=0))
+    assert [(entry["router"], entry["status"]) for entry in entries] == [("r1", "error"), ("r2", "skipped"), ("r3", "skipped")]
+    assert fleet["log"] == []
+    assert "repeated list entry for r2" in capsys.readouterr().out
+
+    entries = runcommand.rollout(targets[1:], ["/a"], "u", "p", options(canary=1))
+    assert [(entry["router"], entry["status"]) for entry in entries] == [("r2", "ok"), ("r3", "ok")]
+    assert sorted(fleet["log"]) == [("r2", "/a"), ("r3", "/a")]
+
+
+def test_site_limiter_caps_concurrency_and_rate():
+    limiter = runcommand.SiteLimiter(concurrency=2, rate=20)
+    active = []
+    peak = []
+    starts = []
+    lock = threading.Lock()
+
+    def work():
+        with limiter.slot("hq"):
+            with lock:
+                starts.append(time.monotonic())
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2
+    starts.sort()
+    assert all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:]))
@@ -0,0 +1,21 @@
+import socket
+
+import sessiond
+
+
+def test_available_needs_a_listening_daemon(tmp_path):
+    path = str(tmp_path / "sessiond.sock")
+    assert not sessiond.available(path)
+    assert not sessiond.available("")
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    try:
+        assert sessiond.available(path)
+    finally:
+        listener.close()
+
+    # The socket file outlives the daemon that created it
+    assert (tmp_path / "sessiond.sock").exists()
+    assert not sessiond.available(path)
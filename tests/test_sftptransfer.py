@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import types
+
+import pytest
+
+import sftptransfer
+
+
+class FakeRemoteFile:
+    def __init__(self, client, data):
+        self.client = client
+        self.data = data
+        self.position = 0
+
+    def seek(self, position):
+        self.position = position
+
+    def prefetch(self, end, max_concurrent_requests=None):
+        pass
+
+    def read(self, size):
+        if self.client.fail_at is not None and self.position <= self.client.fail_at < self.position + size:
+            self.client.fail_at = None
+            raise EOFError("Server connection dropped")
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        self.client.reads.append(len(data))
+        return data
+
+    def check(self, hash_algorithm):
+        # RouterOS has no check-file extension
+        if self.client.remote_digest is None:
+            raise IOError("Operation unsupported")
+        return bytes.fromhex(self.client.remote_digest)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeSftpClient:
+    # Serves one in-memory file; fail_at makes the read covering that offset drop the connection
+    def __init__(self, data, fail_at=None, remote_digest=None):
+        self.data = data
+        self.fail_at = fail_at
+        self.remote_digest = remote_digest
+        self.reads = []
+
+    def stat(self, path):
+        return types.SimpleNamespace(st_size=len(self.data))
+
+    def open(self, path, mode):
+        return FakeRemoteFile(self, self.data)
+
+
+DATA = os.urandom(300 * 1024)
+
+
+def test_interrupted_download_resumes_from_the_part_file(tmp_path):
+    local_path = str(tmp_path / "router.backup")
+    client = FakeSftpClient(DATA, fail_at=96 * 1024)
+    with pytest.raises(EOFError):
+        sftptransfer.download(client, "router.backup", local_path)
+    assert os.path.getsize(f"{local_path}.part") == 96 * 1024
+    assert not os.path.exists(local_path)
+
+    fetched, size, digest = sftptransfer.download(client, "router.backup", local_path)
+    assert (fetched, size) == (len(DATA) - 96 * 1024, len(DATA))
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    with open(local_path, "rb") as file:
+        assert file.read() == DATA
+    assert not os.path.exists(f"{local_path}.part")
+
+
+def test_ranges_resume_from_their_recorded_progress(tmp_path, monkeypatch):
+    monkeypatch.setattr(sftptransfer, "RANGE_MIN_SIZE", 0)
+    monkeypatch.setattr(sftptransfer, "PROGRESS_INTERVAL", sftptransfer.READ_SIZE)
+    local_path = str(tmp_path / "router.backup")
+    # The last of three 100 KiB ranges breaks 64 KiB in
+    client = FakeSftpClient(DATA, fail_at=264 * 1024)
+    with pytest.raises(EOFError):
+        sftptransfer.download(client, "router.backup", local_path, ranges=3)
+    assert os.path.getsize(f"{local_path}.part") == len(DATA)
+    with open(f"{local_path}.part.ranges") as file:
+        state = json.load(file)
+    assert state["size"] == len(DATA)
+    assert [span[:2] for span in state["ranges"]] == [[0, 102400], [102400, 204800], [204800, 307200]]
+    assert [span[2] for span in state["ranges"]] == [102400, 204800, 204800 + 2 * sftptransfer.READ_SIZE]
+
+    # The .ranges file is resumed even with ranges=1, and only the missing bytes are read
+    client.reads.clear()
+    fetched, size, digest = sftptransfer.download(client, "router.backup", local_path)
+    assert fetched == sum(client.reads) == len(DATA) - 204800 - 2 * sftptransfer.READ_SIZE
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    with open(local_path, "rb") as file:
+        assert file.read() == DATA
+    assert os.listdir(tmp_path) == ["router.backup"]
+
+
+def test_short_or_corrupt_downloads_are_not_renamed(tmp_path):
+    local_path = str(tmp_path / "router.backup")
+    with open(f"{local_path}.part", "wb") as file:
+        file.write(b"x" * (len(DATA) + 1))
+    # A .part longer than the remote file is started over
+    assert sftptransfer.download(FakeSftpClient(DATA), "router.backup", local_path)[0] == len(DATA)
+
+    client = FakeSftpClient(DATA, remote_digest=hashlib.sha256(b"something else").hexdigest())
+    with pytest.raises(sftptransfer.TransferError, match="Checksum mismatch"):
+        sftptransfer.download(client, "router.backup", str(tmp_path / "other.backup"))
+    assert not os.path.exists(tmp_path / "other.backup.part")
+    assert not os.path.exists(tmp_path / "other.backup")
@@ -0,0 +1,95 @@
+import io
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+import sshsession
+
+
+class FakeChannel:
+    # Hands out scripted stdout chunks; status_event is set once exit_status is known
+    def __init__(self, chunks, err=b"", exit_status=0):
+        self.chunks = list(chunks)
+        self.err = err
+        self.exit_status = exit_status
+        self.status_event = threading.Event()
+        if exit_status is not None:
+            self.status_event.set()
+        self.closed = False
+
+    def recv(self, size):
+        return self.chunks.pop(0) if self.chunks else b""
+
+    def makefile_stderr(self, mode):
+        return io.BytesIO(self.err)
+
+    def gettimeout(self):
+        return 0.05
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def close(self):
+        self.closed = True
+
+
+def test_lines_split_across_chunks():
+    chunks = [b" 0 address=10.0.0.1 sta", b"tus=bound\r\n 1 address=", b"10.0.0.2\r\n\r\n", b"caf\xc3", b"\xa9"]
+    assert list(sshsession.iter_lines(chunks)) == [" 0 address=10.0.0.1 status=bound", " 1 address=10.0.0.2", "", "café"]
+    assert list(sshsession.iter_lines([])) == []
+
+
+def test_stream_yields_lines_then_sets_err_and_exit_status():
+    channel = FakeChannel([b"a\nb", b"\nc\n"], err=b"failure: no such item\n", exit_status=1)
+    stream = sshsession.CommandStream(channel, router="10.0.0.1", command="/ip arp print")
+    lines = iter(stream)
+    assert next(lines) == "a"
+    # Nothing is known about the outcome until the output has been read
+    assert (stream.exit_status, stream.err) == (None, "")
+    assert list(lines) == ["b", "c"]
+    assert (stream.exit_status, stream.err, stream.bytes) == (1, "failure: no such item", 6)
+    assert channel.closed
+
+
+def test_stream_closed_early_releases_the_channel():
+    channel = FakeChannel([b"x" * 10] * 3)
+    stream = sshsession.CommandStream(channel)
+    chunks = stream.chunks()
+    next(chunks)
+    chunks.close()
+    assert channel.closed
+    assert stream.exit_status is None
+
+
+def test_missing_exit_status_times_out():
+    channel = FakeChannel([b"a\n"], exit_status=None)
+    with pytest.raises(socket.timeout):
+        list(sshsession.CommandStream(channel))
+    assert channel.closed
+
+
+def test_pool_reuses_one_transport_per_router():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    from fakerouter import PASSWORD, USERNAME, FakeRouter
+
+    router = FakeRouter(identity="core", rows=5).start()
+    pool = sshsession.SessionPool()
+    try:
+        session = pool.get("127.0.0.1", USERNAME, PASSWORD, router.port)
+        assert session.run("/system/identity/print") == ("name: core", "", 0)
+        assert pool.get("127.0.0.1", USERNAME, PASSWORD, router.port) is session
+        output, err, exit_status = session.run("/no/such/command")
+        assert (err, exit_status) == ("bad command name /no/such/command", 1)
+        assert (len(router.transports), router.commands, session.commands_sent) == (1, 2, 2)
+
+        # A dropped transport is replaced on the next use
+        session.transport.close()
+        assert pool.get("127.0.0.1", USERNAME, PASSWORD, router.port).run("/system/identity/print")[0] == "name: core"
+        assert len(router.transports) == 2
+    finally:
+        pool.close()
+        router.stop()
+    assert session.transport is None
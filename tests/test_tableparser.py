@@ -0,0 +1,49 @@
+import tableparser
+
+
+def test_terse_flags_stop_at_first_attribute():
+    rows = list(tableparser.iter_rows([
+        " 0 XD address=10.0.0.5 mac-address=AA:BB:CC:DD:EE:01 status=bound",
+        " 1   address=10.0.0.6 bogus status=waiting",
+        ' 2 D address=10.0.0.7 comment="two words"',
+    ]))
+    assert [(row.index, row.flags) for row in rows] == [(0, "XD"), (1, ""), (2, "D")]
+    assert rows[1].attrs == {"address": "10.0.0.6", "status": "waiting"}
+    assert rows[2].attrs["comment"] == "two words"
+
+
+def test_rows_without_attributes_are_dropped():
+    # Plain print output run through the key=value parser must not invent entries
+    lines = [
+        "Flags: X - disabled, D - dynamic",
+        " #   ADDRESS         MAC-ADDRESS       SERVER  STATUS",
+        " 0 D 10.0.0.5        AA:BB:CC:DD:EE:01 dhcp1   bound",
+    ]
+    assert list(tableparser.iter_rows(lines)) == []
+    assert list(tableparser.iter_rows(lines, detail=True)) == []
+
+
+def test_detail_row_attributes_on_continuation_lines():
+    rows = list(tableparser.iter_rows([
+        " 0 D ;;; printer",
+        "      address=10.0.0.5 mac-address=AA:BB:CC:DD:EE:01",
+        "",
+    ], detail=True))
+    assert len(rows) == 1
+    assert rows[0].comment == "printer"
+    assert rows[0].attrs["address"] == "10.0.0.5"
+
+
+def test_plain_print_columns():
+    leases = list(tableparser.parse_columns([
+        "Flags: X - disabled, R - radius, D - dynamic, B - blocked",
+        " #   ADDRESS         MAC-ADDRESS       HOST-NAME  SERVER  STATUS  LAST-SEEN",
+        " ;;; reserved",
+        " 0   10.0.0.5        AA:BB:CC:DD:EE:01 printer    dhcp1   bound   1m2s",
+        " 1 D 10.0.0.6        AA:BB:CC:DD:EE:02            dhcp1   bound   5s",
+    ], tableparser.Lease))
+    assert [(lease.index, lease.flags, lease.comment) for lease in leases] == [(0, "", "reserved"), (1, "D", "")]
+    assert leases[0].host_name == "printer"
+    assert leases[1].host_name == ""
+    assert (leases[1].address, leases[1].mac_address, leases[1].server, leases[1].status, leases[1].last_seen) == \
+        ("10.0.0.6", "AA:BB:CC:DD:EE:02", "dhcp1", "bound", "5s")
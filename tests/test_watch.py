@@ -0,0 +1,61 @@
+import threading
+import types
+
+import collector
+import tableparser
+import watch
+
+
+def arp(address, mac, status="reachable", item_id="*1"):
+    return tableparser.ArpEntry.from_attributes({".id": item_id, "address": address, "mac-address": mac,
+                                                 "interface": "bridge", "status": status})
+
+
+def test_diff_reports_added_changed_and_removed_entries():
+    previous = {("10.0.0.1", "bridge"): arp("10.0.0.1", "AA:00:00:00:00:01"),
+                ("10.0.0.2", "bridge"): arp("10.0.0.2", "AA:00:00:00:00:02")}
+    # Renumbered indexes alone are not a change
+    current = {("10.0.0.1", "bridge"): arp("10.0.0.1", "AA:00:00:00:00:01", item_id="*7"),
+               ("10.0.0.2", "bridge"): arp("10.0.0.2", "AA:00:00:00:00:09", status="stale"),
+               ("10.0.0.3", "bridge"): arp("10.0.0.3", "AA:00:00:00:00:03")}
+    events = watch.diff("arp", previous, current)
+    assert [(event, entry.address, changed) for event, entry, changed in events] == [
+        ("changed", "10.0.0.2", ["mac_address", "status"]),
+        ("added", "10.0.0.3", None),
+    ]
+    assert [(event, entry.address) for event, entry, _ in watch.diff("arp", current, previous)] == [
+        ("changed", "10.0.0.2"), ("removed", "10.0.0.3"),
+    ]
+
+
+def test_polled_table_is_diffed_across_prints_and_reconnects(monkeypatch):
+    first = [arp("10.0.0.1", "AA:00:00:00:00:01")]
+    second = first + [arp("10.0.0.2", "AA:00:00:00:00:02")]
+    third = [arp("10.0.0.2", "AA:00:00:00:00:02", status="stale")]
+    # Two prints, a dropped connection, then one print after reconnecting
+    prints = [first, second, None, third]
+    stop = threading.Event()
+    events = []
+
+    def fetch(session, table):
+        records = prints.pop(0)
+        if records is None:
+            raise OSError("Socket is closed")
+        if not prints:
+            stop.set()
+        return types.SimpleNamespace(err=""), iter(records)
+
+    monkeypatch.setattr(collector, "connect", lambda *args, **kwargs: object())
+    monkeypatch.setattr(collector, "close", lambda session, router_ip=None: None)
+    monkeypatch.setattr(collector, "fetch", fetch)
+    monkeypatch.setattr(watch, "emit", lambda router_ip, table, event, **fields: events.append((event, fields)))
+
+    watch.watch_router("10.0.0.9", "u", "p", "arp", "ssh", 0, stop)
+    assert [(event, fields.get("entry", {}).get("address"), fields.get("changed")) for event, fields in events] == [
+        ("initial", "10.0.0.1", None),
+        ("added", "10.0.0.2", None),
+        ("error", None, None),
+        ("changed", "10.0.0.2", ["status"]),
+        ("removed", "10.0.0.1", None),
+    ]
+    assert events[2][1]["message"] == "Socket is closed"
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+
+# Watch mode for the ARP and DHCP lease tables: keeps one session per router open and
+# writes only what changed, as JSON Lines. Over SSH the table is printed again every
+# interval on a new channel of the same transport and diffed against the last one. Over
+# the RouterOS API the router pushes changes itself through "listen" (the API's
+# print follow), so nothing is transferred while the table is quiet.
+#
+# Every line is one event:
+#   {"time": ..., "router": "10.0.0.1", "table": "arp", "event": "added", "entry": {...}}
+# "initial" events carry the table as first seen, then "added", "changed" (with the
+# names of the fields that changed), "removed" and "error" follow.
+
+import json
+import sys
+import threading
+import time
+
+import collector
+import routerosapi
+import tableparser
+
+# Fields that identify an entry across prints; indexes are renumbered by every print
+KEYS = {
+    "arp": ("address", "interface"),
+    "dhcp": ("mac_address", "server"),
+}
+# Fields left out of change detection because they change on every print
+IGNORED = {
+    "arp": ("index",),
+    "dhcp": ("index", "last_seen"),
+}
+# Longest wait between reconnect attempts after a router drops
+MAX_BACKOFF = 60
+
+output_lock = threading.Lock()
+
+
+def emit(router_ip, table, event, output=sys.stdout, **fields):
+    line = json.dumps(dict({"time": round(time.time(), 3), "router": router_ip, "table": table, "event": event}, **fields))
+    with output_lock:
+        output.write(line + "\n")
+        output.flush()
+
+
+def entry_key(table, entry):
+    return tuple(getattr(entry, field) for field in KEYS[table])
+
+
+def comparable(table, entry):
+    return {field: value for field, value in entry.as_dict().items() if field not in IGNORED[table]}
+
+
+def diff(table, previous, current):
+    # Compare two {key: entry} snapshots and return [(event, entry, changed fields)]
+    events = []
+    for key, entry in current.items():
+        old = previous.get(key)
+        if old is None:
+            events.append(("added", entry, None))
+            continue
+        before = comparable(table, old)
+        after = comparable(table, entry)
+        changed = [field for field in after if after[field] != before.get(field)]
+        if changed:
+            events.append(("changed", entry, changed))
+    for key, entry in previous.items():
+        if key not in current:
+            events.append(("removed", entry, None))
+    return events
+
+
+def emit_events(router_ip, table, events):
+    for event, entry, changed in events:
+        fields = {"entry": comparable(table, entry)}
+        if changed:
+            fields["changed"] = changed
+        emit(router_ip, table, event, **fields)
+
+
+def poll(session, table, report, interval, stop):
+    # Print the table every interval and report it to be diffed against the last print
+    while not stop.is_set():
+        stream, records = collector.fetch(session, table)
+        current = {entry_key(table, entry): entry for entry in records}
+        if stream.err:
+            raise RuntimeError(stream.err)
+        report(current)
+        stop.wait(interval)
+
+
+def cancel_on_stop(reply, stop):
+    # Cancel a listen once stop is set, or give up when the listen ends by itself
+    while not stop.wait(1):
+        if reply.exit_status is not None:
+            return
+    reply.cancel()
+
+
+def listen(session, router_ip, table, state, report, stop):
+    # Let the router push changes. Listening starts before the print of the current table
+    # so nothing that changes in between is missed; replaying those changes is harmless.
+    record_type = tableparser.TABLES[table][1]
+    path = routerosapi.TABLE_PATHS[table]
+    changes = session.request(path.rsplit("/", 1)[0] + "/listen", timeout=None)
+    try:
+        # .id -> key, because removals only carry the .id
+        keys = {}
+        current = {}
+        table_print = session.request(path)
+        for attributes in table_print:
+            entry = record_type.from_attributes(attributes)
+            keys[attributes.get(".id")] = entry_key(table, entry)
+            current[keys[attributes.get(".id")]] = entry
+        if table_print.err:
+            raise routerosapi.ApiError(table_print.err)
+        report(current)
+
+        threading.Thread(target=cancel_on_stop, args=(changes, stop), daemon=True).start()
+        for attributes in changes:
+            item_id = attributes.get(".id")
+            if attributes.get(".dead") == "true":
+                key = keys.pop(item_id, None)
+                if key in state:
+                    emit_events(router_ip, table, [("removed", state.pop(key), None)])
+                continue
+            entry = record_type.from_attributes(attributes)
+            key = entry_key(table, entry)
+            if keys.get(item_id, key) != key and keys[item_id] in state:
+                # The item's identifying fields changed: it is a different entry now
+                emit_events(router_ip, table, [("removed", state.pop(keys[item_id]), None)])
+            keys[item_id] = key
+            events = diff(table, {key: state[key]} if key in state else {}, {key: entry})
+            state[key] = entry
+            emit_events(router_ip, table, events)
+        if changes.err and not stop.is_set():
+            raise routerosapi.ApiError(changes.err)
+    finally:
+        if changes.exit_status is None:
+            changes.cancel()
+
+
+def watch_router(router_ip, username, password, table, transport, interval, stop, api_port=None):
+    # Watch one router until stop is set, reconnecting with backoff when it drops.
+    # The last known table survives reconnects, so changes made while away are reported.
+    state = {}
+    seen = False
+
+    def report(current):
+        # Emit the difference between the last known table and a full one, then keep it.
+        # The first table seen is reported as "initial" events.
+        nonlocal seen
+        if seen:
+            events = diff(table, state, current)
+        else:
+            events = [("initial", entry, None) for entry in current.values()]
+            seen = True
+        emit_events(router_ip, table, events)
+        state.clear()
+        state.update(current)
+
+    backoff = interval
+    while not stop.is_set():
+        session = None
+        try:
+            session = collector.connect(transport, router_ip, username, password, api_port)
+            backoff = interval
+            if isinstance(session, routerosapi.ApiSession):
+                listen(session, router_ip, table, state, report, stop)
+            else:
+                poll(session, table, report, interval, stop)
+        except Exception as ex:
+            emit(router_ip, table, "error", message=str(ex) or type(ex).__name__)
+            stop.wait(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+        finally:
+            collector.close(session, router_ip)
+
+
+def watch(routers, username, password, table, transport="ssh", interval=10, api_port=None):
+    # Watch every router on its own thread until interrupted
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=watch_router, args=(router_ip, username, password, table, transport, interval, stop, api_port), daemon=True)
+        for router_ip in routers
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)